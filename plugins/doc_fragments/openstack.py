@@ -95,6 +95,68 @@ options:
     type: str
     default: INFO
     choices: [INFO, DEBUG]
+  token_cache:
+    description:
+      - Cache the Keystone token and service catalog on disk and reuse them
+        in subsequent module invocations against the same cloud instead of
+        authenticating for every task.
+      - Cached tokens are renewed when they expire within five minutes plus
+        I(timeout) if I(wait) is enabled.
+      - Cache files are stored in I(cache_path) and are only readable by the
+        current user.
+    type: bool
+    default: no
+  cache_path:
+    description:
+      - Directory for data cached between module invocations.
+      - Defaults to C(~/.cache/ansible/openstack.cloud).
+    type: path
+  discovery_cache_ttl:
+    description:
+      - Time in seconds for which service discovery results, i.e. available
+        services, endpoint version documents, microversions and enabled
+        network extensions, are cached on disk in I(cache_path) and reused
+        by subsequent module invocations against the same cloud region.
+      - Results are always cached in memory during a module invocation.
+        C(0) disables the on-disk cache.
+    type: int
+    default: 0
+  max_concurrency:
+    description:
+      - Maximum number of API requests which are sent concurrently, for
+        example when a module adds many hosts to an aggregate or deletes
+        many objects at once.
+      - C(1) sends all requests one after another.
+    type: int
+    default: 4
+  report_api_metrics:
+    description:
+      - Return an C(openstack_metrics) dictionary with the module results.
+      - It contains the number of API requests per service, method and URL
+        template, the bytes sent and received, the 50th and 95th percentile
+        and maximum latency of requests, the time spent in each state and
+        sleeping while waiting for resources and the time spent waiting for
+        retries and I(rate_limit).
+    type: bool
+    default: no
+  api_retries:
+    description:
+      - How often API requests are retried when the cloud is overloaded.
+      - Requests answered with HTTP status 429 are always retried, GET, HEAD,
+        OPTIONS, PUT and DELETE requests also on HTTP status 502, 503 and
+        504.
+      - Retries honor C(Retry-After) response headers and otherwise wait
+        exponentially longer, up to one minute.
+    type: int
+    default: 3
+  rate_limit:
+    description:
+      - Maximum number of API requests per second which all modules running
+        on the same host send to the cloud.
+      - The budget is shared between module processes with a file in
+        I(cache_path).
+      - By default the request rate is not limited.
+    type: float
 requirements:
   - python >= 3.6
   - openstacksdk >= 0.99.0
@@ -53,13 +53,31 @@ options:
         default: false
     expand_hostvars:
         description: |
-            Run extra commands on each host to fill in additional
-            information about the host. May interrogate cinder and
-            neutron and can be expensive for people with many hosts.
+            Run extra commands to fill in additional information about
+            each host, e.g. the names of its flavor and image, its
+            security groups and volumes. Ports, floating ips, security
+            groups, flavors, images and volumes are listed once per cloud
+            and region and joined to the hosts, but listing them can still
+            be expensive in large clouds.
             (Note, the default value of this is opposite from the default
             old openstack.py inventory script's option expand_hostvars)
         type: bool
         default: false
+    fetch_mode:
+        description: |
+            How servers are fetched. C(full) lists servers with
+            openstacksdk, which normalizes every server. C(lean) takes
+            servers from Nova's detailed server list as they are and only
+            adds C(cloud), C(region), C(az), C(project_id), C(public_v4),
+            C(public_v6), C(private_v4) and C(interface_ip) to them, which
+            takes much less time for many servers. Floating ips which Nova
+            does not know of are not looked up and C(expand_hostvars) is
+            ignored in C(lean) mode.
+        type: str
+        choices:
+            - full
+            - lean
+        default: full
     private:
         description: |
             Use the private interface of each server, if it has one, as
@@ -75,6 +93,19 @@ options:
         type: list
         elements: str
         default: []
+    server_filters:
+        description: |
+            Only add servers which match all of these filters to the
+            inventory. The filters are passed to Nova, so servers which do
+            not match are neither transferred nor processed. Supported
+            filters are C(status), e.g. C(ACTIVE), C(name), a regular
+            expression, C(availability_zone), C(tags), a list of tags
+            which servers have all of, C(tags_any), a list of tags which
+            servers have at least one of, and C(projects), a list of
+            project IDs whose servers are listed. Listing servers of other
+            projects, as with C(all_projects), requires admin rights.
+        type: dict
+        default: {}
     fail_on_errors:
         description: |
             Causes the inventory to fail and return no hosts if one cloud
@@ -90,6 +121,128 @@ options:
             Lists servers from all projects
         type: bool
         default: false
+    cache_format:
+        description: |
+            Format of hosts in the inventory cache. C(json) stores hosts
+            as they are returned by openstacksdk. C(compact) stores each
+            distinct value of a host attribute, e.g. a flavor or image,
+            only once and compresses the hosts, which makes the cache
+            smaller and faster to load. Its hosts are decoded only when
+            they are used and share identical values. Caches in either
+            format can be read regardless of this option.
+        type: str
+        choices:
+            - json
+            - compact
+        default: json
+    max_workers:
+        description: |
+            Maximum number of clouds and regions from clouds.yaml whose
+            servers are fetched concurrently. Hosts are always returned
+            in the order of the clouds and regions in clouds.yaml,
+            regardless of which cloud answers first. Set to 1 to fetch
+            clouds one after another.
+        type: int
+        default: 4
+    shard_by_project:
+        description: |
+            With C(all_projects), list the servers of each project from
+            Keystone with a separate query and run up to C(max_workers)
+            queries of a cloud and region concurrently. Servers are merged
+            in the order of the projects and servers which several queries
+            returned are only added once. This speeds up listing clouds
+            whose servers are spread over few projects, while clouds with
+            many projects and few servers per project need more requests
+            than a single listing. Servers of projects which do not exist
+            in Keystone anymore are not listed. Nova only continues a
+            listing from servers it returned, so listings cannot be split
+            by other ranges. If projects cannot be listed, servers are
+            listed without sharding.
+        type: bool
+        default: false
+    incremental_refresh:
+        description: |
+            Refresh cached hosts with the servers which changed since the
+            last refresh instead of listing all servers again. Nova is
+            asked for servers which changed since then, including deleted
+            servers, and they are merged into the cached hosts. Requires
+            C(cache) to be enabled. Clouds and regions without cached
+            hosts, an expired cache and C(--flush-cache) list all servers.
+            Set C(cache_timeout) higher than C(incremental_refresh_interval)
+            or to 0, so the cached hosts outlive the refresh interval.
+        type: bool
+        default: false
+    incremental_refresh_interval:
+        description: |
+            Number of seconds after which cached hosts are refreshed when
+            C(incremental_refresh) is enabled. With the default of 0,
+            changed servers are fetched on every run. Not used with
+            C(cache_partitions), see C(cache_partition_timeouts).
+        type: int
+        default: 0
+    cache_partitions:
+        description: |
+            Cache the hosts of each cloud and region from clouds.yaml
+            separately. Only clouds and regions whose hosts have expired
+            are fetched, while hosts of the others are taken from the
+            cache. With C(incremental_refresh), expired clouds and regions
+            whose hosts are still cached only fetch changed servers.
+            Requires C(cache) to be enabled.
+        type: bool
+        default: false
+    cache_partition_timeouts:
+        description: |
+            Number of seconds after which the cached hosts of a cloud
+            expire with C(cache_partitions), by cloud name or by cloud
+            name and region joined with an underscore, e.g.
+            C(mycloud_RegionOne). Clouds and regions which are not listed
+            expire after C(cache_timeout). As with C(cache_timeout), 0
+            never expires. The cache plugin drops hosts after
+            C(cache_timeout) regardless, so set it higher than these
+            timeouts or to 0.
+        type: dict
+        default: {}
+    stale_while_revalidate:
+        description: |
+            Return cached hosts which are older than C(cache_timeout),
+            C(incremental_refresh_interval) or C(cache_partition_timeouts)
+            right away and refresh them in a detached C(ansible-inventory)
+            process. Further runs read the refreshed hosts once it has
+            replaced the cache. Only one refresh is started at a time.
+            Requires C(cache) to be enabled with a persistent cache plugin
+            such as C(jsonfile).
+        type: bool
+        default: false
+    max_staleness:
+        description: |
+            Number of seconds after which cached hosts are too old to be
+            returned with C(stale_while_revalidate) and are refreshed
+            before the inventory is returned. Replaces C(cache_timeout) as
+            the timeout of the cache plugin. With the default of 0,
+            cached hosts are returned regardless of their age.
+        type: int
+        default: 0
+    cache_lock_timeout:
+        description: |
+            Number of seconds to wait for another process which is
+            refreshing the same cache. When several processes find the
+            cache expired at the same time, only the first one fetches
+            hosts while the others wait and then read its hosts from the
+            cache. Processes which have waited longer fetch hosts
+            themselves. The lock is a file in C(cache_connection), if it
+            is a directory, or in the temporary directory and only works
+            among processes on the same host. Set to 0 to not wait.
+        type: int
+        default: 300
+    timings_file:
+        description: |
+            Append how long the steps of each run took to this file, as
+            one line of JSON per run. Lists the time to read and write the
+            cache, to fetch the hosts of each cloud and region, including
+            the requests and bytes they took, to normalize them and to add
+            them to the inventory. The same timings are shown with
+            C(-vvvv).
+        type: str
     clouds_yaml_path:
         description: |
             Override path to clouds.yaml file. If this value is given it
@@ -113,6 +266,17 @@ options:
         description: Automatically create groups from host variables.
         type: bool
         default: true
+    hostvar_fields:
+        description: |
+            Fields of servers to keep in the C(openstack) host variable,
+            as dotted paths such as C(id), C(status) or C(flavor.name).
+            By default all fields are kept. Fields which a server does not
+            have are left out. Legacy groups are created from all fields,
+            while C(compose), C(groups) and C(keyed_groups) only see the
+            kept fields.
+        type: list
+        elements: str
+        default: []
 
 extends_documentation_fragment:
 - inventory_cache
@@ -127,11 +291,57 @@ plugin: openstack.cloud.openstack
 expand_hostvars: yes
 fail_on_errors: yes
 all_projects: yes
+
+# Fetch only servers which changed since the previous refresh, at most
+# once a minute, and list all servers again when the cache has not been
+# refreshed for a day
+plugin: openstack.cloud.openstack
+cache: yes
+cache_plugin: jsonfile
+cache_connection: ~/.cache/ansible-openstack
+cache_timeout: 86400
+incremental_refresh: yes
+incremental_refresh_interval: 60
+
+# Cache hosts of each cloud and region separately and fetch the hosts of
+# the slow cloud at most every hour and of the others every 5 minutes
+plugin: openstack.cloud.openstack
+cache: yes
+cache_plugin: jsonfile
+cache_connection: ~/.cache/ansible-openstack
+cache_timeout: 0
+cache_partitions: yes
+cache_partition_timeouts:
+  slowcloud: 3600
+  mycloud_RegionOne: 300
+  mycloud_RegionTwo: 300
+
+# Return cached hosts older than 5 minutes right away and refresh them in
+# the background, unless they are older than an hour
+plugin: openstack.cloud.openstack
+cache: yes
+cache_plugin: jsonfile
+cache_connection: ~/.cache/ansible-openstack
+cache_timeout: 300
+stale_while_revalidate: yes
+max_staleness: 3600
 '''
 
+import base64
 import collections
+import concurrent.futures
+import contextlib
+import fcntl
+import json
+import os
+import re
+import subprocess
 import sys
+import tempfile
+import threading
 import logging
+import time
+import zlib
 
 from ansible.errors import AnsibleParserError
 from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
@@ -145,19 +355,188 @@ try:
     import importlib
     sdk = importlib.import_module('openstack')
     sdk_inventory = importlib.import_module('openstack.cloud.inventory')
+    sdk_meta = importlib.import_module('openstack.cloud.meta')
     client_config = importlib.import_module('openstack.config.loader')
     sdk_exceptions = importlib.import_module("openstack.exceptions")
+    sdk_utils = importlib.import_module('openstack.utils')
     HAS_SDK = True
 except ImportError:
     display.vvvv("Couldn't import Openstack SDK modules")
     HAS_SDK = False
 
 
+class CompactHosts(object):
+    ''' Hosts of a compact inventory cache entry, decoded when used. '''
+
+    FORMAT = 'openstack-compact-1'
+
+    def __init__(self, entry):
+        self._entry = entry
+        self._payload = None
+
+    @classmethod
+    def encode(cls, hosts):
+        # Each distinct value is stored once and hosts refer to values by
+        # their index, which removes repeated flavors, images, metadata
+        # and the like before the payload is compressed
+        keys = []
+        key_index = {}
+        values = []
+        value_index = {}
+        rows = []
+        for host in hosts:
+            row = []
+            for key, value in host.items():
+                if key not in key_index:
+                    key_index[key] = len(keys)
+                    keys.append(key)
+                if value is None or isinstance(
+                        value, (str, int, float, bool)):
+                    identity = (type(value), value)
+                    encoded = None
+                else:
+                    identity = encoded = json.dumps(
+                        value, sort_keys=True, default=str)
+                if identity not in value_index:
+                    value_index[identity] = len(values)
+                    values.append(encoded or json.dumps(value))
+                row.append(key_index[key])
+                row.append(value_index[identity])
+            rows.append(row)
+        payload = '{"keys": %s, "values": [%s], "rows": %s}' % (
+            json.dumps(keys), ', '.join(values), json.dumps(rows))
+        return dict(
+            format=cls.FORMAT, count=len(rows),
+            data=base64.b64encode(
+                zlib.compress(payload.encode('utf-8'))).decode('ascii'))
+
+    @classmethod
+    def is_compact(cls, entry):
+        return isinstance(entry, dict) and entry.get('format') == cls.FORMAT
+
+    def _load(self):
+        if self._payload is None:
+            self._payload = json.loads(zlib.decompress(
+                base64.b64decode(self._entry['data'])).decode('utf-8'))
+        return self._payload
+
+    def _host(self, row):
+        keys = self._payload['keys']
+        values = self._payload['values']
+        return dict(zip(map(keys.__getitem__, row[::2]),
+                        map(values.__getitem__, row[1::2])))
+
+    def __len__(self):
+        return self._entry['count']
+
+    def __iter__(self):
+        for row in self._load()['rows']:
+            yield self._host(row)
+
+    def __getitem__(self, index):
+        return self._host(self._load()['rows'][index])
+
+
+class InventoryTimings(object):
+    ''' Durations of the steps of an inventory run. '''
+
+    def __init__(self, enabled=False):
+        # Requests and bytes are only counted when enabled
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.steps = collections.OrderedDict()
+        self.regions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _region(self, key):
+        with self._lock:
+            return self.regions.setdefault(key, collections.OrderedDict())
+
+    @contextlib.contextmanager
+    def measure(self, step, key=None):
+        # Steps which are measured more than once add up
+        steps = self._region(key) if key else self.steps
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                steps[step] = steps.get(step, 0.0) + elapsed
+
+    def count(self, key, name, value):
+        region = self._region(key)
+        with self._lock:
+            region[name] = region.get(name, 0) + value
+
+    @contextlib.contextmanager
+    def count_requests(self, cloud, key):
+        # Responses of the cloud's requests session are counted while its
+        # servers are fetched, including those of expanding them
+        if not self.enabled:
+            yield
+            return
+        hooks = cloud.session.session.hooks['response']
+
+        def count_response(response, *args, **kwargs):
+            self.count(key, 'requests', 1)
+            self.count(key, 'bytes', len(response.content or b''))
+
+        hooks.append(count_response)
+        try:
+            yield
+        finally:
+            hooks.remove(count_response)
+
+    def as_dict(self):
+        return dict(started_at=self.started_at, steps=self.steps,
+                    regions=self.regions)
+
+    def summary(self):
+        lines = ['Inventory timings: %s' % ', '.join(
+            '%s %.3fs' % (step.replace('_', ' '), elapsed)
+            for step, elapsed in self.steps.items())]
+        for key, region in self.regions.items():
+            lines.append('Timings of %s: %s' % (key, ', '.join(
+                '%s %s' % (name, '%.3fs' % value if isinstance(value, float)
+                           else value)
+                for name, value in region.items())))
+        return lines
+
+
 class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
     ''' Host inventory provider for ansible using OpenStack clouds. '''
 
     NAME = 'openstack.cloud.openstack'
 
+    # Seconds which are subtracted from the last sync time when asking Nova
+    # for changed servers
+    CHANGES_SINCE_MARGIN = 60
+
+    # Set for ansible-inventory processes which refresh stale cached hosts
+    # in the background
+    REVALIDATE_ENV = 'ANSIBLE_OPENSTACK_INVENTORY_REVALIDATE'
+
+    # Seconds after which a background refresh which has not updated the
+    # cache is considered failed and started again
+    REVALIDATE_TIMEOUT = 600
+
+    # Microversion of Nova which returns the flavor of servers with its
+    # name instead of a link, if the cloud supports it
+    LEAN_MICROVERSION = '2.47'
+
+    # Seconds between attempts to take the lock of a cache which another
+    # process is refreshing
+    CACHE_LOCK_INTERVAL = 0.2
+
+    # Fields of servers whose values many servers have in common and which
+    # are shared between host variables
+    SHARED_HOSTVAR_KEYS = ('flavor', 'image', 'security_groups')
+
+    def __init__(self):
+        super(InventoryModule, self).__init__()
+        self._timings = InventoryTimings()
+
     def parse(self, inventory, loader, path, cache=True):
 
         super(InventoryModule, self).parse(inventory, loader, path)
@@ -188,6 +567,20 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
             )
             self._config_data = {}
 
+        timings_file = self._config_data.get('timings_file')
+        self._timings = InventoryTimings(
+            enabled=self.display.verbosity > 3 or bool(timings_file))
+        self._cache_timeout = self.get_option('cache_timeout')
+        stale_while_revalidate = (
+            self.get_option('cache')
+            and self._config_data.get('stale_while_revalidate', False))
+        if stale_while_revalidate:
+            # The cache plugin keeps hosts until they are too stale while
+            # cache_timeout decides when they are refreshed
+            self.set_option('cache_timeout',
+                            self._config_data.get('max_staleness', 0))
+            self.load_cache_plugin()
+
         # update cache if the user has caching enabled and the cache is being refreshed
         # will update variable below in the case of an expired cache
         cache_needs_update = not cache and self.get_option('cache')
@@ -195,156 +588,892 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
         if cache:
             cache = self.get_option('cache')
         source_data = None
-        if cache:
+        synced_at = {}
+        partitioned = (self.get_option('cache')
+                       and self._config_data.get('cache_partitions', False))
+        if cache and not partitioned:
             self.display.vvvv("Reading inventory data from cache: %s" % cache_key)
             try:
-                source_data = self._cache[cache_key]
+                with self._timings.measure('cache_read'):
+                    source_data, synced_at = self._read_cache_entry(
+                        self._cache[cache_key])
             except KeyError:
                 # cache expired or doesn't exist yet
                 display.vvvv("Inventory data cache not found")
                 cache_needs_update = True
 
-        if not source_data:
-            self.display.vvvv("Getting hosts from Openstack clouds")
-            clouds_yaml_path = self._config_data.get('clouds_yaml_path')
-            if clouds_yaml_path:
-                config_files = (
-                    clouds_yaml_path
-                    + client_config.CONFIG_FILES
-                )
+        incremental = (self.get_option('cache')
+                       and self._config_data.get('incremental_refresh', False))
+        revalidate = (stale_while_revalidate
+                      and not os.environ.get(self.REVALIDATE_ENV))
+        cached_hosts = None
+        if source_data and (incremental or stale_while_revalidate):
+            if incremental:
+                stale = self._needs_refresh(synced_at)
             else:
-                config_files = None
+                stale = self._is_expired(synced_at)
+            if stale and revalidate:
+                display.vvvv("Refreshing stale inventory data cache in the "
+                             "background")
+                # The background refresh writes the hosts
+                del self._cache[cache_key]
+                self._revalidate(path, cache_key, min(synced_at.values())
+                                 if synced_at else 0)
+            elif stale:
+                display.vvvv("Refreshing inventory data cache")
+                if incremental:
+                    cached_hosts = source_data
+                source_data = None
+                cache_needs_update = True
 
-            # Redict logging to stderr so it does not mix with output
-            # particular ansible-inventory JSON output
-            # TODO(mordred) Integrate openstack's logging with ansible's logging
-            if self.display.verbosity > 3:
-                sdk.enable_logging(debug=True, stream=sys.stderr)
-            else:
-                sdk.enable_logging(stream=sys.stderr)
+        self.use_names = self._config_data.get('use_names', False)
+        # Fail on invalid filters once instead of for each cloud
+        self._get_server_filters()
+        if partitioned:
+            source_data = self._fetch_partitions(
+                path, cache_key, cache, incremental, revalidate)
+        elif not source_data:
+            with self._refresh_lock(cache_key, cache_needs_update) as waited:
+                if waited and cache:
+                    source_data, synced_at = self._read_refreshed_cache(
+                        cache_key, synced_at,
+                        incremental or stale_while_revalidate)
+                if not source_data:
+                    source_data = self._refresh_hosts(
+                        cache_key, cached_hosts, synced_at,
+                        cache_needs_update,
+                        incremental or stale_while_revalidate)
+
+        with self._timings.measure('populate'):
+            self._populate_from_source(source_data)
+        self._report_timings(path, timings_file)
+
+    def _report_timings(self, path, timings_file):
+        for line in self._timings.summary():
+            self.display.vvvv(line)
+        if not timings_file:
+            return
+        timings = dict(self._timings.as_dict(), path=path,
+                       hosts=len(self.inventory.hosts))
+        try:
+            with open(os.path.expanduser(timings_file), 'a') as f:
+                f.write(json.dumps(timings) + '\n')
+        except (IOError, OSError) as e:
+            self.display.warning("Couldn't write inventory timings to %s: %s"
+                                 % (timings_file, e))
+
+    def _refresh_hosts(self, cache_key, cached_hosts, synced_at,
+                       cache_needs_update, with_synced_at):
+        # Config errors fail the inventory without writing the cache
+        clouds = self._get_clouds()
+        source_data = []
+        try:
+            source_data, synced_at = self._fetch_hosts(
+                clouds, cached_hosts=cached_hosts, synced_at=synced_at,
+                **self._get_fetch_options())
+        except Exception as e:
+            self.display.warning("Couldn't list Openstack hosts. "
+                                 "See logs for details")
+            os_logger.error(str(e))
+        finally:
+            if cache_needs_update:
+                # Processes waiting for the lock read the hosts once it is
+                # released, so they are written now instead of after parse
+                with self._timings.measure('cache_write'):
+                    self._cache[cache_key] = self._make_cache_entry(
+                        source_data, synced_at, with_synced_at)
+                    self.update_cache_if_changed()
+        return source_data
 
+    @contextlib.contextmanager
+    def _refresh_lock(self, cache_key, enabled=True):
+        # Yields whether another process held the lock, i.e. may have
+        # refreshed the cache meanwhile. The lock is released when the
+        # file is closed, also if this process dies.
+        timeout = self._config_data.get('cache_lock_timeout', 300)
+        if not enabled or not timeout:
+            yield False
+            return
+        directory = self.get_option('cache_connection')
+        if not directory or not os.path.isdir(os.path.expanduser(directory)):
+            directory = tempfile.gettempdir()
+        # jsonfile and similar cache plugins ignore files starting with a dot
+        path = os.path.join(os.path.expanduser(directory),
+                            '.%s.lock' % cache_key)
+        try:
+            lock_file = open(path, 'a')
+        except (IOError, OSError) as e:
+            self.display.vvvv("Couldn't open inventory cache lock %s: %s" % (
+                path, e))
+            yield False
+            return
+        try:
+            waited = False
+            deadline = time.time() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    pass
+                if not waited:
+                    display.vvvv("Waiting for another process refreshing the "
+                                 "inventory data cache")
+                    waited = True
+                if time.time() >= deadline:
+                    self.display.warning(
+                        "Timed out waiting for another process refreshing "
+                        "the inventory data cache, refreshing it as well")
+                    break
+                time.sleep(self.CACHE_LOCK_INTERVAL)
+            yield waited
+        finally:
+            lock_file.close()
+
+    def _load_refreshed_cache(self):
+        # Cache plugins keep entries which they have read in memory, so
+        # entries which another process has written are read with a new
+        # instance of the cache plugin
+        cache = self._cache
+        self.load_cache_plugin()
+        refreshed, self._cache = self._cache, cache
+        return refreshed
+
+    def _read_refreshed_cache(self, cache_key, synced_at, with_synced_at):
+        try:
+            with self._timings.measure('cache_read'):
+                source_data, new_synced_at = self._read_cache_entry(
+                    self._load_refreshed_cache()[cache_key])
+        except KeyError:
+            return None, synced_at
+        # Entries with sync times are only refreshed if they changed,
+        # otherwise the other process failed to refresh them
+        if with_synced_at and new_synced_at == synced_at:
+            return None, synced_at
+        display.vvvv("Read inventory data cache refreshed by another process")
+        return source_data, new_synced_at
+
+    def _get_clouds(self):
+        self.display.vvvv("Getting hosts from Openstack clouds")
+        clouds_yaml_path = self._config_data.get('clouds_yaml_path')
+        if clouds_yaml_path:
+            config_files = (
+                clouds_yaml_path
+                + client_config.CONFIG_FILES
+            )
+        else:
+            config_files = None
+
+        # Redict logging to stderr so it does not mix with output
+        # particular ansible-inventory JSON output
+        # TODO(mordred) Integrate openstack's logging with ansible's logging
+        if self.display.verbosity > 3:
+            sdk.enable_logging(debug=True, stream=sys.stderr)
+        else:
+            sdk.enable_logging(stream=sys.stderr)
+
+        with self._timings.measure('load_clouds'):
             cloud_inventory = sdk_inventory.OpenStackInventory(
                 config_files=config_files,
                 private=self._config_data.get('private', False))
-            self.display.vvvv("Found %d cloud(s) in Openstack" %
-                              len(cloud_inventory.clouds))
-            only_clouds = self._config_data.get('only_clouds', [])
-            if only_clouds and not isinstance(only_clouds, list):
-                raise ValueError(
-                    'OpenStack Inventory Config Error: only_clouds must be'
-                    ' a list')
-            if only_clouds:
-                new_clouds = []
-                for cloud in cloud_inventory.clouds:
-                    self.display.vvvv("Looking at cloud : %s" % cloud.name)
-                    if cloud.name in only_clouds:
-                        self.display.vvvv("Selecting cloud : %s" % cloud.name)
-                        new_clouds.append(cloud)
-                cloud_inventory.clouds = new_clouds
-
-            self.display.vvvv("Selected %d cloud(s)" %
-                              len(cloud_inventory.clouds))
-
-            expand_hostvars = self._config_data.get('expand_hostvars', False)
-            fail_on_errors = self._config_data.get('fail_on_errors', False)
-            all_projects = self._config_data.get('all_projects', False)
-            self.use_names = self._config_data.get('use_names', False)
-
-            source_data = []
+        self.display.vvvv("Found %d cloud(s) in Openstack" %
+                          len(cloud_inventory.clouds))
+        only_clouds = self._config_data.get('only_clouds', [])
+        if only_clouds and not isinstance(only_clouds, list):
+            raise ValueError(
+                'OpenStack Inventory Config Error: only_clouds must be'
+                ' a list')
+        if only_clouds:
+            new_clouds = []
+            for cloud in cloud_inventory.clouds:
+                self.display.vvvv("Looking at cloud : %s" % cloud.name)
+                if cloud.name in only_clouds:
+                    self.display.vvvv("Selecting cloud : %s" % cloud.name)
+                    new_clouds.append(cloud)
+            cloud_inventory.clouds = new_clouds
+
+        self.display.vvvv("Selected %d cloud(s)" %
+                          len(cloud_inventory.clouds))
+        return cloud_inventory.clouds
+
+    def _get_fetch_options(self):
+        return dict(
+            expand=self._config_data.get('expand_hostvars', False),
+            fail_on_errors=self._config_data.get('fail_on_errors', False),
+            all_projects=self._config_data.get('all_projects', False))
+
+    def _fetch_partitions(self, path, cache_key, cache, incremental,
+                          revalidate=False):
+        # Hosts of each cloud and region are cached under their own key
+        # with their sync time, so only expired partitions are fetched
+        clouds = self._get_clouds()
+        keys = [self._region_key(cloud.name,
+                                 cloud.config.get_region_name('compute'))
+                for cloud in clouds]
+        partitions = {}
+        synced_at = {}
+        expired = []
+        for cloud, key in zip(clouds, keys):
+            partition_key = '%s_%s' % (cache_key, key)
+            if cache:
+                try:
+                    with self._timings.measure('cache_read'):
+                        hosts, synced = self._read_cache_entry(
+                            self._cache[partition_key])
+                except KeyError:
+                    display.vvvv("Inventory data cache of %s not found" % key)
+                else:
+                    # Partitions which are not fetched again are not
+                    # written back, which keeps their sync time
+                    del self._cache[partition_key]
+                    if key in synced:
+                        partitions[key] = hosts
+                        synced_at[key] = synced[key]
+            if key not in synced_at or self._partition_expired(
+                    cloud.name, key, synced_at[key]):
+                display.vvvv("Getting hosts of %s" % key)
+                expired.append((cloud, key))
+        stale = [(cloud, key) for cloud, key in expired if key in partitions]
+        if stale and revalidate:
+            # Cached hosts of expired partitions are served until the
+            # background refresh has fetched them
+            self._revalidate(path, cache_key,
+                             min(synced_at[key] for cloud, key in stale))
+            expired = [(cloud, key) for cloud, key in expired
+                       if key not in partitions]
+        if not expired:
+            return [host for key in keys for host in partitions[key]]
+
+        with self._refresh_lock(cache_key) as waited:
+            if waited and cache:
+                expired = self._read_refreshed_partitions(
+                    cache_key, expired, partitions, synced_at)
+            if expired:
+                self._refresh_partitions(cache_key, expired, partitions,
+                                         synced_at, incremental)
+        return [host for key in keys for host in partitions.get(key, [])]
+
+    def _read_refreshed_partitions(self, cache_key, expired, partitions,
+                                   synced_at):
+        # Returns the expired partitions which another process has not
+        # refreshed while this one waited for the lock
+        refreshed = self._load_refreshed_cache()
+        still_expired = []
+        for cloud, key in expired:
+            try:
+                with self._timings.measure('cache_read'):
+                    hosts, synced = self._read_cache_entry(
+                        refreshed['%s_%s' % (cache_key, key)])
+            except KeyError:
+                synced = {}
+            if key not in synced or synced[key] == synced_at.get(key):
+                still_expired.append((cloud, key))
+                continue
+            display.vvvv("Read hosts of %s refreshed by another process" % key)
+            partitions[key] = hosts
+            synced_at[key] = synced[key]
+        return still_expired
+
+    def _refresh_partitions(self, cache_key, expired, partitions, synced_at,
+                            incremental):
+        cached_hosts = None
+        if incremental:
+            cached_hosts = [host for cloud, key in expired
+                            for host in partitions.get(key, [])]
+        hosts, new_synced_at = self._fetch_hosts(
+            [cloud for cloud, key in expired],
+            cached_hosts=cached_hosts, synced_at=synced_at,
+            **self._get_fetch_options())
+        fetched = collections.defaultdict(list)
+        for host in hosts:
+            fetched[self._region_key(host['cloud'],
+                                     host['region'])].append(host)
+        with self._timings.measure('cache_write'):
+            for key, now in new_synced_at.items():
+                # Partitions of clouds which failed keep their cached hosts
+                if now == synced_at.get(key):
+                    continue
+                partitions[key] = fetched[key]
+                self._cache['%s_%s' % (cache_key, key)] = \
+                    self._make_cache_entry(fetched[key], {key: now}, True)
+            # Write the partitions before the lock is released
+            self.update_cache_if_changed()
+
+    def _partition_expired(self, cloud_name, key, synced_at):
+        timeouts = self._config_data.get('cache_partition_timeouts') or {}
+        timeout = timeouts.get(key, timeouts.get(
+            cloud_name, self._cache_timeout))
+        # Like cache_timeout, a timeout of 0 never expires
+        return timeout and time.time() - synced_at >= timeout
+
+    def _is_expired(self, synced_at):
+        # Caches written without stale_while_revalidate have no sync time
+        return not synced_at or (
+            self._cache_timeout
+            and time.time() - min(synced_at.values()) >= self._cache_timeout)
+
+    def _revalidate(self, path, cache_key, synced_at):
+        # Refreshes run in a detached ansible-inventory process, so this
+        # process returns the stale hosts right away. Cache plugins write
+        # to a temporary file which replaces the cache, so other processes
+        # read either the stale or the refreshed hosts.
+        marker = '%s_revalidating' % cache_key
+        started = self._cache.get(marker)
+        if (started and started > synced_at
+                and time.time() - started < self.REVALIDATE_TIMEOUT):
+            display.vvvv("Inventory data cache is being refreshed already")
+            return
+        executable = os.path.join(os.path.dirname(sys.argv[0]),
+                                  'ansible-inventory')
+        if not os.path.exists(executable):
+            executable = 'ansible-inventory'
+        try:
+            subprocess.Popen(
+                [executable, '-i', path, '--list'],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, close_fds=True,
+                start_new_session=True,
+                env=dict(os.environ, **{self.REVALIDATE_ENV: '1'}))
+        except OSError as e:
+            self.display.warning("Couldn't refresh the inventory data cache "
+                                 "in the background: %s" % e)
+            return
+        self._cache[marker] = time.time()
+
+    def _make_cache_entry(self, source_data, synced_at, with_synced_at):
+        if self._config_data.get('cache_format', 'json') == 'compact':
+            entry = CompactHosts.encode(source_data)
+        elif with_synced_at:
+            entry = dict(source_data=source_data)
+        else:
+            return source_data
+        if with_synced_at:
+            entry['synced_at'] = synced_at
+        return entry
+
+    def _read_cache_entry(self, entry):
+        # Caches written with incremental_refresh, cache_partitions or
+        # stale_while_revalidate store when each cloud and region has been
+        # synced next to the hosts
+        if CompactHosts.is_compact(entry):
+            return CompactHosts(entry), entry.get('synced_at') or {}
+        if isinstance(entry, dict):
+            return entry.get('source_data'), entry.get('synced_at') or {}
+        return entry, {}
+
+    def _needs_refresh(self, synced_at):
+        interval = self._config_data.get('incremental_refresh_interval', 0)
+        return (not synced_at
+                or time.time() - min(synced_at.values()) >= interval)
+
+    def _region_key(self, cloud_name, region_name):
+        return "%s_%s" % (cloud_name, region_name)
+
+    def _fetch_hosts(self, clouds, expand, fail_on_errors, all_projects,
+                     cached_hosts=None, synced_at=None):
+        # Clouds and regions are independent connections, so they can be
+        # listed concurrently. Results are merged in the order of clouds
+        # to keep the inventory stable between runs.
+        #
+        # Clouds and regions with cached hosts and a sync time only return
+        # servers which changed since then, which are merged into their
+        # cached hosts.
+        synced_at = synced_at or {}
+        cached = collections.defaultdict(list)
+        for server in cached_hosts or []:
+            cached[self._region_key(
+                server['cloud'], server['region'])].append(server)
+        keys = [self._region_key(cloud.name,
+                                 cloud.config.get_region_name('compute'))
+                for cloud in clouds]
+
+        max_workers = max(1, min(self._config_data.get('max_workers', 4),
+                                 len(clouds)))
+        now = time.time()
+        with self._timings.measure('fetch'), \
+                concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [
+                executor.submit(self._fetch_region, cloud, key, expand,
+                                all_projects,
+                                since=synced_at.get(key)
+                                if cached_hosts is not None else None)
+                for cloud, key in zip(clouds, keys)]
+
+        hosts = []
+        new_synced_at = {}
+        for cloud, key, future in zip(clouds, keys, futures):
             try:
-                source_data = cloud_inventory.list_hosts(
-                    expand=expand_hostvars, fail_on_cloud_config=fail_on_errors,
-                    all_projects=all_projects)
+                servers = future.result()
             except Exception as e:
-                self.display.warning("Couldn't list Openstack hosts. "
-                                     "See logs for details")
-                os_logger.error(e.message)
-            finally:
-                if cache_needs_update:
-                    self._cache[cache_key] = source_data
+                # Errors such as bad credentials or unreachable clouds are
+                # raised by keystoneauth as well, not only by openstacksdk
+                if fail_on_errors:
+                    raise
+                self.display.warning(
+                    "Couldn't list hosts of cloud %s in region %s: %s" % (
+                        cloud.name, cloud.config.region_name, e))
+                # Keep cached hosts until the cloud can be reached again
+                hosts.extend(cached[key])
+                if key in synced_at:
+                    new_synced_at[key] = synced_at[key]
+                continue
+            if cached_hosts is not None and key in synced_at:
+                servers = self._merge_changes(cached[key], servers)
+            hosts.extend(servers)
+            new_synced_at[key] = now
+        return hosts, new_synced_at
+
+    def _fetch_region(self, cloud, key, *args, **kwargs):
+        with self._timings.measure('fetch', key), \
+                self._timings.count_requests(cloud, key):
+            servers = self._list_servers(cloud, *args, **kwargs)
+        self._timings.count(key, 'servers', len(servers))
+        return servers
+
+    def _list_servers(self, cloud, expand, all_projects, since=None):
+        server_filters = self._get_server_filters()
+        all_projects = all_projects or bool(server_filters.get('projects'))
+        lean = self._config_data.get('fetch_mode', 'full') == 'lean'
+        key = self._region_key(cloud.name,
+                               cloud.config.get_region_name('compute'))
+        if since is None:
+            queries = self._get_server_queries(server_filters)
+            if (all_projects and self._config_data.get('shard_by_project')
+                    and not server_filters.get('projects')):
+                queries = self._get_project_queries(cloud, queries[0])
+            if lean:
+                servers = self._list_shards(queries, lambda query: list(
+                    self._list_raw_servers(cloud, all_projects, query)))
+                with self._timings.measure('normalize', key):
+                    return [self._make_lean_host(cloud, server)
+                            for server in servers]
+            # openstacksdk adds interfaces and details to each server with
+            # several requests per server, so list the resources which it
+            # needs once and join them to the servers instead
+            if len(queries) > 1 or queries[0]:
+                # Older releases of list_servers() filter the full list of
+                # servers which they cache, so pass filters to Nova directly
+                servers = self._list_shards(
+                    queries, lambda query: list(cloud.compute.servers(
+                        all_projects=all_projects, **query)))
+            else:
+                servers = cloud.list_servers(all_projects=all_projects,
+                                             bare=True)
+            with self._timings.measure('normalize', key):
+                return self._expand_servers(cloud, servers, expand)
+        # The margin accounts for clock differences between this host and
+        # Nova, servers which are returned again are simply merged again.
+        changes_since = time.strftime(
+            '%Y-%m-%dT%H:%M:%SZ',
+            time.gmtime(since - self.CHANGES_SINCE_MARGIN))
+        changes = []
+        for query in self._get_server_queries(server_filters, mutable=False):
+            query['changes-since'] = changes_since
+            if lean:
+                servers = list(self._list_raw_servers(
+                    cloud, all_projects, query))
+                with self._timings.measure('normalize', key):
+                    changes.extend(self._make_lean_host(cloud, server)
+                                   for server in servers)
+            else:
+                servers = list(cloud.compute.servers(
+                    all_projects=all_projects, **query))
+                # Changed servers are expanded like listed servers, so
+                # both are merged into cached hosts with the same fields
+                with self._timings.measure('normalize', key):
+                    changes.extend(
+                        self._expand_servers(cloud, servers, expand))
+        # Changed servers which no longer match the filters are removed
+        # from the cached hosts like deleted servers
+        for server in changes:
+            if not self._matches_server_filters(server, server_filters):
+                server['status'] = 'DELETED'
+        return changes
+
+    def _list_raw_servers(self, cloud, all_projects, query):
+        # Servers are yielded page by page as Nova returns them, without
+        # creating openstacksdk resources for them
+        params = dict(query)
+        if all_projects:
+            params['all_tenants'] = True
+        microversion = sdk_utils.maximum_supported_microversion(
+            cloud.compute, self.LEAN_MICROVERSION)
+        url = '/servers/detail'
+        while url:
+            response = cloud.compute.get(url, params=params,
+                                         microversion=microversion)
+            sdk_exceptions.raise_from_response(response)
+            data = response.json()
+            for server in data['servers']:
+                yield server
+            # Links to the next page contain the query already
+            url = params = None
+            for link in data.get('servers_links', []):
+                if link['rel'] == 'next':
+                    url = link['href']
+
+    def _make_lean_host(self, cloud, server):
+        server['cloud'] = cloud.name
+        server['region'] = cloud.config.get_region_name('compute')
+        server['az'] = server.get('OS-EXT-AZ:availability_zone')
+        server['project_id'] = server.get('tenant_id')
+        self._add_server_interfaces(cloud, server)
+        return server
+
+    def _get_server_filters(self):
+        server_filters = self._config_data.get('server_filters') or {}
+        unknown = set(server_filters) - set([
+            'status', 'name', 'availability_zone', 'tags', 'tags_any',
+            'projects'])
+        if unknown:
+            raise ValueError(
+                'OpenStack Inventory Config Error: unknown server_filters'
+                ' %s' % ', '.join(sorted(unknown)))
+        for key in ('tags', 'tags_any', 'projects'):
+            if not isinstance(server_filters.get(key) or [], list):
+                raise ValueError(
+                    'OpenStack Inventory Config Error: server_filters %s'
+                    ' must be a list' % key)
+        return server_filters
 
-        self._populate_from_source(source_data)
+    def _get_server_queries(self, server_filters, mutable=True):
+        # Nova only filters by a single project, so servers of several
+        # projects are listed with one query per project. Filters on
+        # attributes which change are left out of queries for changed
+        # servers, which would miss servers that stopped matching.
+        query = {}
+        if mutable:
+            for key in ('status', 'name', 'availability_zone'):
+                if server_filters.get(key):
+                    query[key] = server_filters[key]
+            for key, param in (('tags', 'tags'), ('tags_any', 'tags-any')):
+                if server_filters.get(key):
+                    query[param] = ','.join(server_filters[key])
+        return [dict(query, project_id=project_id)
+                for project_id in server_filters.get('projects') or []] or [
+                    query]
+
+    def _get_project_queries(self, cloud, query):
+        projects = self._list_resources(cloud, cloud.identity.projects)
+        return [dict(query, project_id=project['id'])
+                for project in projects] or [query]
+
+    def _list_shards(self, queries, list_query):
+        # Queries of a cloud share its connection and run concurrently
+        # like clouds in _fetch_hosts()
+        if len(queries) == 1:
+            return list_query(queries[0])
+        max_workers = max(1, min(self._config_data.get('max_workers', 4),
+                                 len(queries)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            shards = list(executor.map(list_query, queries))
+        # Servers move between projects, so a server may be returned by
+        # two queries which ran at different times
+        servers = []
+        seen = set()
+        for shard in shards:
+            for server in shard:
+                if server['id'] not in seen:
+                    seen.add(server['id'])
+                    servers.append(server)
+        return servers
+
+    def _matches_server_filters(self, server, server_filters):
+        tags = set(server.get('tags') or [])
+        az = server.get('az', server.get('OS-EXT-AZ:availability_zone'))
+        return all([
+            not server_filters.get('status')
+            or server['status'].upper() == server_filters['status'].upper(),
+            not server_filters.get('name')
+            or re.search(server_filters['name'], server['name']),
+            not server_filters.get('availability_zone')
+            or az == server_filters['availability_zone'],
+            set(server_filters.get('tags') or []) <= tags,
+            not server_filters.get('tags_any')
+            or tags & set(server_filters['tags_any']),
+        ])
+
+    def _list_resources(self, cloud, list_resources, *args, **kwargs):
+        # Like openstacksdk, return hosts without additional information
+        # if it cannot be listed
+        try:
+            return list(list_resources(*args, **kwargs))
+        except sdk_exceptions.SDKException as e:
+            self.display.vvvv(
+                "Couldn't list resources of cloud %s in region %s: %s" % (
+                    cloud.name, cloud.config.region_name, e))
+            return []
+
+    def _expand_servers(self, cloud, servers, expand):
+        # Servers whose floating ips are unknown to Nova look them up in
+        # Neutron, see openstack.cloud.meta._get_supplemental_addresses()
+        lookup_floating_ips = [
+            server for server in servers
+            if server['status'] == 'ACTIVE' and not any(
+                address.get('OS-EXT-IPS:type') == 'floating'
+                for addresses in server['addresses'].values()
+                for address in addresses)]
+
+        # Same as the floating_ip_source check of openstacksdk
+        floating_ip_source = (
+            cloud.config.config.get('floating_ip_source') or '').lower()
+        ports = collections.defaultdict(list)
+        floating_ips = collections.defaultdict(list)
+        if (expand or lookup_floating_ips) and cloud.has_service('network'):
+            if (lookup_floating_ips
+                    and floating_ip_source in ('nova', 'neutron')):
+                for ip in self._list_resources(cloud, cloud.network.ips):
+                    if ip['port_id']:
+                        floating_ips[ip['port_id']].append(ip)
+            if expand or floating_ips:
+                for port in self._list_resources(cloud, cloud.network.ports):
+                    if port['device_id']:
+                        ports[port['device_id']].append(port)
+
+        for server in lookup_floating_ips:
+            self._add_floating_addresses(server, ports, floating_ips)
+        for server in servers:
+            self._add_server_interfaces(cloud, server)
+
+        if expand:
+            self._add_server_details(cloud, servers, ports)
+        return servers
+
+    def _add_floating_addresses(self, server, ports, floating_ips):
+        fixed_ip_mapping = {}
+        for name, network in server['addresses'].items():
+            for address in network:
+                if address['version'] != 6:
+                    fixed_ip_mapping[address['addr']] = name
+        for port in ports.get(server['id'], []):
+            for ip in floating_ips.get(port['id'], []):
+                fixed_net = fixed_ip_mapping.get(ip['fixed_ip_address'])
+                if fixed_net is not None:
+                    server['addresses'][fixed_net].append({
+                        'version': 4,
+                        'addr': ip['floating_ip_address'],
+                        'OS-EXT-IPS:type': 'floating',
+                        'OS-EXT-IPS-MAC:mac_addr': port['mac_address']})
+
+    def _add_server_interfaces(self, cloud, server):
+        # Like openstack.cloud.meta.add_server_interfaces() without looking
+        # up floating ips of each server. Servers are raw Nova servers or
+        # openstacksdk resources, which only accept known fields, so
+        # accessIPv4 and accessIPv6 are kept as Nova returns them.
+        public_v4 = sdk_meta.get_server_external_ipv4(cloud, server) or ''
+        public_v6 = ''
+        if not cloud.force_ipv4:
+            public_v6 = sdk_meta.get_server_external_ipv6(server) or ''
+        private_v4 = sdk_meta.get_server_private_ip(server, cloud) or ''
+        # IPv6 addresses are only used when a server has no IPv4 address
+        interface_ip = sdk_meta.get_server_default_ip(cloud, server)
+        if not interface_ip and cloud.private and private_v4:
+            interface_ip = private_v4
+        server['public_v4'] = public_v4
+        server['public_v6'] = public_v6
+        server['private_v4'] = private_v4
+        server['interface_ip'] = interface_ip or public_v4 or public_v6
+
+    def _add_server_details(self, cloud, servers, ports):
+        # Same as openstack.cloud.meta.get_hostvars_from_server() with
+        # resources listed once for all servers
+        flavors = dict(
+            (flavor['id'], flavor['name']) for flavor in
+            self._list_resources(cloud, cloud.list_flavors, get_extra=False))
+        images = dict((image['id'], image['name']) for image in
+                      self._list_resources(cloud, cloud.list_images))
+
+        # Neutron security groups are resources, Nova's are dicts
+        security_groups = dict(
+            (group['id'], group.to_dict(computed=False)
+             if hasattr(group, 'to_dict') else group)
+            for group in self._list_resources(cloud,
+                                              cloud.list_security_groups))
+
+        volumes = collections.defaultdict(list)
+        if cloud.has_service('volume'):
+            for volume in self._list_resources(cloud, cloud.list_volumes):
+                if volume['attachments']:
+                    # Make things easier to consume elsewhere
+                    volume['device'] = volume['attachments'][0]['device']
+                for attachment in volume['attachments']:
+                    volumes[attachment['server_id']].append(volume)
+
+        for server in servers:
+            flavor_id = server['flavor'].get('id')
+            if flavor_id:
+                if flavor_id not in flavors:
+                    # Flavors of other projects are not listed
+                    flavors[flavor_id] = cloud.get_flavor_name(flavor_id)
+                if flavors[flavor_id]:
+                    server['flavor']['name'] = flavors[flavor_id]
+            elif 'original_name' in server['flavor']:
+                server['flavor']['name'] = server['flavor']['original_name']
+
+            group_ids = []
+            for port in ports.get(server['id'], []):
+                for group_id in port['security_group_ids'] or []:
+                    if group_id not in group_ids:
+                        group_ids.append(group_id)
+            server['security_groups'] = [
+                security_groups[group_id] for group_id in group_ids
+                if group_id in security_groups]
+
+            # OpenStack can return image as a string when you've booted
+            # from volume
+            if str(server['image']) == server['image']:
+                image_id = server['image']
+                server['image'] = dict(id=image_id)
+            else:
+                image_id = server['image'].get('id', None)
+            if image_id and images.get(image_id):
+                server['image']['name'] = images[image_id]
+
+            server['volumes'] = volumes.get(server['id'], [])
+
+    def _merge_changes(self, hosts, changes):
+        # Nova returns deleted servers with status DELETED
+        changed = collections.OrderedDict(
+            (server['id'], server) for server in changes)
+        merged = []
+        for server in hosts:
+            server = changed.pop(server['id'], server)
+            if server['status'] != 'DELETED':
+                merged.append(server)
+        merged.extend(server for server in changed.values()
+                      if server['status'] != 'DELETED')
+        return merged
 
     def _populate_from_source(self, source_data):
         groups = collections.defaultdict(list)
-        firstpass = collections.defaultdict(list)
         hostvars = {}
+        # Servers are added as they come, so source_data may be a generator
+        # and is read once. Hosts are named after their server until a
+        # second server with the same name turns up, which renames the
+        # first host to its ID. Only the first server of each name and the
+        # IDs of servers with duplicate names are kept in the index.
+        names = {}
+        renamed = {}
 
         use_server_id = (
             self._config_data.get('inventory_hostname', 'name') != 'name')
         show_all = self._config_data.get('show_all', False)
+        self._legacy_groups = self.get_option('legacy_groups')
+        self._region_groups = {}
+        self._hostvar_fields = [
+            field.split('.')
+            for field in self._config_data.get('hostvar_fields') or []]
+        self._interned = {}
 
         for server in source_data:
             if 'interface_ip' not in server and not show_all:
                 continue
-            firstpass[server['name']].append(server)
-
-        for name, servers in firstpass.items():
-            if len(servers) == 1 and not use_server_id:
-                self._append_hostvars(hostvars, groups, name, servers[0])
-            else:
-                server_ids = set()
+            name = server['name']
+            if use_server_id:
+                self._append_hostvars(hostvars, groups, server['id'], server,
+                                      namegroup=True)
+                continue
+            known = names.setdefault(name, server)
+            if known is server:
+                self._append_hostvars(hostvars, groups, name, server)
+            elif isinstance(known, set):
                 # Trap for duplicate results
-                for server in servers:
-                    server_ids.add(server['id'])
-                if len(server_ids) == 1 and not use_server_id:
-                    self._append_hostvars(hostvars, groups, name, servers[0])
-                else:
-                    for server in servers:
-                        self._append_hostvars(
-                            hostvars, groups, server['id'], server,
-                            namegroup=True)
+                if server['id'] not in known:
+                    known.add(server['id'])
+                    self._append_hostvars(hostvars, groups, server['id'],
+                                          server, namegroup=True)
+            elif known['id'] != server['id']:
+                renamed[name] = known['id']
+                names[name] = set([known['id'], server['id']])
+                if self._legacy_groups:
+                    groups[name].append(known['id'])
+                self._append_hostvars(hostvars, groups, server['id'], server,
+                                      namegroup=True)
 
-        self._set_variables(hostvars, groups)
+        self._interned = None
+        with self._timings.measure('set_variables'):
+            self._set_variables(hostvars, groups, renamed)
 
-    def _set_variables(self, hostvars, groups):
+    def _set_variables(self, hostvars, groups, renamed=None):
+        # Hosts which are renamed to the ID of their server are added
+        # under their new name
+        renamed = renamed or {}
 
         strict = self.get_option('strict')
+        compose = self._config_data.get('compose')
+        composed_groups = self._config_data.get('groups')
+        keyed_groups = self._config_data.get('keyed_groups')
 
         # set vars in inventory from hostvars
-        for host in hostvars:
+        for current_host, variables in hostvars.items():
+            current_host = renamed.get(current_host, current_host)
+            self.inventory.add_host(current_host)
+            host = self.inventory.get_host(current_host)
 
             # actually update inventory
-            for key in hostvars[host]:
-                self.inventory.set_variable(host, key, hostvars[host][key])
+            for key, value in variables.items():
+                host.set_variable(key, value)
 
             # create composite vars
-            self._set_composite_vars(
-                self._config_data.get('compose'), self.inventory.get_host(host).get_vars(), host, strict)
+            if compose:
+                self._set_composite_vars(
+                    compose, host.get_vars(), current_host, strict)
 
             # constructed groups based on conditionals
-            self._add_host_to_composed_groups(
-                self._config_data.get('groups'), hostvars[host], host, strict)
+            if composed_groups:
+                self._add_host_to_composed_groups(
+                    composed_groups, variables, current_host, strict)
 
             # constructed groups based on jinja expressions
-            self._add_host_to_keyed_groups(
-                self._config_data.get('keyed_groups'), hostvars[host], host, strict)
+            if keyed_groups:
+                self._add_host_to_keyed_groups(
+                    keyed_groups, variables, current_host, strict)
 
+        # Add all hosts of a group at once instead of looking up the group
+        # and the host for each member
         for group_name, group_hosts in groups.items():
             gname = self.inventory.add_group(group_name)
+            group = self.inventory.groups[gname]
             for host in group_hosts:
+                host = renamed.get(host, host)
                 if gname == host:
                     display.vvvv("Same name for host %s and group %s" % (host, gname))
                     self.inventory.add_host(host, gname)
-                else:
+                elif host in self.inventory.groups:
+                    # Like add_child(), which adds a group named like the
+                    # host instead of the host
                     self.inventory.add_child(gname, host)
+                else:
+                    group.add_host(self.inventory.hosts[host])
 
-    def _get_groups_from_server(self, server_vars, namegroup=True):
-        groups = []
+    def _get_region_groups(self, cloud, region, az):
+        # Group names of a cloud, region and availability zone are the same
+        # for many servers, so build and intern them once
+        key = (cloud, region, az)
+        if key not in self._region_groups:
+            groups = [cloud]
+            if region:
+                groups.append(region)
+            groups.append("%s_%s" % (cloud, region))
+            az_groups = []
+            if az:
+                # Make groups for az, region_az and cloud_region_az
+                az_groups = [az, '%s_%s' % (region, az),
+                             '%s_%s_%s' % (cloud, region, az)]
+            self._region_groups[key] = (
+                [sys.intern(group) for group in groups],
+                [sys.intern(group) for group in az_groups])
+        return self._region_groups[key]
 
+    def _get_groups_from_server(self, server_vars, namegroup=True):
         region = server_vars['region']
         cloud = server_vars['cloud']
         metadata = server_vars.get('metadata', {})
+        az = server_vars.get('az', None)
 
-        # Create a group for the cloud
-        groups.append(cloud)
-
-        # Create a group on region
-        if region:
-            groups.append(region)
-
-        # And one by cloud_region
-        groups.append("%s_%s" % (cloud, region))
+        # Create groups for the cloud, region and cloud_region
+        region_groups, az_groups = self._get_region_groups(cloud, region, az)
+        groups = list(region_groups)
 
         # Check if group metadata key in servers' metadata
         if 'group' in metadata:
@@ -365,34 +1494,55 @@ class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
         for key, value in iter(metadata.items()):
             groups.append('meta-%s_%s' % (key, value))
 
-        az = server_vars.get('az', None)
-        if az:
-            # Make groups for az, region_az and cloud_region_az
-            groups.append(az)
-            groups.append('%s_%s' % (region, az))
-            groups.append('%s_%s_%s' % (cloud, region, az))
+        groups.extend(az_groups)
         return groups
 
+    def _get_server_hostvar(self, server):
+        # Servers of a cloud mostly have one of a few flavors, images and
+        # sets of security groups, so identical values are kept once
+        for key in self.SHARED_HOSTVAR_KEYS:
+            value = server.get(key)
+            if value:
+                server[key] = self._interned.setdefault(
+                    (key, json.dumps(value, sort_keys=True, default=str)),
+                    value)
+        if not self._hostvar_fields:
+            return server
+        hostvar = {}
+        for path in self._hostvar_fields:
+            value = server
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                target = hostvar
+                for key in path[:-1]:
+                    target = target.setdefault(key, {})
+                target[path[-1]] = value
+        return hostvar
+
     def _append_hostvars(self, hostvars, groups, current_host,
                          server, namegroup=False):
         if not self.use_names:
             hostvars[current_host] = dict(
                 ansible_ssh_host=server['interface_ip'],
                 ansible_host=server['interface_ip'],
-                openstack=server,
+                openstack=self._get_server_hostvar(server),
             )
 
         if self.use_names:
             hostvars[current_host] = dict(
                 ansible_ssh_host=server['name'],
                 ansible_host=server['name'],
-                openstack=server,
+                openstack=self._get_server_hostvar(server),
             )
 
-        self.inventory.add_host(current_host)
-
-        if self.get_option('legacy_groups'):
-            for group in self._get_groups_from_server(server, namegroup=namegroup):
+        if self._legacy_groups:
+            # A server can end up in the same group more than once, e.g.
+            # when its metadata group is named like its region
+            for group in collections.OrderedDict.fromkeys(
+                    self._get_groups_from_server(server, namegroup=namegroup)):
                 groups[group].append(current_host)
 
     def verify_file(self, path):
@@ -31,7 +31,20 @@
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import abc
-import copy
+import binascii
+import collections
+import concurrent.futures
+import contextlib
+import email.utils
+import fcntl
+import hashlib
+import hmac
+import json
+import operator
+import random
+import re
+import threading
+import time
 from ansible.module_utils.six import raise_from
 try:
     from ansible.module_utils.compat.version import StrictVersion
@@ -46,6 +59,7 @@ import importlib
 import os
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six.moves.urllib.parse import urlparse
 
 OVERRIDES = {}
 
@@ -54,6 +68,12 @@ CUSTOM_VAR_PARAMS = ['min_ver', 'max_ver']
 MINIMUM_SDK_VERSION = '0.99.0'
 MAXIMUM_SDK_VERSION = None
 
+DEFAULT_CACHE_PATH = os.path.join('~', '.cache', 'ansible', 'openstack.cloud')
+
+# Cached tokens are only reused if they are valid for at least this many
+# seconds, in addition to the module's timeout when it waits for resources.
+TOKEN_CACHE_MARGIN = 300
+
 
 def openstack_argument_spec():
     # DEPRECATED: This argument spec is only used for the deprecated old
@@ -103,16 +123,39 @@ def openstack_full_argument_spec(**kwargs):
         sdk_log_path=dict(),
         sdk_log_level=dict(
             default='INFO', choices=['INFO', 'DEBUG']),
+        token_cache=dict(default=False, type='bool'),
+        cache_path=dict(type='path'),
+        discovery_cache_ttl=dict(default=0, type='int'),
+        max_concurrency=dict(default=4, type='int'),
+        report_api_metrics=dict(default=False, type='bool'),
+        api_retries=dict(default=3, type='int'),
+        rate_limit=dict(type='float'),
     )
-    # Filter out all our custom parameters before passing to AnsibleModule
-    kwargs_copy = copy.deepcopy(kwargs)
-    for v in kwargs_copy.values():
-        for c in CUSTOM_VAR_PARAMS:
-            v.pop(c, None)
-    spec.update(kwargs_copy)
+    # Filter out all our custom parameters before passing to AnsibleModule.
+    # Argument specs are static, so only those which contain custom
+    # parameters are copied (shallowly) instead of deep copying all of them.
+    for name, param_spec in kwargs.items():
+        if any(c in param_spec for c in CUSTOM_VAR_PARAMS):
+            param_spec = dict((k, v) for k, v in param_spec.items()
+                              if k not in CUSTOM_VAR_PARAMS)
+        spec[name] = param_spec
     return spec
 
 
+def get_sdk_version():
+    """Return the version of the installed openstacksdk library.
+
+    Package metadata is read directly, which is cheaper than importing
+    openstack.version (deprecated in recent releases) on Python 3.8+.
+    """
+    try:
+        from importlib import metadata
+        return metadata.version('openstacksdk')
+    except Exception:
+        # Python < 3.8 or openstacksdk is not installed as distribution
+        return importlib.import_module('openstack.version').__version__
+
+
 def openstack_module_kwargs(**kwargs):
     ret = {}
     for key in ('mutually_exclusive', 'required_together', 'required_one_of'):
@@ -129,7 +172,7 @@ def openstack_cloud_from_module(module, min_version=None, max_version=None):
     try:
         # Due to the name shadowing we should import other way
         sdk = importlib.import_module('openstack')
-        sdk_version = importlib.import_module('openstack.version')
+        sdk_version = get_sdk_version()
     except ImportError:
         module.fail_json(msg='openstacksdk is required for this module')
 
@@ -145,13 +188,13 @@ def openstack_cloud_from_module(module, min_version=None, max_version=None):
     elif MAXIMUM_SDK_VERSION:
         max_version = StrictVersion(MAXIMUM_SDK_VERSION)
 
-    if min_version and StrictVersion(sdk_version.__version__) < min_version:
+    if min_version and StrictVersion(sdk_version) < min_version:
         module.fail_json(
             msg="To utilize this module, the installed version of "
                 "the openstacksdk library MUST be >={min_version}.".format(
                     min_version=min_version))
 
-    if max_version and StrictVersion(sdk_version.__version__) > max_version:
+    if max_version and StrictVersion(sdk_version) > max_version:
         module.fail_json(
             msg="To utilize this module, the installed version of "
                 "the openstacksdk library MUST be <={max_version}.".format(
@@ -191,6 +234,645 @@ def openstack_cloud_from_module(module, min_version=None, max_version=None):
         module.fail_json(msg=str(e))
 
 
+@contextlib.contextmanager
+def locked_file(path, shared=False):
+    """Open a file for reading and writing while holding an advisory lock.
+
+    The file and its parent directories are created if they are missing.
+    Only the current user may read or write them because they can contain
+    credentials such as Keystone tokens.
+
+    Arguments:
+        path {str} -- Path to the file.
+        shared {bool} -- Take a shared lock instead of an exclusive one.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    handle = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield handle
+    finally:
+        # Closing the file releases the lock
+        handle.close()
+
+
+def cache_file_path(module_params, kind, key):
+    """Return the path of an on-disk cache file.
+
+    Arguments:
+        module_params {dict} -- Module parameters with the `cache_path` option.
+        kind {str} -- Kind of cached data, used as prefix of the file name.
+        key {object} -- JSON serializable object identifying the cached data.
+    """
+    cache_path = os.path.expanduser(
+        module_params.get('cache_path') or DEFAULT_CACHE_PATH)
+    # Keys can contain credentials, so file names are keyed with a secret
+    # of the current user and cannot be used to check guessed passwords
+    digest = hmac.new(
+        cache_secret(cache_path),
+        json.dumps(key, sort_keys=True, default=str).encode('utf-8'),
+        hashlib.sha256)
+    return os.path.join(cache_path,
+                        '{0}-{1}.json'.format(kind, digest.hexdigest()))
+
+
+def cache_secret(cache_path):
+    """Return the secret of a cache directory, creating it if missing."""
+    with locked_file(os.path.join(cache_path, '.secret')) as handle:
+        secret = handle.read().strip()
+        if not secret:
+            secret = binascii.hexlify(os.urandom(32)).decode('ascii')
+            handle.write(secret)
+    return secret.encode('ascii')
+
+
+class TokenCache(object):
+    """Keystone token and service catalog cache shared between processes.
+
+    The authentication state of the connection's auth plugin, which includes
+    the token and the service catalog, is stored in a file named after a
+    keyed hash of the resolved auth configuration of the cloud, see
+    `cache_file_path`. Consecutive module invocations against the same
+    cloud reuse the state instead of authenticating again as long as the
+    token does not expire within `lifetime` seconds.
+
+    Args:
+        conn: Connection to SDK object.
+        path: Path to the cache file.
+        lifetime: Minimum remaining lifetime of a reusable token in seconds.
+    """
+
+    def __init__(self, conn, path, lifetime):
+        self.conn = conn
+        self.path = path
+        self.lifetime = lifetime
+        self.state = None
+
+    @classmethod
+    def from_connection(cls, conn, module_params):
+        """Return a cache for the connection or None if its auth plugin does
+        not support caching of its state (for example `none` or
+        `admin_token` auth types).
+        """
+        auth = conn.session.auth
+        if not hasattr(auth, 'get_auth_state') or auth.get_cache_id() is None:
+            return None
+        config = conn.config.config
+        key = dict(auth_type=config.get('auth_type'),
+                   auth=config.get('auth'))
+        lifetime = TOKEN_CACHE_MARGIN
+        if module_params.get('wait'):
+            # Refresh early so that the token does not expire while waiting
+            lifetime += module_params.get('timeout') or 0
+        return cls(conn, cache_file_path(module_params, 'token', key),
+                   lifetime)
+
+    def _restore(self, state):
+        if not state:
+            return False
+        auth = self.conn.session.auth
+        try:
+            auth.set_auth_state(state)
+        except (ValueError, KeyError, TypeError):
+            # Corrupted or incompatible cache file
+            auth.invalidate()
+            return False
+        if (auth.auth_ref is None
+                or auth.auth_ref.will_expire_soon(self.lifetime)):
+            auth.invalidate()
+            return False
+        self.state = state
+        return True
+
+    def load(self):
+        """Install a cached token or authenticate and cache the new token.
+
+        Only one process authenticates on a cache miss, others wait for the
+        lock and reuse the token it has fetched.
+        """
+        with locked_file(self.path, shared=True) as handle:
+            if self._restore(handle.read()):
+                return
+        with locked_file(self.path) as handle:
+            if self._restore(handle.read()):
+                return
+            self.conn.authorize()
+            self._write(handle)
+
+    def save(self):
+        """Store the current token if it has been renewed since loading."""
+        if self.conn.session.auth.get_auth_state() == self.state:
+            return
+        try:
+            with locked_file(self.path) as handle:
+                self._write(handle)
+        except (IOError, OSError):
+            # The next module invocation will authenticate again
+            pass
+
+    def _write(self, handle):
+        self.state = self.conn.session.auth.get_auth_state()
+        handle.seek(0)
+        handle.truncate()
+        handle.write(self.state or '')
+        handle.flush()
+
+
+class DiscoveryCache(object):
+    """Cache of service discovery results for a cloud region.
+
+    Results of service lookups, endpoint version documents, maximum
+    microversions and enabled network extensions are kept in memory for the
+    lifetime of the module. If `ttl` is positive, they are also stored in a
+    file and reused by subsequent module invocations against the same cloud
+    region for `ttl` seconds.
+
+    Args:
+        conn: Connection to SDK object.
+        path: Path to the cache file.
+        ttl: Time in seconds for which cached results are valid on disk.
+    """
+
+    def __init__(self, conn, path=None, ttl=0):
+        self.conn = conn
+        self.path = path if ttl > 0 else None
+        self.ttl = ttl
+        self.changed = False
+        self.data = dict(timestamp=time.time(), services={}, versions={},
+                         extensions=None, documents={})
+
+    @classmethod
+    def from_connection(cls, conn, module_params):
+        config = conn.config
+        key = dict(auth_url=(config.config.get('auth') or {}).get('auth_url'),
+                   region_name=config.get_region_name(),
+                   interface=config.get_interface())
+        return cls(conn, cache_file_path(module_params, 'discovery', key),
+                   module_params.get('discovery_cache_ttl') or 0)
+
+    def _documents(self):
+        # Version documents fetched by keystoneauth while looking up endpoints
+        session = self.conn.session
+        if getattr(session, '_discovery_cache', None) is None:
+            session._discovery_cache = {}
+        return session._discovery_cache
+
+    def load(self):
+        """Restore results which have been stored less than `ttl` seconds
+        ago."""
+        if not self.path:
+            return
+        with locked_file(self.path, shared=True) as handle:
+            content = handle.read()
+        try:
+            data = json.loads(content) if content else None
+        except ValueError:
+            data = None
+        if not data or time.time() - data.get('timestamp', 0) > self.ttl:
+            return
+        self.data = data
+
+        discover = importlib.import_module('keystoneauth1.discover')
+        documents = self._documents()
+        for url, versions in data['documents'].items():
+            if url not in documents:
+                # Discover() fetches the document from the url on creation
+                disc = discover.Discover.__new__(discover.Discover)
+                disc._url = url
+                disc._data = versions
+                documents[url] = disc
+
+    def save(self):
+        """Store results if anything has been looked up since loading."""
+        if not self.path:
+            return
+        documents = dict((url, disc._data)
+                         for url, disc in self._documents().items())
+        if not self.changed and documents == self.data['documents']:
+            return
+        self.data['documents'] = documents
+        try:
+            with locked_file(self.path) as handle:
+                handle.seek(0)
+                handle.truncate()
+                json.dump(self.data, handle)
+        except (IOError, OSError, TypeError, ValueError):
+            # The next module invocation will discover again
+            pass
+
+    def has_service(self, service_type):
+        """Return whether the cloud region provides a service."""
+        services = self.data['services']
+        if service_type not in services:
+            services[service_type] = bool(self.conn.has_service(service_type))
+            self.changed = True
+        return services[service_type]
+
+    def has_network_extension(self, alias):
+        """Return whether a Neutron extension is enabled.
+
+        All extensions are listed with one request instead of one lookup
+        request per extension.
+        """
+        if self.data['extensions'] is None:
+            self.data['extensions'] = sorted(
+                extension.alias for extension in self.conn.network.extensions())
+            self.changed = True
+        return alias in self.data['extensions']
+
+    def get_versions(self, service_type):
+        """Return the version data of the service's endpoint.
+
+        Returns:
+            versions {list} -- Dictionaries with `version`, `status`, `url`,
+                               `min_microversion` and `max_microversion`
+                               keys like returned by keystoneauth's
+                               `get_all_version_data`.
+        """
+        versions = self.data['versions']
+        if service_type not in versions:
+            config = self.conn.config
+            ver_data = self.conn.session.get_all_version_data(
+                interface=config.get_interface(service_type),
+                region_name=config.get_region_name(service_type),
+                service_type=service_type)
+            versions[service_type] = [
+                dict(version)
+                for interfaces in ver_data.values()
+                for services in interfaces.values()
+                for version in services.get(service_type, [])]
+            self.changed = True
+        return versions[service_type]
+
+    def get_max_microversion(self, service_type):
+        """Return the maximum microversion of the current version of a
+        service, e.g. '2.90', or None if it is unknown.
+
+        Services without microversions like Octavia report their current
+        minor version instead.
+        """
+        max_version = None
+        for version in self.get_versions(service_type):
+            if version.get('status', '').upper() == 'CURRENT':
+                max_version = (version.get('max_microversion')
+                               or version.get('version'))
+        return max_version
+
+
+class TokenBucket(object):
+    """Request rate budget shared between processes through a locked file.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate` tokens
+    per second. Every request takes one token and waits if none is left.
+
+    Args:
+        path: Path to the file holding the state of the bucket.
+        rate: Requests per second.
+        burst: Maximum number of requests sent at once after idling.
+    """
+
+    def __init__(self, path, rate, burst=None):
+        self.path = path
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+
+    def acquire(self):
+        """Take a token from the bucket, waiting until one is available.
+
+        Returns:
+            delay {float} -- Time in seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with locked_file(self.path) as handle:
+                try:
+                    state = json.loads(handle.read() or '{}')
+                except ValueError:
+                    state = {}
+                now = time.time()
+                elapsed = max(0.0, now - state.get('timestamp', now))
+                tokens = min(self.burst,
+                             state.get('tokens', self.burst) + elapsed * self.rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    delay = 0.0
+                else:
+                    delay = (1 - tokens) / self.rate
+                handle.seek(0)
+                handle.truncate()
+                json.dump(dict(tokens=tokens, timestamp=now), handle)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestThrottle(object):
+    """Retries throttled requests and limits the request rate of a session.
+
+    Requests which have been answered with 429 Too Many Requests are retried
+    regardless of their method because servers reject them before processing.
+    Idempotent requests are also retried on 502, 503 and 504 responses.
+    Streamed bodies such as uploaded files are rewound before a retry and
+    requests whose body cannot be rewound are not retried. Retry-After
+    headers are honored, otherwise delays grow exponentially
+    with jitter. If a token bucket is given, every request including retries
+    takes a token from it first.
+
+    Args:
+        retries: Maximum number of retries per request.
+        bucket: Optional TokenBucket shared with other processes.
+        max_delay: Maximum delay between retries in seconds.
+    """
+
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    RETRIABLE_STATUS_CODES = (502, 503, 504)
+    STATIC_BODY_TYPES = (bytes, bytearray, str, dict, list, tuple)
+
+    def __init__(self, retries, bucket=None, max_delay=60):
+        self.retries = retries
+        self.bucket = bucket
+        self.max_delay = max_delay
+        self.sleep = 0.0
+
+    @classmethod
+    def from_connection(cls, conn, module_params):
+        bucket = None
+        if module_params.get('rate_limit'):
+            key = dict(auth_url=(conn.config.config.get('auth') or {}).get('auth_url'))
+            bucket = TokenBucket(
+                cache_file_path(module_params, 'ratelimit', key),
+                module_params['rate_limit'])
+        return cls(module_params.get('api_retries') or 0, bucket)
+
+    def install(self, session):
+        """Wrap the request method of a keystoneauth session."""
+        request = session.request
+
+        def throttled_request(url, method, *args, **kwargs):
+            data = kwargs.get('data')
+            position = self.get_body_position(data)
+            attempt = 0
+            while True:
+                if self.bucket:
+                    self.sleep += self.bucket.acquire()
+                try:
+                    response = request(url, method, *args, **kwargs)
+                except Exception as e:
+                    response = getattr(e, 'response', None)
+                    if not (self.should_retry(method, response, attempt)
+                            and self.rewind_body(data, position)):
+                        raise
+                else:
+                    if not (self.should_retry(method, response, attempt)
+                            and self.rewind_body(data, position)):
+                        return response
+                delay = self.get_delay(response, attempt)
+                self.sleep += delay
+                time.sleep(delay)
+                attempt += 1
+
+        session.request = throttled_request
+
+    def should_retry(self, method, response, attempt):
+        if response is None or attempt >= self.retries:
+            return False
+        status_code = getattr(response, 'status_code', None)
+        return (status_code == 429
+                or (status_code in self.RETRIABLE_STATUS_CODES
+                    and method.upper() in self.IDEMPOTENT_METHODS))
+
+    def is_streamed(self, data):
+        return data is not None and not isinstance(data,
+                                                   self.STATIC_BODY_TYPES)
+
+    def get_body_position(self, data):
+        if not self.is_streamed(data):
+            return None
+        try:
+            return data.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
+
+    def rewind_body(self, data, position):
+        # Streamed bodies have been read by the previous attempt
+        if not self.is_streamed(data):
+            return True
+        if position is None:
+            return False
+        try:
+            data.seek(position)
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+        return True
+
+    def get_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            retry_after = retry_after.strip()
+            if retry_after.isdigit():
+                return min(self.max_delay, int(retry_after))
+            date = email.utils.parsedate_tz(retry_after)
+            if date:
+                return min(self.max_delay,
+                           max(0, email.utils.mktime_tz(date) - time.time()))
+        delay = min(self.max_delay, 2 ** attempt)
+        return random.uniform(delay / 2.0, delay)
+
+
+class ApiMetrics(object):
+    """Collects the number, latency and size of HTTP requests of a session.
+
+    Requests are grouped by service type, method and URL template, i.e. the
+    URL path with IDs replaced by `{id}`.
+    """
+
+    ID_PATTERN = re.compile(
+        r'^([0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}'
+        r'-?[0-9a-fA-F]{12}|[0-9]+)$')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def install(self, session):
+        """Wrap the request method of a keystoneauth session."""
+        request = session.request
+
+        def timed_request(url, method, *args, **kwargs):
+            start = time.monotonic()
+            response = None
+            try:
+                response = request(url, method, *args, **kwargs)
+                return response
+            except Exception as e:
+                response = getattr(e, 'response', None)
+                raise
+            finally:
+                self.record(url, method, kwargs, response,
+                            time.monotonic() - start)
+
+        session.request = timed_request
+
+    def template(self, url):
+        return '/'.join(
+            '{id}' if self.ID_PATTERN.match(segment) else segment
+            for segment in urlparse(url).path.split('/'))
+
+    def record(self, url, method, kwargs, response, elapsed):
+        service = ((kwargs.get('endpoint_filter') or {}).get('service_type')
+                   or urlparse(url).netloc or 'unknown')
+        bytes_sent = bytes_received = 0
+        if response is not None:
+            body = getattr(getattr(response, 'request', None), 'body', None)
+            if isinstance(body, (bytes, str)):
+                bytes_sent = len(body)
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                bytes_received = int(length)
+            elif not kwargs.get('stream'):
+                bytes_received = len(response.content or b'')
+        with self.lock:
+            self.requests.append((service, method.upper(), self.template(url),
+                                  elapsed, bytes_sent, bytes_received))
+
+    def summary(self, waits=None, throttle_sleep=0.0):
+        """Return the metrics as dictionary for module results.
+
+        Arguments:
+            waits {list} -- Waits of the module, see
+                            `OpenStackModule.wait_for_status`.
+            throttle_sleep {float} -- Time spent waiting for retries and the
+                                      rate limit.
+        """
+        with self.lock:
+            requests = list(self.requests)
+        latencies = sorted(r[3] for r in requests)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[int(round(p / 100.0 * (len(latencies) - 1)))], 3)
+
+        calls = collections.OrderedDict()
+        for service, method, template, elapsed, sent, received in requests:
+            call = calls.setdefault((service, method, template), dict(
+                service=service, method=method, url=template, count=0,
+                time=0.0, max=0.0))
+            call['count'] += 1
+            call['time'] += elapsed
+            call['max'] = max(call['max'], elapsed)
+        for call in calls.values():
+            call['time'] = round(call['time'], 3)
+            call['max'] = round(call['max'], 3)
+
+        waits = waits or []
+        return dict(
+            requests=len(requests),
+            bytes_sent=sum(r[4] for r in requests),
+            bytes_received=sum(r[5] for r in requests),
+            latency=dict(p50=percentile(50), p95=percentile(95),
+                         max=percentile(100)),
+            calls=sorted(calls.values(), key=lambda c: -c['time']),
+            wait_sleep=round(sum(w['sleep'] for w in waits), 3),
+            throttle_sleep=round(throttle_sleep, 3),
+            waits=waits,
+        )
+
+
+class LookupCache(object):
+    """Memoizes lookups such as find_* and get_* calls during a module run.
+
+    Results are keyed by function and arguments. While a lookup runs, the
+    resource types of its read requests are recorded, i.e. the service type
+    and the first URL path segment which is neither a version nor an ID.
+    Any other request, e.g. a POST to /servers/{id}/action, drops all
+    results which depend on its resource type, so lookups after a change
+    return fresh resources.
+
+    Cached results are shared between callers and must not be modified.
+    """
+
+    READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    VERSION_PATTERN = re.compile(r'^v[0-9.]+$')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.results = {}
+        self.written = {}
+        self.sequence = 0
+        self.hits = 0
+
+    def install(self, session):
+        """Wrap the request method of a keystoneauth session."""
+        request = session.request
+
+        def tracked_request(url, method, *args, **kwargs):
+            resource_type = self.resource_type(url, kwargs)
+            if method.upper() in self.READ_METHODS:
+                for resource_types in getattr(self.local, 'lookups', ()):
+                    resource_types.add(resource_type)
+                return request(url, method, *args, **kwargs)
+            try:
+                return request(url, method, *args, **kwargs)
+            finally:
+                self.invalidate(resource_type)
+
+        session.request = tracked_request
+
+    def resource_type(self, url, kwargs):
+        service = ((kwargs.get('endpoint_filter') or {}).get('service_type')
+                   or urlparse(url).netloc)
+        for segment in urlparse(url).path.split('/'):
+            if (segment and not self.VERSION_PATTERN.match(segment)
+                    and not ApiMetrics.ID_PATTERN.match(segment)):
+                return service, segment
+        return service, ''
+
+    def invalidate(self, resource_type):
+        with self.lock:
+            self.sequence += 1
+            self.written[resource_type] = self.sequence
+            for key in [key for key, (result, resource_types)
+                        in self.results.items()
+                        if resource_type in resource_types]:
+                del self.results[key]
+
+    def call(self, func, *args, **kwargs):
+        """Return the cached result of `func(*args, **kwargs)` or call it.
+
+        Exceptions are not cached.
+        """
+        key = (id(getattr(func, '__self__', None)),
+               getattr(func, '__func__', func),
+               json.dumps([args, kwargs], sort_keys=True, default=repr))
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                return self.results[key][0]
+            sequence = self.sequence
+
+        resource_types = set()
+        if not hasattr(self.local, 'lookups'):
+            self.local.lookups = []
+        self.local.lookups.append(resource_types)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            self.local.lookups.pop()
+
+        with self.lock:
+            # Do not cache results which a concurrent write might have
+            # changed while the lookup was running
+            if all(self.written.get(resource_type, 0) <= sequence
+                   for resource_type in resource_types):
+                self.results[key] = (result, resource_types)
+        return result
+
+
 class OpenStackModule:
     """Openstack Module is a base class for all Openstack Module classes.
 
@@ -208,6 +890,8 @@ class OpenStackModule:
         fail, fail_json: Exit module with failure, has `msg` keyword to
                          specify a reason of failure.
         conn: Connection to SDK object.
+        discovery: Cache of service discovery results for `conn`, i.e.
+                   available services, version data and network extensions.
         log: Print message to system log.
         debug: Print debug message to system log, prints if Ansible Debug is
                enabled or verbosity is more than 2.
@@ -216,6 +900,16 @@ class OpenStackModule:
                                 with deprecation warning.
         check_versioned: helper function to check that all arguments are known
                          in the current SDK version.
+        map_concurrently: Call a function for many items on a thread pool
+                          with at most `max_concurrency` threads.
+        wait_for_status: Poll a resource with exponential backoff until it
+                         reaches a target status.
+        waits: List of waits of the module with the time spent in each
+               status.
+        api_metrics: Collects metrics of API requests if
+                     `report_api_metrics` is enabled.
+        memoize: Call a lookup function such as `conn.get_server` once per
+                 module run and arguments until the resource type changes.
         run: method that executes and shall be overriden in inherited classes.
 
     Args:
@@ -244,14 +938,35 @@ class OpenStackModule:
         self.module_name = self.ansible._name
         self.check_mode = self.ansible.check_mode
         self.sdk_version = None
+        self.unsupported_params = {}
         self.results = {'changed': False}
         self.exit = self.exit_json = self.ansible.exit_json
         self.fail = self.fail_json = self.ansible.fail_json
         self.warn = self.ansible.warn
+        self.token_cache = None
+        self.discovery = None
+        self.waits = []
+        self.api_metrics = None
+        self.throttle = None
+        self.lookups = LookupCache()
+        if self.params['report_api_metrics']:
+            self.api_metrics = ApiMetrics()
+            self.exit = self.exit_json = self._exit_json_with_metrics
+            self.fail = self.fail_json = self._fail_json_with_metrics
         self.sdk, self.conn = self.openstack_cloud_from_module()
         self.check_deprecated_names()
         self.setup_sdk_logging()
 
+    def _exit_json_with_metrics(self, **kwargs):
+        kwargs['openstack_metrics'] = self.api_metrics.summary(
+            self.waits, self.throttle.sleep if self.throttle else 0.0)
+        self.ansible.exit_json(**kwargs)
+
+    def _fail_json_with_metrics(self, **kwargs):
+        kwargs['openstack_metrics'] = self.api_metrics.summary(
+            self.waits, self.throttle.sleep if self.throttle else 0.0)
+        self.ansible.fail_json(**kwargs)
+
     def log(self, msg):
         """Prints log message to system log.
 
@@ -296,12 +1011,12 @@ class OpenStackModule:
            provided variables are supported for the used SDK version.
         """
         try:
+            self.sdk_version = get_sdk_version()
             # Due to the name shadowing we should import other way
             sdk = importlib.import_module('openstack')
-            sdk_version_lib = importlib.import_module('openstack.version')
-            self.sdk_version = sdk_version_lib.__version__
         except ImportError:
             self.fail_json(msg='openstacksdk is required for this module')
+        sdk_version = StrictVersion(self.sdk_version)
 
         # Fail if the available SDK version doesn't meet the minimum
         # and maximum version requirements
@@ -321,13 +1036,13 @@ class OpenStackModule:
         else:
             max_version = None
 
-        if min_version and StrictVersion(self.sdk_version) < min_version:
+        if min_version and sdk_version < min_version:
             self.fail(
                 msg="To utilize this module, the installed version of "
                 "the openstacksdk library MUST be >={min_version}.".format(
                     min_version=min_version))
 
-        if max_version and StrictVersion(self.sdk_version) > max_version:
+        if max_version and sdk_version > max_version:
             self.fail(
                 msg="To utilize this module, the installed version of "
                 "the openstacksdk library MUST be <={max_version}.".format(
@@ -335,25 +1050,10 @@ class OpenStackModule:
 
         # Fail if there are set unsupported for this version parameters
         # New parameters should NOT use 'default' but rely on SDK defaults
-        for param in self.argument_spec:
-            if (self.params[param] is not None
-                and 'min_ver' in self.argument_spec[param]
-                    and StrictVersion(self.sdk_version) < self.argument_spec[param]['min_ver']):
-                self.fail_json(
-                    msg="To use parameter '{param}' with module '{module}', the installed version of "
-                    "the openstacksdk library MUST be >={min_version}.".format(
-                        min_version=self.argument_spec[param]['min_ver'],
-                        param=param,
-                        module=self.module_name))
-            if (self.params[param] is not None
-                and 'max_ver' in self.argument_spec[param]
-                    and StrictVersion(self.sdk_version) > self.argument_spec[param]['max_ver']):
-                self.fail_json(
-                    msg="To use parameter '{param}' with module '{module}', the installed version of "
-                    "the openstacksdk library MUST be <={max_version}.".format(
-                        max_version=self.argument_spec[param]['max_ver'],
-                        param=param,
-                        module=self.module_name))
+        self.unsupported_params = self._get_unsupported_params(sdk_version)
+        for param, msg in self.unsupported_params.items():
+            if self.params[param] is not None:
+                self.fail_json(msg=msg)
 
         cloud_config = self.params.pop('cloud', None)
         if isinstance(cloud_config, dict):
@@ -383,11 +1083,64 @@ class OpenStackModule:
                 interface=self.params['interface'],
             )
         try:
-            return sdk, sdk.connect(**cloud_config)
+            conn = sdk.connect(**cloud_config)
+            if self.api_metrics:
+                self.api_metrics.install(conn.session)
+            self.throttle = RequestThrottle.from_connection(conn, self.params)
+            if self.throttle.retries or self.throttle.bucket:
+                self.throttle.install(conn.session)
+            self.lookups.install(conn.session)
+            if self.params['token_cache']:
+                self.token_cache = TokenCache.from_connection(
+                    conn, self.params)
+                if self.token_cache:
+                    try:
+                        self.token_cache.load()
+                    except (IOError, OSError) as e:
+                        self.warn("Token cache is not available: %s" % e)
+                        self.token_cache = None
+            self.discovery = DiscoveryCache.from_connection(conn, self.params)
+            try:
+                self.discovery.load()
+            except (IOError, OSError) as e:
+                self.warn("Discovery cache is not available: %s" % e)
+                self.discovery.path = None
+            return sdk, conn
         except sdk.exceptions.SDKException as e:
             # Probably a cloud configuration/login error
             self.fail_json(msg=str(e))
 
+    def _get_unsupported_params(self, sdk_version):
+        """Find module parameters which require another SDK version.
+
+        Versions are compared once per parameter at startup so that
+        `check_versioned` does not have to parse them again.
+
+        Returns:
+            unsupported_params {dict} mapping names of parameters which are
+                                      not supported by `sdk_version` to
+                                      failure messages.
+        """
+        unsupported_params = {}
+        for param, param_spec in self.argument_spec.items():
+            if ('min_ver' in param_spec
+                    and sdk_version < StrictVersion(param_spec['min_ver'])):
+                unsupported_params[param] = (
+                    "To use parameter '{param}' with module '{module}', the installed version of "
+                    "the openstacksdk library MUST be >={min_version}.".format(
+                        min_version=param_spec['min_ver'],
+                        param=param,
+                        module=self.module_name))
+            elif ('max_ver' in param_spec
+                    and sdk_version > StrictVersion(param_spec['max_ver'])):
+                unsupported_params[param] = (
+                    "To use parameter '{param}' with module '{module}', the installed version of "
+                    "the openstacksdk library MUST be <={max_version}.".format(
+                        max_version=param_spec['max_ver'],
+                        param=param,
+                        module=self.module_name))
+        return unsupported_params
+
     # Filter out all arguments that are not from current SDK version
     def check_versioned(self, **kwargs):
         """Check that provided arguments are supported by current SDK version
@@ -397,16 +1150,158 @@ class OpenStackModule:
                                     supported by current SDK version. All others
                                     are dropped.
         """
-        versioned_result = {}
-        for var_name in kwargs:
-            if ('min_ver' in self.argument_spec[var_name]
-                    and StrictVersion(self.sdk_version) < self.argument_spec[var_name]['min_ver']):
-                continue
-            if ('max_ver' in self.argument_spec[var_name]
-                    and StrictVersion(self.sdk_version) > self.argument_spec[var_name]['max_ver']):
+        return dict((var_name, value) for var_name, value in kwargs.items()
+                    if var_name not in self.unsupported_params)
+
+    def memoize(self, func, *args, **kwargs):
+        """Call a lookup function once per module run and arguments.
+
+        Repeated lookups of the same resource, e.g. with
+        `self.conn.get_volume(name)`, return the first result without
+        sending requests again. Results are dropped when the module changes
+        resources of the same type, see `LookupCache`.
+
+        Arguments:
+            func {callable} -- Lookup function such as `conn.get_server` or
+                               `conn.compute.find_server`.
+
+        Returns:
+            The result of `func(*args, **kwargs)`.
+        """
+        return self.lookups.call(func, *args, **kwargs)
+
+    def map_concurrently(self, func, items, return_exceptions=False):
+        """Call a function for every item using up to `max_concurrency`
+        threads. Meant for independent, I/O-bound API calls.
+
+        `func` must be thread safe and must not exit the module, i.e. not
+        call `exit_json` or `fail_json`.
+
+        Arguments:
+            func {callable} -- Function which is called with an item.
+            items {iterable} -- Items to call `func` with.
+            return_exceptions {bool} -- Return exceptions raised by `func` in
+                                        place of its result instead of
+                                        raising them.
+
+        Returns:
+            results {list} -- Results of `func` in the order of `items`.
+
+        Raises:
+            The exception of a failed call if a single call failed or an
+            OpenStackCloudException which lists all errors in its `extra_data`
+            if several calls failed.
+        """
+        items = list(items)
+
+        def call(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, e
+
+        max_workers = min(self.params.get('max_concurrency') or 1, len(items))
+        if max_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+                outcomes = list(executor.map(call, items))
+        else:
+            outcomes = [call(item) for item in items]
+
+        if return_exceptions:
+            return [result if error is None else error
+                    for result, error in outcomes]
+
+        errors = [(item, error) for item, (result, error)
+                  in zip(items, outcomes) if error is not None]
+        if len(errors) == 1:
+            raise errors[0][1]
+        elif errors:
+            raise self.sdk.exceptions.OpenStackCloudException(
+                "{failed} of {total} calls failed: {errors}".format(
+                    failed=len(errors), total=len(items),
+                    errors="; ".join(str(error) for item, error in errors)),
+                extra_data=[dict(item=str(item), msg=str(error))
+                            for item, error in errors])
+        return [result for result, error in outcomes]
+
+    def wait_for_status(self, fetch, target_states, failure_states=None,
+                        status='status', name='Resource', timeout=None,
+                        interval=1, max_interval=15):
+        """Wait for a resource to reach one of the target states.
+
+        The resource is fetched with exponentially growing and jittered
+        intervals between `interval` and `max_interval` seconds, so quick
+        transitions are noticed fast and slow ones cause fewer requests.
+        Fails the module when the resource reaches a failure state, vanishes
+        unless `DELETED` is a target state or is not ready before the
+        deadline. The time spent in each state is logged and appended to
+        `waits`.
+
+        Arguments:
+            fetch {callable} -- Function which returns the resource, ideally
+                                with a GET request by ID. Returning None or
+                                raising ResourceNotFound means the resource
+                                is in state `DELETED`.
+            target_states {list} -- States to wait for.
+            failure_states {list} -- States in which the module fails.
+            status {str|callable} -- Attribute of the resource or function
+                                     returning its state.
+            name {str} -- Name of the resource in messages.
+            timeout {int} -- Deadline in seconds, defaults to `timeout`
+                             module parameter.
+
+        Returns:
+            resource -- The resource returned by `fetch` in a target state.
+        """
+        if timeout is None:
+            timeout = self.params['timeout']
+        if not callable(status):
+            status = operator.attrgetter(status)
+        failure_states = failure_states or []
+
+        start = time.monotonic()
+        deadline = start + timeout
+        durations = collections.OrderedDict()
+        wait = dict(name=name, states=durations, sleep=0.0)
+        state, since = None, start
+        attempt = 0
+        while True:
+            try:
+                resource = fetch()
+            except self.sdk.exceptions.ResourceNotFound:
+                resource = None
+            now = time.monotonic()
+            if state is not None:
+                durations[state] = durations.get(state, 0.0) + now - since
+            state = 'DELETED' if resource is None else status(resource)
+            since = now
+
+            if state in target_states:
+                msg = None
+            elif state in failure_states or state == 'DELETED':
+                msg = "{name} transitioned to failure state {state}".format(
+                    name=name, state=state)
+            elif now >= deadline:
+                msg = "Timeout waiting for {name} to transition to {target}".format(
+                    name=name, target=", ".join(target_states))
+            else:
+                delay = min(max_interval, interval * 2 ** attempt)
+                attempt += 1
+                delay = min(random.uniform(delay / 2.0, delay), deadline - now)
+                wait['sleep'] += delay
+                time.sleep(delay)
                 continue
-            versioned_result.update({var_name: kwargs[var_name]})
-        return versioned_result
+
+            wait['elapsed'] = now - start
+            wait['state'] = state
+            self.waits.append(wait)
+            self.debug("Waited {elapsed:.1f}s for {name}: {states}".format(
+                elapsed=wait['elapsed'], name=name,
+                states=", ".join("{0} {1:.1f}s".format(k, v)
+                                 for k, v in durations.items())))
+            if msg:
+                self.fail_json(msg=msg, waits=self.waits)
+            return resource
 
     @abc.abstractmethod
     def run(self):
@@ -420,7 +1315,7 @@ class OpenStackModule:
         try:
             results = self.run()
             if results and isinstance(results, dict):
-                self.ansible.exit_json(**results)
+                self.exit_json(**results)
         except self.sdk.exceptions.OpenStackCloudException as e:
             params = {
                 'msg': str(e),
@@ -431,6 +1326,10 @@ class OpenStackModule:
                                         'text', 'None')
                 }
             }
-            self.ansible.fail_json(**params)
+            self.fail_json(**params)
+        finally:
+            for cache in (self.token_cache, self.discovery):
+                if cache:
+                    cache.save()
         # if we got to this place, modules didn't exit
-        self.ansible.exit_json(**self.results)
+        self.exit_json(**self.results)
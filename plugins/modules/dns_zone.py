@@ -149,21 +149,12 @@ class DnsZoneModule(OpenStackModule):
 
     def _wait(self, timeout, zone, state):
         """Wait for a zone to reach the desired state for the given state."""
-
-        for count in self.sdk.utils.iterate_timeout(
-                timeout,
-                "Timeout waiting for zone to be %s" % state):
-
-            if (state == 'absent' and zone is None) or (state == 'present' and zone and zone.status == 'ACTIVE'):
-                return
-
-            try:
-                zone = self.conn.get_zone(zone.id)
-            except Exception:
-                continue
-
-            if zone and zone.status == 'ERROR':
-                self.fail_json(msg="Zone reached ERROR state while waiting for it to be %s" % state)
+        if zone is None:
+            return
+        self.wait_for_status(
+            lambda: self.conn.dns.get_zone(zone.id),
+            ['DELETED'] if state == 'absent' else ['ACTIVE'], ['ERROR'],
+            name="Zone %s" % zone.id, timeout=timeout)
 
     def run(self):
 
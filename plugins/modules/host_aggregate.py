@@ -181,15 +181,19 @@ class ComputeHostAggregateModule(OpenStackModule):
             return
 
         hosts_to_add = set(hosts) - set(aggregate['hosts'] or [])
-        for host in hosts_to_add:
-            self.conn.compute.add_host_to_aggregate(aggregate.id, host)
+        self.map_concurrently(
+            lambda host: self.conn.compute.add_host_to_aggregate(
+                aggregate.id, host),
+            sorted(hosts_to_add))
 
         if not purge_hosts:
             return
 
         hosts_to_remove = set(aggregate["hosts"] or []) - set(hosts)
-        for host in hosts_to_remove:
-            self.conn.compute.remove_host_from_aggregate(aggregate.id, host)
+        self.map_concurrently(
+            lambda host: self.conn.compute.remove_host_from_aggregate(
+                aggregate.id, host),
+            sorted(hosts_to_remove))
 
     def run(self):
         name = self.params['name']
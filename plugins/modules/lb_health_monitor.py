@@ -181,38 +181,16 @@ health_monitor:
         description: The HTTP URL path of the request sent by the monitor to test the health of a backend member.
         type: str
 '''
-import time
-
-
 from ansible_collections.openstack.cloud.plugins.module_utils.openstack import OpenStackModule
 
 
 class HealthMonitorModule(OpenStackModule):
 
-    def _wait_for_health_monitor_status(self, health_monitor_id, status, failures, interval=5):
-        timeout = self.params['timeout']
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            health_monitor = self.conn.load_balancer.get_health_monitor(health_monitor_id)
-            provisioning_status = health_monitor.provisioning_status
-            if provisioning_status == status:
-                return health_monitor
-            if provisioning_status in failures:
-                self._fail_json(
-                    msg="health monitor %s transitioned to failure state %s" %
-                        (health_monitor, provisioning_status)
-                )
-
-        time.sleep(interval)
-        total_sleep += interval
-
-        self._fail_json(msg="timeout waiting for health monitor %s to transition to %s" %
-                        (health_monitor_id, status)
-                        )
+    def _wait_for_health_monitor_status(self, health_monitor_id, status, failures):
+        return self.wait_for_status(
+            lambda: self.conn.load_balancer.get_health_monitor(health_monitor_id),
+            [status], failures, status='provisioning_status',
+            name="health monitor %s" % health_monitor_id)
 
     argument_spec = dict(
         name=dict(required=True),
@@ -172,8 +172,6 @@ EXAMPLES = '''
     timeout_member_data: 1800000
 '''
 
-import time
-
 from ansible_collections.openstack.cloud.plugins.module_utils.openstack import OpenStackModule
 
 
@@ -190,31 +188,12 @@ class LoadbalancerListenerModule(OpenStackModule):
     )
     module_kwargs = dict()
 
-    def _lb_wait_for_status(self, lb, status, failures, interval=5):
+    def _lb_wait_for_status(self, lb, status, failures):
         """Wait for load balancer to be in a particular provisioning status."""
-        timeout = self.params['timeout']
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            lb = self.conn.load_balancer.get_load_balancer(lb.id)
-            if lb.provisioning_status == status:
-                return None
-            if lb.provisioning_status in failures:
-                self.fail_json(
-                    msg="Load Balancer %s transitioned to failure state %s" %
-                        (lb.id, lb.provisioning_status)
-                )
-
-            time.sleep(interval)
-            total_sleep += interval
-
-        self.fail_json(
-            msg="Timeout waiting for Load Balancer %s to transition to %s" %
-                (lb.id, status)
-        )
+        self.wait_for_status(
+            lambda: self.conn.load_balancer.get_load_balancer(lb.id),
+            [status], failures, status='provisioning_status',
+            name="Load Balancer %s" % lb.id)
 
     def run(self):
         loadbalancer = self.params['loadbalancer']
@@ -137,8 +137,6 @@ EXAMPLES = '''
     pool: test-pool
 '''
 
-import time
-
 from ansible_collections.openstack.cloud.plugins.module_utils.openstack import OpenStackModule
 
 
@@ -156,31 +154,11 @@ class LoadbalancerMemberModule(OpenStackModule):
     module_kwargs = dict()
 
     def _wait_for_member_status(self, pool_id, member_id, status,
-                                failures, interval=5):
-        timeout = self.params['timeout']
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            member = self.conn.load_balancer.get_member(member_id, pool_id)
-            provisioning_status = member.provisioning_status
-            if provisioning_status == status:
-                return member
-            if provisioning_status in failures:
-                self.fail_json(
-                    msg="Member %s transitioned to failure state %s" %
-                        (member_id, provisioning_status)
-                )
-
-            time.sleep(interval)
-            total_sleep += interval
-
-        self.fail_json(
-            msg="Timeout waiting for member %s to transition to %s" %
-                (member_id, status)
-        )
+                                failures):
+        return self.wait_for_status(
+            lambda: self.conn.load_balancer.get_member(member_id, pool_id),
+            [status], failures, status='provisioning_status',
+            name="Member %s" % member_id)
 
     def run(self):
         name = self.params['name']
@@ -148,8 +148,6 @@ EXAMPLES = '''
     name: test-pool
 '''
 
-import time
-
 from ansible_collections.openstack.cloud.plugins.module_utils.openstack import OpenStackModule
 
 
@@ -170,32 +168,11 @@ class LoadbalancerPoolModule(OpenStackModule):
         mutually_exclusive=[['loadbalancer', 'listener']]
     )
 
-    def _wait_for_pool_status(self, pool_id, status, failures,
-                              interval=5):
-        timeout = self.params['timeout']
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            pool = self.conn.load_balancer.get_pool(pool_id)
-            provisioning_status = pool.provisioning_status
-            if provisioning_status == status:
-                return pool
-            if provisioning_status in failures:
-                self.fail_json(
-                    msg="pool %s transitioned to failure state %s" %
-                        (pool_id, provisioning_status)
-                )
-
-            time.sleep(interval)
-            total_sleep += interval
-
-        self.fail_json(
-            msg="timeout waiting for pool %s to transition to %s" %
-                (pool_id, status)
-        )
+    def _wait_for_pool_status(self, pool_id, status, failures):
+        return self.wait_for_status(
+            lambda: self.conn.load_balancer.get_pool(pool_id),
+            [status], failures, status='provisioning_status',
+            name="pool %s" % pool_id)
 
     def run(self):
         loadbalancer = self.params['loadbalancer']
@@ -291,75 +291,31 @@ EXAMPLES = '''
     delete_public_ip: yes
 '''
 
-import time
 from ansible_collections.openstack.cloud.plugins.module_utils.openstack import OpenStackModule
 
 
 class LoadBalancerModule(OpenStackModule):
 
-    def _wait_for_pool(self, pool, provisioning_status, operating_status, failures, interval=5):
+    def _wait_for_pool(self, pool, provisioning_status, operating_status, failures):
         """Wait for pool to be in a particular provisioning and operating status."""
-        timeout = self.params['timeout']  # reuse loadbalancer timeout
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            pool = self.conn.load_balancer.find_pool(name_or_id=pool.id)
-            if pool:
-                if pool.provisioning_status == provisioning_status and pool.operating_status == operating_status:
-                    return None
-                if pool.provisioning_status in failures:
-                    self.fail_json(
-                        msg="Pool %s transitioned to failure state %s" %
-                            (pool.id, pool.provisioning_status)
-                    )
-            else:
-                if provisioning_status == "DELETED":
-                    return None
-                else:
-                    self.fail_json(
-                        msg="Pool %s transitioned to DELETED" % pool.id
-                    )
-
-            time.sleep(interval)
-            total_sleep += interval
-
-    def _wait_for_lb(self, lb, status, failures, interval=5):
+        def status(pool):
+            if pool.provisioning_status == "ACTIVE":
+                return "%s/%s" % (pool.provisioning_status, pool.operating_status)
+            return pool.provisioning_status
+
+        target = provisioning_status
+        if provisioning_status == "ACTIVE":
+            target = "%s/%s" % (provisioning_status, operating_status)
+        self.wait_for_status(
+            lambda: self.conn.load_balancer.get_pool(pool.id),
+            [target], failures, status=status, name="Pool %s" % pool.id)
+
+    def _wait_for_lb(self, lb, status, failures):
         """Wait for load balancer to be in a particular provisioning status."""
-        timeout = self.params['timeout']
-
-        total_sleep = 0
-        if failures is None:
-            failures = []
-
-        while total_sleep < timeout:
-            lb = self.conn.load_balancer.find_load_balancer(lb.id)
-
-            if lb:
-                if lb.provisioning_status == status:
-                    return None
-                if lb.provisioning_status in failures:
-                    self.fail_json(
-                        msg="Load Balancer %s transitioned to failure state %s" %
-                            (lb.id, lb.provisioning_status)
-                    )
-            else:
-                if status == "DELETED":
-                    return None
-                else:
-                    self.fail_json(
-                        msg="Load Balancer %s transitioned to DELETED" % lb.id
-                    )
-
-            time.sleep(interval)
-            total_sleep += interval
-
-        self.fail_json(
-            msg="Timeout waiting for Load Balancer %s to transition to %s" %
-                (lb.id, status)
-        )
+        self.wait_for_status(
+            lambda: self.conn.load_balancer.get_load_balancer(lb.id),
+            [status], failures, status='provisioning_status',
+            name="Load Balancer %s" % lb.id)
 
     argument_spec = dict(
         name=dict(required=True),
@@ -405,15 +361,12 @@ class LoadBalancerModule(OpenStackModule):
                     self.exit_json(changed=False)
                 if lb:
                     self.exit_json(changed=False)
-                ver_data = self.conn.load_balancer.get_all_version_data()
-                region = list(ver_data.keys())[0]
-                interface_type = list(ver_data[region].keys())[0]
-                versions = ver_data[region][interface_type]['load-balancer']
-                for ver in versions:
-                    if ver['status'] == 'CURRENT':
-                        curversion = ver['version'].split(".")
-                        max_majorversion = int(curversion[0])
-                        max_microversion = int(curversion[1])
+                max_version = self.discovery.get_max_microversion(
+                    'load-balancer')
+                if max_version:
+                    curversion = max_version.split(".")
+                    max_majorversion = int(curversion[0])
+                    max_microversion = int(curversion[1])
 
                 if not lb:
                     if self.ansible.check_mode:
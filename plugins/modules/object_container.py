@@ -145,8 +145,10 @@ class ContainerModule(OpenStackModule):
                 objects.append(dt)
             if len(objects) > 0:
                 if delete_with_all_objects:
-                    for obj in objects:
-                        self.conn.object_store.delete_object(container=container, obj=obj['id'])
+                    self.map_concurrently(
+                        lambda obj: self.conn.object_store.delete_object(
+                            container=container, obj=obj['id']),
+                        objects)
                 else:
                     self.fail_json(msg="Container has objects")
             self.conn.object_store.delete_container(container=container)
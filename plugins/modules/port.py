@@ -623,8 +623,8 @@ class PortModule(OpenStackModule):
             port_attributes['security_group_ids'] = security_group_ids
 
         # Compare dns attributes
-        if self.conn.has_service('dns') and \
-           self.conn.network.find_extension('dns-integration'):
+        if self.discovery.has_service('dns') and \
+           self.discovery.has_network_extension('dns-integration'):
             port_attributes.update(dict(
                 (k, self.params[k])
                 for k in ['dns_name', 'dns_domain']
@@ -665,8 +665,8 @@ class PortModule(OpenStackModule):
             if self.params[k] is not None:
                 args[k] = self.params[k]
 
-        if self.conn.has_service('dns') \
-           and self.conn.network.find_extension('dns-integration'):
+        if self.discovery.has_service('dns') \
+           and self.discovery.has_network_extension('dns-integration'):
             for k in ['dns_domain', 'dns_name']:
                 if self.params[k] is not None:
                     args[k] = self.params[k]
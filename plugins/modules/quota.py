@@ -320,17 +320,25 @@ class QuotaModule(OpenStackModule):
 
     def _get_quotas(self, project):
         quota = {}
-        try:
-            quota['volume'] = self._get_volume_quotas(project)
-        except Exception:
+        volume, network, compute = self.map_concurrently(
+            lambda get_quotas: get_quotas(project),
+            [self._get_volume_quotas, self._get_network_quotas,
+             self._get_compute_quotas],
+            return_exceptions=True)
+
+        if isinstance(volume, Exception):
             self.warn("No public endpoint for volumev2 service was found. Ignoring volume quotas.")
+        else:
+            quota['volume'] = volume
 
-        try:
-            quota['network'] = self._get_network_quotas(project)
-        except Exception:
+        if isinstance(network, Exception):
             self.warn("No public endpoint for network service was found. Ignoring network quotas.")
+        else:
+            quota['network'] = network
 
-        quota['compute'] = self._get_compute_quotas(project)
+        if isinstance(compute, Exception):
+            raise compute
+        quota['compute'] = compute
 
         for quota_type in quota.keys():
             quota[quota_type] = self._scrub_results(quota[quota_type])
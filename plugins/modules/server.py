@@ -1105,6 +1105,10 @@ class ServerModule(OpenStackModule):
         return server
 
     def _update_security_groups(self, server, update):
+        # Security groups are not changed concurrently with
+        # map_concurrently() because Nova updates the security groups of
+        # the server's ports with read-modify-write requests to Neutron,
+        # so concurrent changes would overwrite each other.
         add_security_groups = update.get('add_security_groups')
         if add_security_groups:
             for sg in add_security_groups:
@@ -155,7 +155,6 @@ class VolumeModule(OpenStackModule):
         limited by the openstacksdk and may change whenever the
         functionality is extended.
         '''
-        volume = self.conn.get_volume(self.params['display_name'])
         diff = {'before': volume, 'after': ''}
         size = self.params['size']
 
@@ -224,8 +223,7 @@ class VolumeModule(OpenStackModule):
         changed = False
         diff = {'before': '', 'after': ''}
 
-        if self.conn.volume_exists(self.params['display_name']):
-            volume = self.conn.get_volume(self.params['display_name'])
+        if volume:
             diff['before'] = volume
 
             if self.ansible.check_mode:
@@ -244,10 +242,7 @@ class VolumeModule(OpenStackModule):
     def run(self):
 
         state = self.params['state']
-        if self.conn.volume_exists(self.params['display_name']):
-            volume = self.conn.get_volume(self.params['display_name'])
-        else:
-            volume = None
+        volume = self.conn.get_volume(self.params['display_name'])
 
         if state == 'present':
             if not volume:
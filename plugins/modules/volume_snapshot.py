@@ -99,8 +99,7 @@ class VolumeSnapshotModule(OpenStackModule):
         supports_check_mode=True
     )
 
-    def _present_volume_snapshot(self):
-        volume = self.conn.get_volume(self.params['volume'])
+    def _present_volume_snapshot(self, volume):
         snapshot = self.conn.get_volume_snapshot(
             self.params['display_name'], filters={'volume_id': volume.id})
         if not snapshot:
@@ -116,8 +115,7 @@ class VolumeSnapshotModule(OpenStackModule):
         else:
             self.exit_json(changed=False, snapshot=snapshot)
 
-    def _absent_volume_snapshot(self):
-        volume = self.conn.get_volume(self.params['volume'])
+    def _absent_volume_snapshot(self, volume):
         snapshot = self.conn.get_volume_snapshot(
             self.params['display_name'], filters={'volume_id': volume.id})
         if not snapshot:
@@ -130,8 +128,7 @@ class VolumeSnapshotModule(OpenStackModule):
             )
             self.exit_json(changed=True, snapshot_id=snapshot.id)
 
-    def _system_state_change(self):
-        volume = self.conn.get_volume(self.params['volume'])
+    def _system_state_change(self, volume):
         snapshot = self.conn.get_volume_snapshot(
             self.params['display_name'],
             filters={'volume_id': volume.id})
@@ -145,13 +142,14 @@ class VolumeSnapshotModule(OpenStackModule):
     def run(self):
         state = self.params['state']
 
-        if self.conn.volume_exists(self.params['volume']):
+        volume = self.conn.get_volume(self.params['volume'])
+        if volume:
             if self.ansible.check_mode:
-                self.exit_json(changed=self._system_state_change())
+                self.exit_json(changed=self._system_state_change(volume))
             if state == 'present':
-                self._present_volume_snapshot()
+                self._present_volume_snapshot(volume)
             if state == 'absent':
-                self._absent_volume_snapshot()
+                self._absent_volume_snapshot(volume)
         else:
             self.fail_json(
                 msg="No volume with name or id '{0}' was found.".format(
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+# Refreshes the cache of the openstack.cloud.openstack inventory plugin, so
+# ansible-playbook and ansible-inventory runs read hosts from a warm cache
+# instead of listing servers themselves. Run it from cron or a systemd timer
+# with the same openstack.yml inventory config, ansible.cfg and clouds.yaml
+# as the playbooks, e.g.
+#
+#   */5 * * * * openstack_cache_warmer.py /etc/ansible/openstack.yml
+#
+# The inventory config has to enable the cache with a persistent cache
+# plugin such as jsonfile. Hosts are fetched and cached by the inventory
+# plugin itself, under the same cache key which ansible-inventory uses for
+# the config file, so the cache is the same as after an ansible-inventory
+# run with --flush-cache. With --if-expired, only hosts which have expired
+# are refreshed like an ansible-inventory run would, including incremental
+# refreshes and cache partitions, but stale hosts are refreshed right away
+# instead of in the background with stale_while_revalidate.
+#
+# The collection has to be installed where Ansible finds it, e.g. in
+# COLLECTIONS_PATHS of ansible.cfg.
+
+import argparse
+import os
+import sys
+import time
+
+from ansible.errors import AnsibleError
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import inventory_loader
+from ansible.utils.path import unfrackpath
+
+PLUGIN = 'openstack.cloud.openstack'
+
+
+def init_plugins():
+    try:
+        from ansible.plugins.loader import init_plugin_loader
+    except ImportError:
+        # ansible-core < 2.15 sets up the collection loader on import
+        pass
+    else:
+        init_plugin_loader()
+
+
+def load_plugin():
+    plugin = inventory_loader.get(PLUGIN)
+    if plugin is None:
+        raise AnsibleError('Inventory plugin %s not found, is the collection '
+                           'installed?' % PLUGIN)
+    return plugin
+
+
+def warm_cache(path, if_expired=False):
+    # ansible-inventory derives the cache key from the path like this
+    path = unfrackpath(path, follow=False)
+    plugin = load_plugin()
+    if not plugin.verify_file(path):
+        raise AnsibleError('%s is not an inventory config of %s' % (
+            path, PLUGIN))
+    # Sets the options of the config, parse() reads it again
+    loader = DataLoader()
+    plugin.loader = loader
+    plugin._read_config_data(path)
+    if not plugin.get_option('cache'):
+        raise AnsibleError('The cache is not enabled in %s' % path)
+    # Refresh stale hosts in this process, not in a background one
+    os.environ[plugin.REVALIDATE_ENV] = '1'
+    inventory = InventoryData()
+    # Without cache, the plugin fetches all hosts and writes them to the
+    # cache like with --flush-cache
+    plugin.parse(inventory, loader, path, cache=if_expired)
+    plugin.update_cache_if_changed()
+    return len(inventory.hosts)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Refresh the cache of the OpenStack inventory plugin')
+    parser.add_argument('inventory', nargs='+',
+                        help='Inventory config file of the plugin, e.g. '
+                             'openstack.yml')
+    parser.add_argument('--if-expired', action='store_true',
+                        help='Only refresh hosts whose cache has expired')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Only print errors')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_plugins()
+    failed = False
+    for path in args.inventory:
+        start = time.time()
+        try:
+            hosts = warm_cache(path, if_expired=args.if_expired)
+        except Exception as e:
+            # Errors of one inventory do not keep others from being warmed
+            sys.stderr.write('%s: %s\n' % (path, e))
+            failed = True
+            continue
+        if not args.quiet:
+            print('%s: %d hosts cached in %.1fs' % (
+                path, hosts, time.time() - start))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Benchmark the cache formats of the inventory plugin.
+
+Servers are generated like openstacksdk returns them for a FakeCloud, see
+populate.py, and stored with the jsonfile cache plugin in each format of the
+cache_format option. Reports the size of the cache file, the time to write
+it, to load it and to iterate over its hosts.
+
+Run from the directory containing ansible_collections/:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.cache_format \\
+        --servers 30000
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ansible_collections.openstack.cloud.tests.benchmarks import fakecloud
+from ansible_collections.openstack.cloud.tests.benchmarks import populate
+
+FORMATS = ['json', 'compact']
+
+
+def run(servers, cache_format, workdir):
+    '''Write and read a cache in a format and return its statistics.'''
+    from ansible.plugins.loader import cache_loader, inventory_loader
+
+    plugin = inventory_loader.get('openstack.cloud.openstack')
+    plugin._config_data = dict(plugin='openstack.cloud.openstack',
+                               cache_format=cache_format)
+    path = os.path.join(workdir, cache_format)
+
+    start = time.perf_counter()
+    cache = cache_loader.get('ansible.builtin.jsonfile', _uri=path)
+    cache.set('hosts', plugin._make_cache_entry(servers, {}, False))
+    written = time.perf_counter()
+
+    cache = cache_loader.get('ansible.builtin.jsonfile', _uri=path)
+    hosts, synced_at = plugin._read_cache_entry(cache.get('hosts'))
+    loaded = time.perf_counter()
+    # Inventories look at every host, which decodes compact caches
+    for host in hosts:
+        host['flavor']['name']
+    iterated = time.perf_counter()
+
+    return dict(format=cache_format, hosts=len(hosts),
+                size=os.path.getsize(os.path.join(path, 'hosts')),
+                write_time=written - start, load_time=loaded - written,
+                iterate_time=iterated - loaded)
+
+
+def benchmark(options):
+    '''Print statistics of each cache format as JSON.'''
+    cloud = fakecloud.FakeCloud(
+        **dict(fakecloud.PRESETS['large'], servers=options['servers']))
+    servers = populate.synthetic_servers(cloud, options['servers'])
+    workdir = tempfile.mkdtemp(prefix='openstack-cache-')
+    try:
+        print(json.dumps([run(servers, cache_format, workdir)
+                          for cache_format in FORMATS]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--servers', type=int, default=30000,
+                        help='Number of servers (default: %(default)s)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    proc = subprocess.run(
+        [sys.executable, '-c',
+         populate.CHILD % dict(path=populate.COLLECTIONS_PATH,
+                               module='cache_format',
+                               options=dict(servers=options.servers))],
+        stdout=subprocess.PIPE, check=True)
+    results = json.loads(proc.stdout.decode('utf-8').splitlines()[-1])
+
+    if options.json:
+        print(json.dumps(dict(servers=options.servers, results=results),
+                         indent=2))
+    else:
+        for r in results:
+            print('%-8s %7d hosts %10.1f KiB  write %7.3fs  load %7.3fs  '
+                  'iterate %7.3fs' % (
+                      r['format'], r['hosts'], r['size'] / 1024.0,
+                      r['write_time'], r['load_time'], r['iterate_time']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Record and replay HTTP interactions of the keystoneauth session.
+
+A cassette is a JSON file with the API requests a module sent to a cloud
+and the responses it received, including their latency. Recording patches
+`keystoneauth1.session.Session.request` so that every request which
+OpenStackModule, openstacksdk and the auth plugins send is stored. Replaying
+patches the same method to answer requests from the cassette without a
+network connection, optionally sleeping for the recorded latency.
+
+Requests are matched by method, service type, URL path and query parameters.
+Repeated requests, e.g. while waiting for a resource, receive the recorded
+responses in order and the last one once all have been used.
+'''
+
+import base64
+import collections
+import datetime
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from keystoneauth1 import exceptions, session
+
+# Response headers which are replaced before a cassette is written
+REDACTED_HEADERS = ('X-Subject-Token', 'X-Auth-Token')
+REDACTED_VALUE = 'cassette'
+DROPPED_HEADERS = ('Set-Cookie',)
+
+# Keys of resolved cloud configs which are stored for replay
+CLOUD_KEYS = ('auth_type', 'auth', 'region_name', 'interface',
+              'identity_api_version')
+SECRET_KEYS = ('password', 'secret', 'token', 'key')
+
+
+class CassetteError(Exception):
+    pass
+
+
+def interaction_key(url, method, kwargs):
+    '''Return the key which identifies equivalent requests.'''
+    parsed = urlparse(url)
+    service = ((kwargs.get('endpoint_filter') or {}).get('service_type')
+               or parsed.netloc)
+    params = kwargs.get('params') or {}
+    if isinstance(params, dict):
+        params = sorted((str(k), str(v)) for k, v in params.items())
+    return '{0} {1} {2}{3}{4}'.format(
+        method.upper(), service, parsed.path,
+        '?' + parsed.query if parsed.query else '',
+        ' ' + json.dumps(params) if params else '')
+
+
+def sanitize_cloud(config):
+    '''Return the replayable part of a resolved cloud config without
+    secrets.'''
+    cloud = dict((k, config[k]) for k in CLOUD_KEYS if config.get(k))
+    cloud.update((k, v) for k, v in config.items()
+                 if k.endswith('_api_version')
+                 or k.endswith('_endpoint_override'))
+    auth = dict(cloud.get('auth') or {})
+    for k in auth:
+        if any(secret in k for secret in SECRET_KEYS):
+            auth[k] = REDACTED_VALUE
+    cloud['auth'] = auth
+    return cloud
+
+
+class Cassette(object):
+    '''Records or replays the requests of all keystoneauth sessions.
+
+    Args:
+        path: Path of the cassette file.
+        latency_scale: Factor for the recorded latency of replayed
+                       responses, 0 replays without delay.
+        latency: Fixed latency of replayed responses in seconds which
+                 overrides the recorded latency.
+    '''
+
+    def __init__(self, path, latency_scale=1.0, latency=None):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.latency = latency
+        self.cloud = None
+        self.interactions = []
+        self.requests = collections.Counter()
+        self.unmatched = []
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._index = {}
+        self._positions = collections.defaultdict(int)
+        self._original = None
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.cloud = data.get('cloud')
+        self.interactions = data['interactions']
+        self._index = collections.defaultdict(list)
+        for interaction in self.interactions:
+            self._index[interaction['key']].append(interaction)
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(dict(cloud=self.cloud, interactions=self.interactions),
+                      f, indent=1, sort_keys=True)
+
+    def record(self):
+        '''Send requests to the cloud and store them in the cassette.'''
+        original = self._patch()
+        cassette = self
+
+        def request(self, url, method, *args, **kwargs):
+            # Requests which keystoneauth sends while preparing another
+            # request, e.g. for a token, do not count towards its latency
+            nested = cassette._local.__dict__.setdefault('nested', [])
+            nested.append(0.0)
+            start = time.monotonic()
+            response = None
+            try:
+                response = original(self, url, method, *args, **kwargs)
+                return response
+            except exceptions.HttpError as e:
+                response = e.response
+                raise
+            finally:
+                elapsed = time.monotonic() - start
+                latency = elapsed - nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+                if response is not None:
+                    cassette._store(url, method, kwargs, response, latency)
+
+        session.Session.request = request
+
+    def replay(self):
+        '''Answer requests from the cassette.'''
+        self._patch()
+        cassette = self
+
+        def request(self, url, method, *args, **kwargs):
+            return cassette._respond(url, method, kwargs)
+
+        session.Session.request = request
+
+    def restore(self):
+        if self._original:
+            session.Session.request = self._original
+            self._original = None
+
+    def _patch(self):
+        if self._original is None:
+            self._original = session.Session.request
+        return self._original
+
+    def _store(self, url, method, kwargs, response, elapsed):
+        key = interaction_key(url, method, kwargs)
+        headers = dict((k, REDACTED_VALUE if k in REDACTED_HEADERS else v)
+                       for k, v in response.headers.items()
+                       if k not in DROPPED_HEADERS)
+        content = response.content or b''
+        try:
+            body, encoding = content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+        with self.lock:
+            self.requests[key.split(' ', 2)[1]] += 1
+            self.interactions.append(dict(
+                key=key, status=response.status_code, headers=headers,
+                url=response.url, body=body, encoding=encoding,
+                elapsed=round(elapsed, 4)))
+
+    def _respond(self, url, method, kwargs):
+        key = interaction_key(url, method, kwargs)
+        with self.lock:
+            recorded = self._index.get(key)
+            if not recorded:
+                self.unmatched.append(key)
+                raise CassetteError('No recorded response for ' + key)
+            position = self._positions[key]
+            self._positions[key] = position + 1
+            self.requests[key.split(' ', 2)[1]] += 1
+        interaction = recorded[min(position, len(recorded) - 1)]
+
+        if self.latency is not None:
+            delay = self.latency
+        else:
+            delay = interaction['elapsed'] * self.latency_scale
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.headers = requests.structures.CaseInsensitiveDict(
+            interaction['headers'])
+        if interaction['encoding'] == 'base64':
+            response._content = base64.b64decode(interaction['body'])
+        else:
+            response._content = interaction['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = interaction['url']
+        response.elapsed = datetime.timedelta(seconds=interaction['elapsed'])
+        response.request = requests.Request(
+            method.upper(), interaction['url'],
+            json=kwargs.get('json')).prepare()
+
+        if kwargs.get('raise_exc', True) and response.status_code >= 400:
+            raise exceptions.from_response(response, method, url)
+        return response
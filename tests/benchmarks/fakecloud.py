@@ -0,0 +1,941 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''A fake OpenStack cloud with synthetic resources for scale tests.
+
+FakeCloud serves the Keystone, Nova, Neutron, Glance, Cinder and Octavia
+APIs which the collection uses from a single local HTTP server. Resources
+are generated on demand from their index, so a cloud with 30000 servers and
+100000 ports starts instantly and needs little memory. Only created,
+updated and deleted resources are stored.
+
+Lists support the pagination of each API, i.e. `limit` and `marker`
+parameters with `<resources>_links` or Glance's `next` link, and filters on
+resource attributes. Servers and volumes of other projects are only listed
+with `all_tenants`, like Nova and Cinder do for admins. With `changes-since`,
+only resources which have been created, updated or deleted since then are
+listed, deleted ones with status DELETED.
+
+Run a fake cloud on port 8080 with the scale of a large production cloud:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.fakecloud \\
+        --port 8080 --preset large
+
+and use it with a clouds.yaml like the one printed on startup.
+'''
+
+import argparse
+import calendar
+import collections
+import copy
+import datetime
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+PRESETS = dict(
+    small=dict(projects=10, servers=100, ports=150, networks=10,
+               floating_ips=20, volumes=50, images=5, flavors=5, routers=5,
+               load_balancers=5, users=10),
+    large=dict(projects=5000, servers=30000, ports=100000, networks=5000,
+               floating_ips=10000, volumes=20000, images=200, flavors=50,
+               routers=2500, load_balancers=1000, users=10000),
+)
+
+TIMESTAMP = '2024-01-01T00:00:00Z'
+
+# Query parameters which are not filters
+CONTROL_PARAMS = set([
+    'limit', 'marker', 'sort_key', 'sort_dir', 'sort', 'all_tenants',
+    'all_projects', 'fields', 'is_public', 'detail', 'changes-since'])
+
+
+def resource_id(kind, index):
+    return '%08x-0000-4000-8000-%012x' % (kind, index)
+
+
+def parse_id(kind, value):
+    '''Return the index of a resource ID of the given kind or None.'''
+    match = re.match(r'^([0-9a-f]{8})-0000-4000-8000-([0-9a-f]{12})$',
+                     value or '')
+    if match and int(match.group(1), 16) == kind:
+        return int(match.group(2), 16)
+    return None
+
+
+def ip_address(prefix, index):
+    return '%s.%d.%d.%d' % (prefix, index // 62500 % 256,
+                            index // 250 % 250, index % 250 + 2)
+
+
+class Collection(object):
+    '''Synthetic resources of one type.
+
+    Args:
+        name: Name of the resources in API responses, e.g. `servers`.
+        singular: Name of a single resource, e.g. `server`.
+        kind: Number which distinguishes IDs of this type from other types.
+        count: Number of generated resources.
+        make: Function which returns the resource with an index.
+        project_key: Attribute with the project of a resource if the
+                     collection only lists resources of the current project
+                     unless `all_tenants` is given.
+        filters: Query parameters which are mapped to other attributes or
+                 match in custom ways, e.g. `name` as regular expression.
+        key: Key of the resources in list responses if it differs from
+             their name in URLs, e.g. `security_groups`.
+    '''
+
+    def __init__(self, name, singular, kind, count, make, project_key=None,
+                 filters=None, key=None):
+        self.name = name
+        self.key = key or name
+        self.singular = singular
+        self.kind = kind
+        self.count = count
+        self.make = make
+        self.project_key = project_key
+        self.filters = filters or {}
+        self.stored = {}
+        self.deleted = set()
+        self.changed = {}
+        self.size = count
+        self.lock = threading.Lock()
+
+    def id(self, index):
+        return resource_id(self.kind, index)
+
+    def get(self, index):
+        '''Return the resource with an index or None if it does not
+        exist.'''
+        if index is None or not 0 <= index < self.size:
+            return None
+        id = self.id(index)
+        if id in self.deleted:
+            return None
+        if id in self.stored:
+            return self.stored[id]
+        if index < self.count:
+            return self.make(index)
+        return None
+
+    def find(self, id):
+        return self.get(parse_id(self.kind, id))
+
+    def create(self, attributes):
+        with self.lock:
+            index = self.size
+            self.size += 1
+        # Created resources look like generated ones with the given
+        # attributes, e.g. a server gets addresses, a flavor and an image
+        resource = self.make(index)
+        resource.update(attributes, id=self.id(index))
+        self.stored[resource['id']] = resource
+        self.changed[resource['id']] = time.time()
+        return resource
+
+    def update(self, id, attributes):
+        resource = self.find(id)
+        if resource is None:
+            return None
+        resource = dict(copy.deepcopy(resource), **attributes)
+        self.stored[id] = resource
+        self.changed[id] = time.time()
+        return resource
+
+    def delete(self, id):
+        if self.find(id) is None:
+            return False
+        self.deleted.add(id)
+        self.stored.pop(id, None)
+        self.changed[id] = time.time()
+        return True
+
+    def matches(self, resource, params, project_id):
+        if (self.project_key and project_id
+                and resource.get(self.project_key) != project_id):
+            return False
+        for key, values in params.items():
+            if key in CONTROL_PARAMS:
+                continue
+            if key in self.filters:
+                if not self.filters[key](resource, values):
+                    return False
+            elif key in resource:
+                if str(resource[key]).lower() not in [
+                        v.lower() for v in values]:
+                    return False
+        return True
+
+    def list(self, params, project_id, page_size):
+        '''Return a page of resources and the marker of the next page.
+
+        Arguments:
+            params {dict} -- Query parameters with lists of values.
+            project_id {str} -- Only list resources of this project if
+                                the collection is scoped to projects.
+            page_size {int} -- Maximum number of resources per page.
+        '''
+        limit = min(int(params.get('limit', [page_size])[0]), page_size)
+        start = 0
+        if 'marker' in params:
+            start = parse_id(self.kind, params['marker'][0])
+            if start is None:
+                raise LookupError('Marker %s could not be found' % (
+                    params['marker'][0]))
+            start += 1
+        changes_since = 'changes-since' in params
+        if changes_since:
+            since = calendar.timegm(time.strptime(
+                params['changes-since'][0], '%Y-%m-%dT%H:%M:%SZ'))
+            indexes = sorted(
+                parse_id(self.kind, id) for id, changed in self.changed.items()
+                if changed >= since)
+            indexes = [index for index in indexes if index >= start]
+        else:
+            indexes = range(start, self.size)
+        page = []
+        for index in indexes:
+            resource = self.get(index)
+            # Only lists of changes contain deleted resources
+            if (resource is None and changes_since
+                    and self.id(index) in self.changed):
+                resource = dict(self.make(index), id=self.id(index),
+                                status='DELETED')
+            if resource is not None and self.matches(
+                    resource, params, project_id):
+                page.append(resource)
+                if len(page) == limit:
+                    break
+        more = len(page) == limit and page[-1]['id'] != self.id(indexes[-1])
+        return page, page[-1]['id'] if more else None
+
+
+def regex_filter(key):
+    def match(resource, values):
+        return any(re.search(v, str(resource.get(key) or '')) for v in values)
+    return match
+
+
+def equal_filter(key):
+    def match(resource, values):
+        return str(resource.get(key)) in values
+    return match
+
+
+def tags_filter(any_tag):
+    def match(resource, values):
+        tags = set(resource.get('tags') or [])
+        wanted = set(t for v in values for t in v.split(','))
+        return bool(tags & wanted) if any_tag else wanted <= tags
+    return match
+
+
+def fixed_ips_filter(resource, values):
+    for value in values:
+        key, _, wanted = value.partition('=')
+        if not any(ip.get(key) == wanted for ip in resource['fixed_ips']):
+            return False
+    return True
+
+
+class FakeCloud(object):
+    '''Synthetic resources and the HTTP server which serves them.
+
+    Args:
+        page_size: Maximum number of resources per page, like the
+                   max_limit options of OpenStack services.
+        latency: Seconds to wait before answering each request.
+        **scale: Number of projects, servers, ports, networks,
+                 floating_ips, volumes, images, flavors, routers,
+                 load_balancers and users. Defaults to the small preset.
+    '''
+
+    def __init__(self, page_size=1000, latency=0.0, **scale):
+        self.scale = dict(PRESETS['small'], **scale)
+        for name, value in self.scale.items():
+            setattr(self, name, value)
+        # Servers refer to projects, users, flavors and images by index
+        for name in ('projects', 'users', 'flavors', 'images'):
+            setattr(self, name, max(1, getattr(self, name)))
+        self.page_size = page_size
+        self.latency = latency
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.url = None
+        self.project_id = resource_id(1, 0)
+        self.services = self._build_services()
+
+    # Relations between resources
+
+    def _project(self, index):
+        return resource_id(1, index % self.projects)
+
+    def _network_of_server(self, index):
+        # Network 0 is the external network
+        return 1 + index % max(1, self.networks - 1)
+
+    def _floating_ip_step(self):
+        return max(1, self.servers // max(1, self.floating_ips))
+
+    def _server_floating_ip(self, index):
+        step = self._floating_ip_step()
+        if index % step == 0 and index // step < self.floating_ips:
+            return index // step
+        return None
+
+    # Resources
+
+    def _make_project(self, i):
+        return dict(id=resource_id(1, i),
+                    name='admin' if i == 0 else 'project-%05d' % i,
+                    domain_id='default', description='', enabled=True,
+                    is_domain=False, parent_id='default', tags=[])
+
+    def _make_user(self, i):
+        return dict(id=resource_id(2, i),
+                    name='admin' if i == 0 else 'user-%05d' % i,
+                    domain_id='default', enabled=True,
+                    default_project_id=self._project(i), email=None)
+
+    def _make_flavor(self, i):
+        return dict(id=resource_id(3, i), name='flavor-%02d' % i,
+                    vcpus=2 ** (i % 4), ram=1024 * 2 ** (i % 5),
+                    disk=10 * (1 + i % 8), swap='', ephemeral=0,
+                    rxtx_factor=1.0, description=None,
+                    extra_specs={}, links=[])
+
+    def _make_server(self, i):
+        flavor = self._make_flavor(i % self.flavors)
+        network = self._network_of_server(i)
+        addresses = [{
+            'addr': ip_address('10', i), 'version': 4,
+            'OS-EXT-IPS:type': 'fixed',
+            'OS-EXT-IPS-MAC:mac_addr': 'fa:16:3e:%02x:%02x:%02x' % (
+                i >> 16 & 255, i >> 8 & 255, i & 255)}]
+        floating_ip = self._server_floating_ip(i)
+        if floating_ip is not None:
+            addresses.append({
+                'addr': ip_address('172', floating_ip), 'version': 4,
+                'OS-EXT-IPS:type': 'floating',
+                'OS-EXT-IPS-MAC:mac_addr': addresses[0][
+                    'OS-EXT-IPS-MAC:mac_addr']})
+        boot_from_volume = i % 20 == 19
+        volumes = [dict(id=resource_id(8, i), delete_on_termination=False)
+                   if i < self.volumes else None]
+        return {
+            'id': resource_id(4, i),
+            'name': 'server-%05d' % i,
+            'status': 'SHUTOFF' if i % 50 == 49 else 'ACTIVE',
+            'tenant_id': self._project(i),
+            'user_id': resource_id(2, i % self.users),
+            'flavor': dict(original_name=flavor['name'],
+                           vcpus=flavor['vcpus'], ram=flavor['ram'],
+                           disk=flavor['disk'], ephemeral=0, swap=0,
+                           extra_specs={}),
+            'image': '' if boot_from_volume else dict(
+                id=resource_id(9, i % self.images), links=[]),
+            'addresses': {'net-%05d' % network: addresses},
+            'metadata': dict(group='group-%d' % (i % 10)),
+            'tags': ['tier-%d' % (i % 3)],
+            'key_name': 'key-%d' % (i % 5),
+            'created': TIMESTAMP,
+            'updated': TIMESTAMP,
+            'hostId': '%056x' % (i % 100),
+            'accessIPv4': '', 'accessIPv6': '',
+            'config_drive': '', 'locked': False, 'description': None,
+            'progress': 0, 'links': [],
+            'security_groups': [dict(name='default')],
+            'os-extended-volumes:volumes_attached': [
+                v for v in volumes if v],
+            'OS-EXT-AZ:availability_zone': 'az-%d' % (i % 3),
+            'OS-EXT-STS:vm_state': 'stopped' if i % 50 == 49 else 'active',
+            'OS-EXT-STS:power_state': 4 if i % 50 == 49 else 1,
+            'OS-EXT-STS:task_state': None,
+            'OS-EXT-SRV-ATTR:host': 'compute-%03d' % (i % 100),
+            'OS-EXT-SRV-ATTR:hypervisor_hostname': 'compute-%03d' % (i % 100),
+            'OS-DCF:diskConfig': 'MANUAL',
+            'OS-SRV-USG:launched_at': TIMESTAMP,
+            'OS-SRV-USG:terminated_at': None,
+        }
+
+    def _make_network(self, i):
+        return {
+            'id': resource_id(5, i),
+            'name': 'public' if i == 0 else 'net-%05d' % i,
+            'project_id': self._project(i), 'tenant_id': self._project(i),
+            'router:external': i == 0, 'shared': i == 0,
+            'status': 'ACTIVE', 'admin_state_up': True, 'mtu': 1450,
+            'subnets': [resource_id(6, i)], 'tags': [],
+            'availability_zones': ['nova'], 'port_security_enabled': True,
+            'provider:network_type': 'flat' if i == 0 else 'vxlan',
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'description': '', 'revision_number': 1,
+        }
+
+    def _make_subnet(self, i):
+        prefix = '172' if i == 0 else '10'
+        return {
+            'id': resource_id(6, i), 'name': 'subnet-%05d' % i,
+            'network_id': resource_id(5, i),
+            'project_id': self._project(i), 'tenant_id': self._project(i),
+            'ip_version': 4, 'enable_dhcp': i != 0,
+            'cidr': '%s.%d.%d.0/24' % (prefix, i // 256 % 256, i % 256),
+            'gateway_ip': '%s.%d.%d.1' % (prefix, i // 256 % 256, i % 256),
+            'allocation_pools': [], 'dns_nameservers': [], 'host_routes': [],
+            'tags': [], 'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'description': '', 'revision_number': 1,
+        }
+
+    def _make_port(self, i):
+        # The first ports belong to servers, the others are unbound
+        if i < self.servers:
+            network = self._network_of_server(i)
+            device_id, device_owner = resource_id(4, i), 'compute:nova'
+            project = self._project(i)
+            address = ip_address('10', i)
+        else:
+            network = 1 + i % max(1, self.networks - 1)
+            device_id, device_owner = '', ''
+            project = self._project(network)
+            address = ip_address('11', i)
+        return {
+            'id': resource_id(7, i), 'name': '',
+            'network_id': resource_id(5, network),
+            'project_id': project, 'tenant_id': project,
+            'device_id': device_id, 'device_owner': device_owner,
+            'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+                i >> 16 & 255, i >> 8 & 255, i & 255),
+            'fixed_ips': [dict(subnet_id=resource_id(6, network),
+                               ip_address=address)],
+            'status': 'ACTIVE' if device_id else 'DOWN',
+            'admin_state_up': True, 'security_groups': [
+                resource_id(11, parse_id(1, project))],
+            'allowed_address_pairs': [], 'extra_dhcp_opts': [],
+            'binding:vnic_type': 'normal', 'port_security_enabled': True,
+            'dns_name': '', 'dns_assignment': [], 'tags': [],
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'description': '', 'revision_number': 1,
+        }
+
+    def _make_floating_ip(self, i):
+        server = i * self._floating_ip_step()
+        attached = server < self.servers
+        return {
+            'id': resource_id(10, i),
+            'floating_ip_address': ip_address('172', i),
+            'floating_network_id': resource_id(5, 0),
+            'fixed_ip_address': ip_address('10', server) if attached else None,
+            'port_id': resource_id(7, server) if attached else None,
+            'router_id': resource_id(12, 0) if attached else None,
+            'project_id': self._project(server),
+            'tenant_id': self._project(server),
+            'status': 'ACTIVE' if attached else 'DOWN',
+            'description': '', 'tags': [], 'dns_name': '', 'dns_domain': '',
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'revision_number': 1,
+        }
+
+    def _make_security_group(self, i):
+        return {
+            'id': resource_id(11, i), 'name': 'default',
+            'project_id': self._project(i), 'tenant_id': self._project(i),
+            'description': 'Default security group', 'stateful': True,
+            'security_group_rules': [], 'tags': [],
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'revision_number': 1,
+        }
+
+    def _make_router(self, i):
+        return {
+            'id': resource_id(12, i), 'name': 'router-%05d' % i,
+            'project_id': self._project(i), 'tenant_id': self._project(i),
+            'status': 'ACTIVE', 'admin_state_up': True,
+            'external_gateway_info': dict(
+                network_id=resource_id(5, 0), enable_snat=True,
+                external_fixed_ips=[]),
+            'routes': [], 'availability_zones': ['nova'], 'tags': [],
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+            'description': '', 'revision_number': 1,
+        }
+
+    def _make_volume(self, i):
+        attachments = []
+        if i < self.servers:
+            attachments.append(dict(
+                id=resource_id(8, i), attachment_id=resource_id(13, i),
+                volume_id=resource_id(8, i), server_id=resource_id(4, i),
+                host_name='compute-%03d' % (i % 100), device='/dev/vdb',
+                attached_at=TIMESTAMP))
+        return {
+            'id': resource_id(8, i), 'name': 'volume-%05d' % i,
+            'description': None, 'size': 1 + i % 100,
+            'status': 'in-use' if attachments else 'available',
+            'attachments': attachments, 'availability_zone': 'nova',
+            'bootable': 'false', 'encrypted': False, 'multiattach': False,
+            'volume_type': '__DEFAULT__', 'snapshot_id': None,
+            'source_volid': None, 'metadata': {}, 'links': [],
+            'user_id': resource_id(2, i % self.users),
+            'os-vol-tenant-attr:tenant_id': self._project(i),
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+        }
+
+    def _make_image(self, i):
+        return {
+            'id': resource_id(9, i), 'name': 'image-%03d' % i,
+            'status': 'active', 'visibility': 'public', 'owner':
+            self.project_id, 'disk_format': 'qcow2',
+            'container_format': 'bare', 'size': 1024 ** 3,
+            'virtual_size': None, 'min_disk': 0, 'min_ram': 0,
+            'checksum': '%032x' % i, 'protected': False, 'tags': [],
+            'os_hidden': False, 'created_at': TIMESTAMP,
+            'updated_at': TIMESTAMP, 'file': '/v2/images/%s/file' % (
+                resource_id(9, i)),
+            'self': '/v2/images/%s' % resource_id(9, i),
+            'schema': '/v2/schemas/image',
+        }
+
+    def _make_load_balancer(self, i):
+        return {
+            'id': resource_id(14, i), 'name': 'lb-%05d' % i,
+            'project_id': self._project(i), 'description': '',
+            'provisioning_status': 'ACTIVE', 'operating_status': 'ONLINE',
+            'admin_state_up': True, 'provider': 'amphora',
+            'vip_address': ip_address('10', i),
+            'vip_network_id': resource_id(5, 1 + i % max(1, self.networks - 1)),
+            'vip_subnet_id': resource_id(6, 1 + i % max(1, self.networks - 1)),
+            'vip_port_id': resource_id(7, i), 'flavor_id': None,
+            'listeners': [dict(id=resource_id(15, i))],
+            'pools': [dict(id=resource_id(16, i))], 'tags': [],
+            'availability_zone': None, 'created_at': TIMESTAMP,
+            'updated_at': TIMESTAMP,
+        }
+
+    def _make_listener(self, i):
+        return {
+            'id': resource_id(15, i), 'name': 'listener-%05d' % i,
+            'project_id': self._project(i), 'protocol': 'HTTP',
+            'protocol_port': 80, 'provisioning_status': 'ACTIVE',
+            'operating_status': 'ONLINE', 'admin_state_up': True,
+            'loadbalancers': [dict(id=resource_id(14, i))],
+            'default_pool_id': resource_id(16, i), 'tags': [],
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+        }
+
+    def _make_pool(self, i):
+        return {
+            'id': resource_id(16, i), 'name': 'pool-%05d' % i,
+            'project_id': self._project(i), 'protocol': 'HTTP',
+            'lb_algorithm': 'ROUND_ROBIN', 'provisioning_status': 'ACTIVE',
+            'operating_status': 'ONLINE', 'admin_state_up': True,
+            'loadbalancers': [dict(id=resource_id(14, i))],
+            'listeners': [dict(id=resource_id(15, i))], 'members': [],
+            'healthmonitor_id': None, 'tags': [],
+            'created_at': TIMESTAMP, 'updated_at': TIMESTAMP,
+        }
+
+    def _build_services(self):
+        def collection(*args, **kwargs):
+            c = Collection(*args, **kwargs)
+            return c.name, c
+
+        server_filters = {
+            'name': regex_filter('name'),
+            'project_id': equal_filter('tenant_id'),
+            'tenant_id': equal_filter('tenant_id'),
+            'availability_zone': equal_filter('OS-EXT-AZ:availability_zone'),
+            'tags': tags_filter(False),
+            'tags-any': tags_filter(True),
+            'ip': lambda server, values: any(
+                re.search(v, a['addr']) for v in values
+                for addrs in server['addresses'].values() for a in addrs),
+        }
+        volume_filters = {
+            'project_id': equal_filter('os-vol-tenant-attr:tenant_id'),
+        }
+        neutron_filters = {
+            'tags': tags_filter(False),
+            'tags-any': tags_filter(True),
+            'fixed_ips': fixed_ips_filter,
+            'router:external': lambda network, values: str(
+                network.get('router:external')).lower() in [
+                    v.lower() for v in values],
+        }
+        image_filters = {
+            'tag': lambda image, values: set(values) <= set(image['tags']),
+        }
+        return dict(
+            identity=dict([
+                collection('projects', 'project', 1, self.projects,
+                           self._make_project),
+                collection('users', 'user', 2, self.users, self._make_user),
+            ]),
+            compute=dict([
+                collection('servers', 'server', 4, self.servers,
+                           self._make_server, project_key='tenant_id',
+                           filters=server_filters),
+                collection('flavors', 'flavor', 3, self.flavors,
+                           self._make_flavor),
+            ]),
+            network=dict([
+                collection('networks', 'network', 5, self.networks,
+                           self._make_network, filters=neutron_filters),
+                collection('subnets', 'subnet', 6, self.networks,
+                           self._make_subnet, filters=neutron_filters),
+                collection('ports', 'port', 7,
+                           max(self.ports, self.servers), self._make_port,
+                           filters=neutron_filters),
+                collection('floatingips', 'floatingip', 10,
+                           self.floating_ips, self._make_floating_ip,
+                           filters=neutron_filters),
+                collection('security-groups', 'security_group', 11,
+                           self.projects, self._make_security_group,
+                           filters=neutron_filters, key='security_groups'),
+                collection('routers', 'router', 12, self.routers,
+                           self._make_router, filters=neutron_filters),
+            ]),
+            volume=dict([
+                collection('volumes', 'volume', 8, self.volumes,
+                           self._make_volume,
+                           project_key='os-vol-tenant-attr:tenant_id',
+                           filters=volume_filters),
+            ]),
+            image=dict([
+                collection('images', 'image', 9, self.images,
+                           self._make_image, filters=image_filters),
+            ]),
+            **{'load-balancer': dict([
+                collection('loadbalancers', 'loadbalancer', 14,
+                           self.load_balancers, self._make_load_balancer),
+                collection('listeners', 'listener', 15, self.load_balancers,
+                           self._make_listener),
+                collection('pools', 'pool', 16, self.load_balancers,
+                           self._make_pool),
+            ])}
+        )
+
+    # Service catalog and version discovery
+
+    def token(self):
+        def endpoint(service_type, path):
+            return dict(id=service_type, interface='public', region='RegionOne',
+                        region_id='RegionOne', url=self.url + path)
+
+        catalog = [
+            ('identity', '/identity/v3'),
+            ('compute', '/compute/v2.1'),
+            ('network', '/network'),
+            ('image', '/image'),
+            ('block-storage', '/volume/v3/' + self.project_id),
+            ('volumev3', '/volume/v3/' + self.project_id),
+            ('volume', '/volume/v3/' + self.project_id),
+            ('load-balancer', '/load-balancer'),
+        ]
+        expires = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        return dict(token=dict(
+            methods=['password'], expires_at=expires.strftime(
+                '%Y-%m-%dT%H:%M:%S.000000Z'),
+            issued_at=TIMESTAMP.replace('Z', '.000000Z'),
+            user=dict(id=resource_id(2, 0), name='admin',
+                      domain=dict(id='default', name='Default')),
+            project=dict(id=self.project_id, name='admin',
+                         domain=dict(id='default', name='Default')),
+            roles=[dict(id='admin', name='admin')],
+            catalog=[dict(type=service_type, name=service_type,
+                          id=service_type,
+                          endpoints=[endpoint(service_type, path)])
+                     for service_type, path in catalog]))
+
+    def versions(self, service):
+        def version(id, path, status='CURRENT', **kwargs):
+            return dict(id=id, status=status, updated=TIMESTAMP, links=[
+                dict(rel='self', href=self.url + path)], **kwargs)
+
+        return dict(
+            identity=version('v3.14', '/identity/v3/', status='stable'),
+            compute=version('v2.1', '/compute/v2.1/', version='2.96',
+                            min_version='2.1'),
+            network=version('v2.0', '/network/v2.0/'),
+            image=version('v2.16', '/image/v2/'),
+            volume=version('v3.0', '/volume/v3/', version='3.70',
+                           min_version='3.0'),
+            **{'load-balancer': version('v2.0', '/load-balancer/v2/')}
+        )[service]
+
+    # Requests
+
+    def handle(self, method, path, params, body):
+        '''Return the status and body of the response to a request.'''
+        segments = [s for s in path.split('/') if s]
+        if not segments or segments[0] not in self.services:
+            return 404, dict(error='Unknown service')
+        service, segments = segments[0], segments[1:]
+        with self.lock:
+            self.requests[service] += 1
+
+        # Version discovery
+        if not segments:
+            version = self.versions(service)
+            if service == 'identity':
+                return 300, dict(versions=dict(values=[version]))
+            return 300, dict(versions=[version])
+        if re.match(r'^v[0-9.]+$', segments[0]):
+            segments = segments[1:]
+            if service == 'volume' and segments and parse_id(1, segments[0]) \
+                    is not None:
+                segments = segments[1:]
+            if service == 'load-balancer' and segments[:1] == ['lbaas']:
+                segments = segments[1:]
+            if not segments:
+                return 200, dict(version=self.versions(service))
+
+        if service == 'identity' and segments == ['auth', 'tokens']:
+            if method == 'POST':
+                return 201, self.token()
+            return 200, self.token()
+        if service == 'network' and segments == ['extensions']:
+            return 200, dict(extensions=[
+                dict(alias=alias, name=alias, description='', links=[],
+                     updated=TIMESTAMP) for alias in (
+                    'agent', 'allowed-address-pairs', 'binding',
+                    'dns-integration', 'external-net', 'extraroute',
+                    'port-security', 'quotas', 'router', 'security-group',
+                    'standard-attr-tag', 'subnet_allocation')])
+        if service == 'compute' and len(segments) == 3 and (
+                segments[0] == 'servers'):
+            return self._server_subresource(method, segments[1], segments[2])
+
+        collections = self.services.get(service, {})
+        collection = collections.get(segments[0])
+        if collection is None:
+            return 404, dict(error='Unknown resource %s' % segments[0])
+        if len(segments) == 1 or segments[1:] == ['detail']:
+            if method == 'POST':
+                attributes = (body or {}).get(collection.singular) or {}
+                return 201, {collection.singular: collection.create(
+                    attributes)}
+            return self._list(service, path, collection, params)
+        if len(segments) == 2:
+            id = segments[1]
+            if method == 'GET':
+                resource = collection.find(id)
+            elif method in ('PUT', 'PATCH'):
+                resource = collection.update(
+                    id, (body or {}).get(collection.singular) or {})
+            elif method == 'DELETE':
+                if collection.delete(id):
+                    return 204, None
+                resource = None
+            else:
+                return 405, dict(error='Method not allowed')
+            if resource is None:
+                return 404, dict(itemNotFound=dict(
+                    code=404, message='%s %s could not be found.' % (
+                        collection.singular, id)))
+            if service == 'image':
+                return 200, resource
+            return 200, {collection.singular: resource}
+        return 404, dict(error='Unknown path %s' % path)
+
+    def _list(self, service, path, collection, params):
+        project_id = None
+        if collection.project_key and not params.get('all_tenants'):
+            project_id = self.project_id
+        try:
+            page, marker = collection.list(params, project_id, self.page_size)
+        except LookupError as e:
+            return 400, dict(badRequest=dict(code=400, message=str(e)))
+
+        data = {collection.key: page}
+        if marker:
+            query = dict((k, v[-1]) for k, v in params.items())
+            query.update(marker=marker, limit=len(page))
+            if service == 'image':
+                data['next'] = '/v2/%s?%s' % (collection.name,
+                                              urlencode(query))
+            else:
+                data[collection.key + '_links'] = [dict(
+                    rel='next', href='%s%s?%s' % (
+                        self.url, path, urlencode(query)))]
+        if service == 'image':
+            data.update(first='/v2/images', schema='/v2/schemas/images')
+        return 200, data
+
+    def _server_subresource(self, method, server_id, name):
+        server = self.services['compute']['servers'].find(server_id)
+        if server is None:
+            return 404, dict(itemNotFound=dict(
+                code=404, message='Instance %s could not be found.' % (
+                    server_id)))
+        index = parse_id(4, server_id)
+        if name == 'os-security-groups':
+            return 200, dict(security_groups=[self._make_security_group(
+                parse_id(1, server['tenant_id']))])
+        if name == 'os-volume_attachments':
+            return 200, dict(volumeAttachments=[
+                dict(id=v['id'], volumeId=v['id'], serverId=server_id,
+                     device='/dev/vdb')
+                for v in server['os-extended-volumes:volumes_attached']])
+        if name == 'os-interface':
+            port = self._make_port(index)
+            return 200, dict(interfaceAttachments=[dict(
+                port_id=port['id'], net_id=port['network_id'],
+                mac_addr=port['mac_address'], port_state='ACTIVE',
+                fixed_ips=port['fixed_ips'])])
+        if name == 'action' and method == 'POST':
+            return 202, None
+        if name == 'metadata':
+            return 200, dict(metadata=server['metadata'])
+        return 404, dict(error='Unknown server resource %s' % name)
+
+    # HTTP server
+
+    def start(self, host='127.0.0.1', port=0):
+        '''Serve the cloud in a background thread.'''
+        cloud = self
+
+        class Handler(RequestHandler):
+            pass
+        Handler.cloud = cloud
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://%s:%d' % self.server.server_address[:2]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def change_servers(self, count):
+        '''Update and delete servers spread over the cloud, like users do
+        between two inventory runs.'''
+        servers = self.services['compute']['servers']
+        step = max(1, servers.size // max(1, count))
+        for i, index in enumerate(range(0, servers.size, step)[:count]):
+            if i % 2:
+                servers.delete(servers.id(index))
+            else:
+                servers.update(servers.id(index), dict(status='SHUTOFF'))
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def cloud_config(self):
+        '''Return a clouds.yaml entry for this cloud.'''
+        return dict(
+            auth_type='password',
+            auth=dict(auth_url=self.url + '/identity/v3', username='admin',
+                      password='secret', project_name='admin',
+                      user_domain_name='Default',
+                      project_domain_name='Default'),
+            region_name='RegionOne', identity_api_version='3')
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    cloud = None
+    protocol_version = 'HTTP/1.1'
+    # Send responses immediately instead of waiting for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            body = None
+        if self.cloud.latency:
+            time.sleep(self.cloud.latency)
+        status, data = self.cloud.handle(
+            method, parsed.path, parse_qs(parsed.query), body)
+
+        content = json.dumps(data).encode('utf-8') if data is not None \
+            else b''
+        with self.cloud.lock:
+            self.cloud.bytes_sent += len(content)
+        self.send_response(status)
+        if status == 201 and parsed.path.endswith('/auth/tokens'):
+            self.send_header('X-Subject-Token', 'fake-token')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+def add_arguments(parser):
+    '''Add options for the scale of a FakeCloud to an argument parser.'''
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small',
+                        help='Number of resources (default: %(default)s)')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='Maximum resources per page '
+                             '(default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before each response')
+    for name in PRESETS['small']:
+        parser.add_argument('--' + name.replace('_', '-'), type=int,
+                            help='Number of %s, overrides the preset' % (
+                                name.replace('_', ' ')))
+
+
+def from_options(options):
+    '''Return a FakeCloud for options added with add_arguments.'''
+    scale = dict(PRESETS[options.preset])
+    scale.update((name, getattr(options, name)) for name in scale
+                 if getattr(options, name) is not None)
+    return FakeCloud(page_size=options.page_size, latency=options.latency,
+                     **scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    cloud = from_options(options)
+    cloud.start(options.host, options.port)
+    print(json.dumps(dict(clouds=dict(fake=cloud.cloud_config())), indent=2))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        cloud.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Benchmark the memory the inventory plugin needs to build an inventory.
+
+A FakeCloud, see fakecloud.py, is started in this process and the plugin
+parses an inventory of it in a new interpreter, without a cache. Reports how
+much the resident memory of that interpreter grew at its peak and after
+parsing, i.e. what the inventory retains. With --tracemalloc, the peak and
+retained memory of Python objects are reported as well, which is more
+precise but several times slower.
+
+Run from the directory containing ansible_collections/:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.memory \\
+        --preset large --servers 10000
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ansible_collections.openstack.cloud.tests.benchmarks import fakecloud
+from ansible_collections.openstack.cloud.tests.benchmarks import populate
+
+
+def memory_status(key):
+    '''Return a memory value of /proc/self/status in MiB or None.'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def reset_peak_memory():
+    '''Reset the peak resident memory of this process, see proc(5).'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def benchmark(options):
+    '''Parse an inventory and print its memory statistics as JSON.'''
+    import tracemalloc
+
+    from ansible.inventory.data import InventoryData
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.plugins.loader import inventory_loader
+
+    plugin = inventory_loader.get('openstack.cloud.openstack')
+    base = memory_status('VmRSS')
+    peak_reset = reset_peak_memory()
+    if options['tracemalloc']:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    plugin.parse(InventoryData(), DataLoader(), options['path'], cache=False)
+    elapsed = time.perf_counter() - start
+
+    result = dict(time=elapsed, hosts=len(plugin.inventory.hosts))
+    if base is not None:
+        result['retained_mb'] = memory_status('VmRSS') - base
+        if peak_reset:
+            result['peak_mb'] = memory_status('VmHWM') - base
+    if options['tracemalloc']:
+        current, peak = tracemalloc.get_traced_memory()
+        result.update(traced_retained_mb=current / (1024.0 * 1024),
+                      traced_peak_mb=peak / (1024.0 * 1024))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    fakecloud.add_arguments(parser)
+    parser.add_argument('--inventory', type=json.loads, default={},
+                        help='Options of the inventory plugin as JSON, e.g. '
+                             '\'{"expand_hostvars": true}\'')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Trace memory of Python objects')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    cloud = fakecloud.from_options(options).start()
+    workdir = tempfile.mkdtemp(prefix='openstack-memory-')
+    try:
+        clouds_yaml = os.path.join(workdir, 'clouds.yaml')
+        with open(clouds_yaml, 'w') as f:
+            json.dump(dict(clouds=dict(fake=cloud.cloud_config())), f)
+        path = os.path.join(workdir, 'openstack.yml')
+        config = dict(all_projects=True)
+        config.update(options.inventory)
+        config.update(plugin='openstack.cloud.openstack', only_clouds=['fake'])
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        child_options = dict(path=path, tracemalloc=options.tracemalloc)
+        proc = subprocess.run(
+            [sys.executable, '-c',
+             populate.CHILD % dict(path=populate.COLLECTIONS_PATH,
+                                   module='memory', options=child_options)],
+            stdout=subprocess.PIPE, check=True,
+            env=dict(os.environ, OS_CLIENT_CONFIG_FILE=clouds_yaml))
+    finally:
+        cloud.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    result = json.loads(proc.stdout.decode('utf-8').splitlines()[-1])
+
+    if options.json:
+        print(json.dumps(dict(scale=cloud.scale, result=result), indent=2))
+    else:
+        print('%d hosts %8.3fs  peak %s MiB  retained %s MiB%s' % (
+            result['hosts'], result['time'],
+            '%+.1f' % result['peak_mb'] if 'peak_mb' in result else '-',
+            '%+.1f' % result['retained_mb']
+            if 'retained_mb' in result else '-',
+            '  traced peak %.1f MiB retained %.1f MiB' % (
+                result['traced_peak_mb'], result['traced_retained_mb'])
+            if options.tracemalloc else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
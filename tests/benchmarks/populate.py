@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Benchmark how the inventory plugin turns servers into hosts and groups.
+
+Servers are generated like openstacksdk returns them for a FakeCloud, see
+fakecloud.py, so no cloud is contacted and only the CPU time of building the
+inventory is measured, i.e. host variables, legacy groups and the compose,
+groups and keyed_groups options. Also reports the size of all host variables
+as JSON and pickle, which Ansible sends to workers, and how much the resident
+memory grew while populating.
+
+Run from the directory containing ansible_collections/:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.populate \\
+        --servers 30000
+'''
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+from ansible_collections.openstack.cloud.tests.benchmarks import fakecloud
+
+# Directory which contains ansible_collections/
+COLLECTIONS_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', '..', '..'))
+
+CONSTRUCTED = dict(
+    compose=dict(ansible_user="'cloud-user'", zone='openstack.az'),
+    groups=dict(active="openstack.status == 'ACTIVE'"),
+    keyed_groups=[dict(key='openstack.metadata.group', prefix='meta'),
+                  dict(key='openstack.flavor.name', prefix='flavor')],
+)
+
+
+# The collection loader, which importing ansible.plugins.loader sets up,
+# cannot load ansible_collections once it has been imported as a regular
+# package, so the benchmark runs in a new interpreter
+CHILD = '''
+try:
+    from ansible.plugins.loader import init_plugin_loader
+except ImportError:
+    # ansible-core < 2.15
+    from ansible.utils.collection_loader._collection_finder import (
+        _AnsibleCollectionFinder)
+    _AnsibleCollectionFinder(paths=[%(path)r])._install()
+else:
+    init_plugin_loader([%(path)r])
+
+from ansible_collections.openstack.cloud.tests.benchmarks import %(module)s
+%(module)s.benchmark(%(options)r)
+'''
+
+
+def synthetic_servers(cloud, count, clouds=1):
+    '''Return servers with the keys which openstacksdk adds to them.'''
+    servers = []
+    for i in range(count):
+        server = cloud._make_server(i)
+        addresses = list(server['addresses'].values())[0]
+        floating = [a['addr'] for a in addresses
+                    if a['OS-EXT-IPS:type'] == 'floating']
+        server.update(
+            cloud='cloud-%d' % (i % clouds), region='RegionOne',
+            az=server['OS-EXT-AZ:availability_zone'],
+            public_v4=floating[0] if floating else '', public_v6='',
+            private_v4=addresses[0]['addr'],
+            interface_ip=floating[0] if floating else addresses[0]['addr'],
+            flavor=dict(server['flavor'],
+                        name=server['flavor']['original_name']),
+            image=dict(id=server['image']['id'], name='image-%d' % (
+                fakecloud.parse_id(9, server['image']['id'])))
+            if server['image'] else dict(id=''),
+            volumes=[], project_id=server['tenant_id'])
+        servers.append(server)
+    return servers
+
+
+def resident_memory():
+    '''Return the resident memory of this process in MiB or None.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf(
+                'SC_PAGE_SIZE') / (1024.0 * 1024)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def run(servers, config):
+    '''Populate a new inventory and return its statistics.'''
+    from ansible.inventory.data import InventoryData
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.plugins.loader import inventory_loader
+    from ansible.template import Templar
+
+    plugin = inventory_loader.get('openstack.cloud.openstack')
+    loader = DataLoader()
+    plugin.inventory = InventoryData()
+    plugin.loader = loader
+    plugin.templar = Templar(loader=loader)
+    plugin._config_data = config
+    plugin.set_options(direct=dict(plugin='openstack.cloud.openstack'))
+    plugin.use_names = False
+
+    memory = resident_memory()
+    start = time.perf_counter()
+    plugin._populate_from_source(servers)
+    elapsed = time.perf_counter() - start
+    if memory is not None:
+        memory = resident_memory() - memory
+    hostvars = dict((name, host.vars)
+                    for name, host in plugin.inventory.hosts.items())
+    return dict(time=elapsed, hosts=len(plugin.inventory.hosts),
+                groups=len(plugin.inventory.groups), memory_mb=memory,
+                hostvars_json=len(json.dumps(hostvars, default=str)),
+                hostvars_pickle=len(pickle.dumps(hostvars)))
+
+
+def benchmark(options):
+    '''Print statistics of populating inventories as JSON.'''
+    cloud = fakecloud.FakeCloud(
+        **dict(fakecloud.PRESETS['large'], servers=options['servers']))
+    servers = synthetic_servers(cloud, options['servers'], options['clouds'])
+    config = dict(plugin='openstack.cloud.openstack')
+    if options['constructed']:
+        config.update(CONSTRUCTED)
+    if options['hostvar_fields']:
+        config['hostvar_fields'] = options['hostvar_fields']
+    print(json.dumps([run(servers, config) for i in range(options['runs'])]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--servers', type=int, default=30000,
+                        help='Number of servers (default: %(default)s)')
+    parser.add_argument('--clouds', type=int, default=1,
+                        help='Number of clouds the servers are spread over '
+                             '(default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs (default: %(default)s)')
+    parser.add_argument('--no-constructed', action='store_true',
+                        help='Do not configure compose, groups and '
+                             'keyed_groups')
+    parser.add_argument('--hostvar-field', action='append', default=[],
+                        help='Only keep this field in the openstack host '
+                             'variable, may be given multiple times')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    child_options = dict(servers=options.servers, clouds=options.clouds,
+                         runs=options.runs,
+                         constructed=not options.no_constructed,
+                         hostvar_fields=options.hostvar_field)
+    proc = subprocess.run(
+        [sys.executable, '-c',
+         CHILD % dict(path=COLLECTIONS_PATH, module='populate',
+                      options=child_options)],
+        stdout=subprocess.PIPE, check=True)
+    results = json.loads(proc.stdout.decode('utf-8').splitlines()[-1])
+
+    if options.json:
+        print(json.dumps(dict(servers=options.servers, runs=results),
+                         indent=2))
+    else:
+        for r in results:
+            print('%d hosts %d groups %8.3fs %6.1f us/host  hostvars '
+                  '%8.1f KiB JSON %8.1f KiB pickle  %s MiB' % (
+                      r['hosts'], r['groups'], r['time'],
+                      r['time'] / max(1, r['hosts']) * 1e6,
+                      r['hostvars_json'] / 1024.0,
+                      r['hostvars_pickle'] / 1024.0,
+                      '%+.1f' % r['memory_mb']
+                      if r['memory_mb'] is not None else '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Benchmark modules against recorded API interactions.
+
+Scenarios are defined in a JSON file, by default scenarios.json next to this
+file, as a list of objects with a `name`, the `module` to run and its module
+`args`. Each scenario has a cassette with the requests and responses of one
+run of the module, see cassette.py.
+
+Record cassettes once against a real cloud from clouds.yaml:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.replay \\
+        --record --cloud mycloud
+
+Afterwards, replay them offline with the recorded latency:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.replay \\
+        --runs 5
+
+Secrets of the cloud config and tokens are not stored in cassettes, but
+response bodies are stored as they are. Review cassettes before sharing them.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = '''
+import importlib
+import json
+import time
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+
+from ansible_collections.openstack.cloud.tests.benchmarks import cassette
+
+options = %(options)s
+recorder = cassette.Cassette(options['cassette'], options['latency_scale'],
+                             options['latency'])
+args = dict(options['args'])
+if options['record']:
+    args['cloud'] = options['cloud']
+    recorder.record()
+else:
+    recorder.load()
+    args['cloud'] = recorder.cloud
+    recorder.replay()
+basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': args}))
+
+start = time.perf_counter()
+module = importlib.import_module(
+    'ansible_collections.openstack.cloud.plugins.modules.' + options['module'])
+imported = time.perf_counter()
+try:
+    module.main()
+finally:
+    end = time.perf_counter()
+    recorder.restore()
+    if options['record']:
+        # openstacksdk has been imported by the module already
+        import openstack.config
+        recorder.cloud = cassette.sanitize_cloud(
+            openstack.config.OpenStackConfig().get_one(
+                cloud=options['cloud']).config)
+        recorder.save()
+    with open(options['stats'], 'w') as f:
+        json.dump(dict(import_time=imported - start, time=end - imported,
+                       requests=dict(recorder.requests),
+                       unmatched=recorder.unmatched), f)
+'''
+
+
+def run(scenario, options):
+    '''Run a scenario in a new interpreter and return its statistics.'''
+    with tempfile.NamedTemporaryFile(suffix='.json') as stats:
+        child_options = dict(
+            module=scenario['module'], args=scenario.get('args', {}),
+            cassette=cassette_path(scenario, options), record=options.record,
+            cloud=options.cloud, latency_scale=options.latency_scale,
+            latency=options.latency, stats=stats.name)
+        proc = subprocess.run(
+            [sys.executable, '-c', CHILD % dict(options=repr(child_options))],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=os.environ.copy(), check=False)
+        try:
+            with open(stats.name) as f:
+                result = json.load(f)
+        except ValueError:
+            raise RuntimeError('Scenario %s failed:\n%s%s' % (
+                scenario['name'], proc.stdout.decode('utf-8'),
+                proc.stderr.decode('utf-8')))
+    try:
+        output = json.loads(proc.stdout.decode('utf-8'))
+    except ValueError:
+        output = dict(failed=True, msg=proc.stderr.decode('utf-8'))
+    result['failed'] = bool(output.get('failed'))
+    result['msg'] = output.get('msg')
+    return result
+
+
+def cassette_path(scenario, options):
+    return os.path.join(options.cassettes, scenario['name'] + '.json')
+
+
+def summarize(scenario, samples):
+    '''Return wall time statistics and request counts of the samples.'''
+    times = [s['time'] for s in samples]
+    requests = samples[-1]['requests']
+    return dict(
+        name=scenario['name'], module=scenario['module'], runs=len(samples),
+        time=dict(min=min(times), median=statistics.median(times),
+                  max=max(times)),
+        import_time=statistics.median(s['import_time'] for s in samples),
+        requests=sum(requests.values()),
+        requests_by_service=requests,
+        unmatched=sorted(set(k for s in samples for k in s['unmatched'])),
+        failed=any(s['failed'] for s in samples),
+        msg=samples[-1]['msg'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenarios',
+                        default=os.path.join(BENCHMARK_DIR, 'scenarios.json'),
+                        help='JSON file with scenarios (default: %(default)s)')
+    parser.add_argument('--cassettes',
+                        default=os.path.join(BENCHMARK_DIR, 'cassettes'),
+                        help='Directory of cassettes (default: %(default)s)')
+    parser.add_argument('--scenario', action='append',
+                        help='Only run the scenario with this name, may be '
+                             'given multiple times')
+    parser.add_argument('--record', action='store_true',
+                        help='Record cassettes against a real cloud')
+    parser.add_argument('--cloud', default=os.environ.get('OS_CLOUD'),
+                        help='Name of the cloud in clouds.yaml to record '
+                             'against (default: $OS_CLOUD)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of replays per scenario '
+                             '(default: %(default)s)')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='Factor for the recorded latency, 0 replays '
+                             'without delay (default: %(default)s)')
+    parser.add_argument('--latency', type=float,
+                        help='Fixed latency of every replayed request in '
+                             'seconds')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    with open(options.scenarios) as f:
+        scenarios = [s for s in json.load(f)
+                     if not options.scenario or s['name'] in options.scenario]
+    if options.record:
+        if not options.cloud:
+            parser.error('--cloud or OS_CLOUD is required for --record')
+        if not os.path.isdir(options.cassettes):
+            os.makedirs(options.cassettes)
+        runs = 1
+    else:
+        runs = options.runs
+
+    results = []
+    for scenario in scenarios:
+        if not options.record and not os.path.exists(
+                cassette_path(scenario, options)):
+            print('Skipping %s: no cassette, record it with --record' % (
+                scenario['name']), file=sys.stderr)
+            continue
+        results.append(summarize(
+            scenario, [run(scenario, options) for i in range(runs)]))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print('%-24s %3d requests  min %.3fs  median %.3fs  max %.3fs%s'
+                  % (result['name'], result['requests'],
+                     result['time']['min'], result['time']['median'],
+                     result['time']['max'],
+                     '  FAILED: %s' % result['msg'] if result['failed']
+                     else ''))
+            for key in result['unmatched']:
+                print('    unmatched request %s' % key)
+
+    return 1 if any(r['failed'] or r['unmatched'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Benchmark the inventory plugin and info modules against a large cloud.
+
+A FakeCloud, see fakecloud.py, is started in this process and configured in
+a temporary clouds.yaml. Each scenario runs ansible-inventory or a module in
+a new process and reports its wall time, CPU time, peak memory, the number of
+API requests per service and the bytes the cloud sent.
+
+Run from the directory containing ansible_collections/:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.scale \\
+        --preset large --scenario inventory --scenario server_info
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ansible_collections.openstack.cloud.tests.benchmarks import fakecloud
+
+# Directory which contains ansible_collections/
+COLLECTIONS_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', '..', '..'))
+
+SCENARIOS = [
+    dict(name='inventory', inventory=dict(all_projects=True)),
+    dict(name='inventory_expanded',
+         inventory=dict(all_projects=True, expand_hostvars=True)),
+    # Takes servers from Nova without normalizing them
+    dict(name='inventory_lean',
+         inventory=dict(all_projects=True, fetch_mode='lean')),
+    # Only keeps a few fields of servers in host variables
+    dict(name='inventory_projected',
+         inventory=dict(all_projects=True, hostvar_fields=[
+             'id', 'name', 'status', 'az', 'flavor.name', 'image.name',
+             'metadata'])),
+    # Only lists a third of the servers
+    dict(name='inventory_filtered',
+         inventory=dict(all_projects=True, server_filters=dict(
+             status='ACTIVE', tags_any=['tier-0']))),
+    # Lists the servers of each project concurrently, see inventory_lean
+    dict(name='inventory_sharded',
+         inventory=dict(all_projects=True, fetch_mode='lean',
+                        shard_by_project=True)),
+    # Refreshes a cache from a previous run after servers have changed
+    dict(name='inventory_incremental', warm_up=True, changed_servers=100,
+         inventory=dict(all_projects=True, cache=True,
+                        cache_plugin='jsonfile', incremental_refresh=True)),
+    # Serves hosts of regions whose cache partition has not expired
+    dict(name='inventory_partitioned', warm_up=True, changed_servers=100,
+         inventory=dict(all_projects=True, cache=True,
+                        cache_plugin='jsonfile', cache_timeout=0,
+                        cache_partitions=True)),
+    dict(name='server_info', module='server_info',
+         args=dict(all_projects=True)),
+    dict(name='server_info_detailed', module='server_info',
+         args=dict(all_projects=True, detailed=True)),
+    dict(name='port_info', module='port_info'),
+    dict(name='networks_info', module='networks_info'),
+    dict(name='subnets_info', module='subnets_info'),
+    dict(name='floating_ip_info', module='floating_ip_info'),
+    dict(name='routers_info', module='routers_info'),
+    dict(name='volume_info', module='volume_info',
+         args=dict(all_projects=True)),
+    dict(name='image_info', module='image_info'),
+    dict(name='compute_flavor_info', module='compute_flavor_info'),
+    dict(name='project_info', module='project_info'),
+]
+
+CHILD = '''
+import importlib
+import json
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+
+basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': %(args)s}))
+importlib.import_module(
+    'ansible_collections.openstack.cloud.plugins.modules.%(module)s').main()
+'''
+
+
+def command(scenario, workdir):
+    '''Return the command line of a scenario.'''
+    if 'inventory' in scenario:
+        path = os.path.join(workdir, scenario['name'], 'openstack.yml')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        config = dict(scenario['inventory'],
+                      plugin='openstack.cloud.openstack',
+                      only_clouds=['fake'])
+        if config.get('cache'):
+            config['cache_connection'] = os.path.join(
+                os.path.dirname(path), 'cache')
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        return [shutil.which('ansible-inventory') or 'ansible-inventory',
+                '-i', path, '--list']
+    args = dict(scenario.get('args', {}), cloud='fake')
+    code = CHILD % dict(module=scenario['module'], args=repr(args))
+    return [sys.executable, '-c', code]
+
+
+def peak_memory(pid):
+    '''Return the peak resident memory of a running process in MiB.'''
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def run(scenario, cloud, workdir, env):
+    '''Run a scenario and return its statistics.'''
+    if scenario.get('warm_up'):
+        subprocess.run(command(scenario, workdir), stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env=env, check=False)
+        cloud.change_servers(scenario.get('changed_servers', 0))
+    cloud.reset_counters()
+    output = os.path.join(workdir, scenario['name'] + '.out')
+    with open(output, 'w') as stdout, open(output + '.err', 'w') as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(command(scenario, workdir), stdout=stdout,
+                                stderr=stderr, env=env)
+        peak = None
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            peak = max(peak or 0, peak_memory(proc.pid) or 0) or None
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - start
+        proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                           else 1)
+    if peak is None:
+        # ru_maxrss also counts memory of this process before the child
+        # executed, which makes it less accurate
+        peak = usage.ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin'
+                                  else 1024.0)
+
+    with open(output) as f:
+        try:
+            result = json.load(f)
+        except ValueError:
+            result = {}
+    if 'inventory' in scenario:
+        items = len(result.get('_meta', {}).get('hostvars', {}))
+    else:
+        items = max([len(v) for v in result.values() if isinstance(v, list)]
+                    or [0])
+    failed = proc.returncode != 0 or result.get('failed', False)
+    msg = result.get('msg')
+    if failed and not msg:
+        with open(output + '.err') as f:
+            msg = f.read().strip().splitlines()[-1:]
+    return dict(name=scenario['name'], time=elapsed,
+                cpu_time=usage.ru_utime + usage.ru_stime,
+                peak_memory_mb=peak,
+                requests=sum(cloud.requests.values()),
+                requests_by_service=dict(cloud.requests),
+                bytes_received=cloud.bytes_sent, items=items,
+                failed=failed, msg=msg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    fakecloud.add_arguments(parser)
+    parser.add_argument('--scenario', action='append',
+                        choices=[s['name'] for s in SCENARIOS],
+                        help='Only run this scenario, may be given multiple '
+                             'times')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    cloud = fakecloud.from_options(options).start()
+    workdir = tempfile.mkdtemp(prefix='openstack-scale-')
+    clouds_yaml = os.path.join(workdir, 'clouds.yaml')
+    with open(clouds_yaml, 'w') as f:
+        json.dump(dict(clouds=dict(fake=cloud.cloud_config())), f)
+    env = dict(os.environ, OS_CLIENT_CONFIG_FILE=clouds_yaml,
+               ANSIBLE_COLLECTIONS_PATH=COLLECTIONS_PATH,
+               ANSIBLE_COLLECTIONS_PATHS=COLLECTIONS_PATH,
+               ANSIBLE_INVENTORY_UNPARSED_FAILED='true')
+
+    results = []
+    try:
+        for scenario in SCENARIOS:
+            if options.scenario and scenario['name'] not in options.scenario:
+                continue
+            results.append(run(scenario, cloud, workdir, env))
+    finally:
+        cloud.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if options.json:
+        print(json.dumps(dict(scale=cloud.scale, page_size=cloud.page_size,
+                              results=results), indent=2))
+    else:
+        for r in results:
+            print('%-22s %7d items %6d requests %9.1f KiB %8.3fs '
+                  '%8.3fs CPU %8.1f MiB%s'
+                  % (r['name'], r['items'], r['requests'],
+                     r['bytes_received'] / 1024.0, r['time'], r['cpu_time'],
+                     r['peak_memory_mb'],
+                     '  FAILED: %s' % r['msg'] if r['failed'] else ''))
+    return 1 if any(r['failed'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+'''Measure the startup time of OpenStack modules.
+
+Each sample runs a module in a fresh Python interpreter and measures the
+time from module entry, i.e. before the module and its module_utils are
+imported, to the first HTTP request it sends. The request is intercepted at
+the keystoneauth session, so no cloud is needed.
+
+Run from the directory containing ansible_collections/:
+
+    python -m ansible_collections.openstack.cloud.tests.benchmarks.startup \\
+        --module server_info --runs 20 --threshold 1.5
+
+The command exits with status 1 if the median startup time exceeds the
+threshold, which allows catching regressions in CI.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = '''
+import time
+start = time.perf_counter()
+
+import json
+import os
+import sys
+
+from ansible.module_utils import basic
+from ansible.module_utils._text import to_bytes
+
+basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': %(args)s}))
+
+from keystoneauth1 import session
+
+
+def request(*args, **kwargs):
+    timings['first_request'] = time.perf_counter() - start
+    sys.stdout.write(json.dumps(timings))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+session.Session.request = request
+
+import importlib
+timings = {}
+module = importlib.import_module(
+    'ansible_collections.openstack.cloud.plugins.modules.%(module)s')
+timings['import'] = time.perf_counter() - start
+module.main()
+'''
+
+DEFAULT_ARGS = {
+    '_ansible_remote_tmp': '/tmp',
+    '_ansible_keep_remote_files': False,
+    'cloud': {
+        'auth_type': 'none',
+        'auth': {'endpoint': 'http://127.0.0.1:9/'},
+    },
+}
+
+
+def sample(module, args):
+    '''Run one module in a new interpreter and return its timings.'''
+    code = CHILD % dict(module=module, args=repr(args))
+    proc = subprocess.run([sys.executable, '-c', code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=os.environ.copy(), check=False)
+    try:
+        return json.loads(proc.stdout.decode('utf-8'))
+    except ValueError:
+        raise RuntimeError(
+            'Module %s did not send any request:\n%s%s' % (
+                module, proc.stdout.decode('utf-8'),
+                proc.stderr.decode('utf-8')))
+
+
+def summarize(samples):
+    '''Return min, median and max of every phase of the samples.'''
+    summary = {}
+    for phase in samples[0]:
+        values = [s[phase] for s in samples]
+        summary[phase] = dict(min=min(values),
+                              median=statistics.median(values),
+                              max=max(values))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--module', default='server_info',
+                        help='Module to run (default: %(default)s)')
+    parser.add_argument('--args', type=json.loads, default={},
+                        help='Additional module arguments as JSON')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='Number of samples (default: %(default)s)')
+    parser.add_argument('--threshold', type=float,
+                        help='Fail if the median time to the first request '
+                             'exceeds this many seconds')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    options = parser.parse_args()
+
+    args = dict(DEFAULT_ARGS, **options.args)
+    summary = summarize([sample(options.module, args)
+                         for i in range(options.runs)])
+
+    if options.json:
+        print(json.dumps(dict(module=options.module, runs=options.runs,
+                              timings=summary), indent=2))
+    else:
+        print('%s (%d runs)' % (options.module, options.runs))
+        for phase, values in summary.items():
+            print('  %-14s min %.3fs  median %.3fs  max %.3fs' % (
+                phase, values['min'], values['median'], values['max']))
+
+    median = summary['first_request']['median']
+    if options.threshold is not None and median > options.threshold:
+        print('Median startup time %.3fs exceeds threshold %.3fs' % (
+            median, options.threshold), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
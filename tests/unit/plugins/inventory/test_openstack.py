@@ -19,11 +19,25 @@
 
 # Make coding more python3-ish
 
+import fcntl
+import json
+import threading
+import time
+from urllib.parse import parse_qsl, urlparse
+
 import pytest
+import requests
+
+from keystoneauth1 import noauth
+from keystoneauth1 import session as ksa_session
+from openstack import connection
+from openstack.network.v2 import security_group
 
-from ansible_collections.openstack.cloud.plugins.inventory.openstack import InventoryModule
+from ansible_collections.openstack.cloud.plugins.inventory.openstack import CompactHosts, InventoryModule, InventoryTimings
 from ansible.inventory.data import InventoryData
+from ansible.plugins.loader import inventory_loader
 from ansible.template import Templar
+from ansible.utils.display import Display
 
 
 config_data = {
@@ -55,7 +69,8 @@ hostvars = {
 
 @pytest.fixture(scope="module")
 def inventory():
-    inventory = InventoryModule()
+    inventory = inventory_loader.get('openstack.cloud.openstack')
+    inventory.set_options(direct=config_data)
     inventory._config_data = config_data
     inventory.inventory = InventoryData()
     inventory.templar = Templar(loader=None)
@@ -86,3 +101,618 @@ def test_composed_vars(inventory):
         assert host in inventory.inventory.hosts
         host = inventory.inventory.get_host(host)
         assert host.vars['composed_var'] == 'testvar-{testvar}'.format(**hostvars[host.name])
+
+
+def test_groups_named_like_hosts_are_added_as_child_groups(inventory):
+    inventory._set_variables(hostvars, dict(host0=['host1'],
+                                            cloud=['host0', 'host1']))
+
+    cloud = inventory.inventory.groups['cloud']
+    assert [g.name for g in cloud.child_groups] == ['host0']
+    assert [h.name for h in cloud.hosts] == ['host1']
+
+
+class FakeCloudConfig(object):
+    region_name = 'RegionOne'
+
+    def get_region_name(self, service_type):
+        return self.region_name
+
+
+class FakeCloud(object):
+    def __init__(self, name, servers, delay=0.0, error=None, changes=None):
+        self.name = name
+        self.config = FakeCloudConfig()
+        self.servers = servers
+        self.delay = delay
+        self.error = error
+        self.changes = changes or []
+        self.filters = None
+        self.queries = []
+        self.compute = FakeServerQueries(self)
+
+    def _server(self, id, status='ACTIVE'):
+        return dict(id=id, name=id, status=status, cloud=self.name,
+                    region=self.config.region_name)
+
+    def list_servers(self, detailed=False, all_projects=False, bare=False):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [self._server(s) for s in self.servers]
+
+    def query_servers(self, all_projects, filters):
+        self.filters = filters
+        self.queries.append((all_projects, filters))
+        if 'changes-since' not in filters:
+            return [self._server(s) for s in self.servers]
+        return [self._server(*c) for c in self.changes]
+
+
+class FakeServerQueries(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def servers(self, details=True, all_projects=False, **query):
+        return iter(self.cloud.query_servers(all_projects, query))
+
+
+class FakeIdentity(object):
+    def __init__(self, projects):
+        self._projects = projects
+
+    def projects(self):
+        return iter(self._projects)
+
+
+class FakeRequestsSession(object):
+    def __init__(self):
+        self.hooks = dict(response=[])
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.session = FakeRequestsSession()
+
+
+class FakeCache(dict):
+    written = None
+
+    def update_cache_if_changed(self):
+        self.written = dict(self)
+
+
+@pytest.fixture
+def fetcher():
+    inventory = InventoryModule()
+    inventory._config_data = dict(max_workers=3, cache_lock_timeout=0)
+    inventory.display = Display()
+    return inventory
+
+
+@pytest.fixture
+def fetcher_without_expansion(fetcher):
+    fetcher._expand_servers = lambda cloud, servers, expand: servers
+    return fetcher
+
+
+def test_fetch_hosts_keeps_cloud_order(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    # The first cloud answers last
+    clouds = [FakeCloud('a', ['a1', 'a2'], delay=0.2),
+              FakeCloud('b', ['b1'], delay=0.1),
+              FakeCloud('c', ['c1'])]
+    hosts, synced_at = fetcher._fetch_hosts(
+        clouds, expand=False, fail_on_errors=True, all_projects=False)
+    assert [h['id'] for h in hosts] == ['a1', 'a2', 'b1', 'c1']
+    assert sorted(synced_at) == ['a_RegionOne', 'b_RegionOne', 'c_RegionOne']
+
+
+def test_fetch_hosts_isolates_failing_clouds(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    clouds = [FakeCloud('a', ['a1']),
+              FakeCloud('b', ['b1'], error=RuntimeError('offline')),
+              FakeCloud('c', ['c1'])]
+    hosts, synced_at = fetcher._fetch_hosts(
+        clouds, expand=False, fail_on_errors=False, all_projects=False)
+    assert [h['id'] for h in hosts] == ['a1', 'c1']
+
+    with pytest.raises(RuntimeError):
+        fetcher._fetch_hosts(clouds, expand=False, fail_on_errors=True,
+                             all_projects=False)
+
+
+def test_fetch_hosts_merges_changed_servers(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    clouds = [FakeCloud('a', ['a1', 'a2', 'a3']), FakeCloud('b', ['b1'])]
+    cached_hosts, synced_at = fetcher._fetch_hosts(
+        clouds, expand=False, fail_on_errors=True, all_projects=False)
+
+    # Cloud a has a changed, a deleted and a new server, cloud b has not
+    # been synced yet and is listed completely
+    clouds[0].changes = [('a2', 'SHUTOFF'), ('a3', 'DELETED'), ('a4',)]
+    clouds[1].servers = ['b1', 'b2']
+    synced_at.pop('b_RegionOne')
+    hosts, new_synced_at = fetcher._fetch_hosts(
+        clouds, expand=False, fail_on_errors=True, all_projects=False,
+        cached_hosts=cached_hosts, synced_at=synced_at)
+
+    assert [(h['id'], h['status']) for h in hosts] == [
+        ('a1', 'ACTIVE'), ('a2', 'SHUTOFF'), ('a4', 'ACTIVE'),
+        ('b1', 'ACTIVE'), ('b2', 'ACTIVE')]
+    assert 'changes-since' in clouds[0].filters
+    assert clouds[1].filters is None
+    assert new_synced_at['a_RegionOne'] >= synced_at['a_RegionOne']
+    assert 'b_RegionOne' in new_synced_at
+
+
+def test_fetch_partitions_fetches_expired_partitions(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    clouds = [FakeCloud('a', ['a2']), FakeCloud('b', ['b2']),
+              FakeCloud('c', ['c1'])]
+    fetcher._get_clouds = lambda: clouds
+    fetcher._cache_timeout = 0
+    fetcher._config_data['cache_partition_timeouts'] = dict(b=60)
+    now = time.time()
+    fetcher._cache = FakeCache({
+        'inv_a_RegionOne': dict(source_data=[clouds[0]._server('a1')],
+                                synced_at=dict(a_RegionOne=now - 3600)),
+        'inv_b_RegionOne': dict(source_data=[clouds[1]._server('b1')],
+                                synced_at=dict(b_RegionOne=now - 3600)),
+    })
+
+    hosts = fetcher._fetch_partitions('openstack.yml', 'inv', True, False)
+
+    # Cloud a never expires, cloud b has expired and c was not cached
+    assert [h['id'] for h in hosts] == ['a1', 'b2', 'c1']
+    # Only fetched partitions are written to the cache
+    assert sorted(fetcher._cache.written) == ['inv_b_RegionOne',
+                                              'inv_c_RegionOne']
+    assert [h['id'] for h in fetcher._cache['inv_c_RegionOne']
+            ['source_data']] == ['c1']
+
+
+def test_fetch_partitions_revalidates_stale_partitions(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    clouds = [FakeCloud('a', ['a2']), FakeCloud('b', ['b1'])]
+    fetcher._get_clouds = lambda: clouds
+    fetcher._cache_timeout = 60
+    revalidated = []
+    fetcher._revalidate = lambda *args: revalidated.append(args)
+    synced_at = time.time() - 3600
+    fetcher._cache = FakeCache({
+        'inv_a_RegionOne': dict(source_data=[clouds[0]._server('a1')],
+                                synced_at=dict(a_RegionOne=synced_at)),
+    })
+
+    hosts = fetcher._fetch_partitions('openstack.yml', 'inv', True, False,
+                                      revalidate=True)
+
+    # Stale hosts of cloud a are returned, hosts of b are not cached yet
+    assert [h['id'] for h in hosts] == ['a1', 'b1']
+    assert revalidated == [('openstack.yml', 'inv', synced_at)]
+    assert sorted(fetcher._cache) == ['inv_b_RegionOne']
+
+
+def test_fetch_partitions_reads_partitions_refreshed_meanwhile(fetcher_without_expansion, tmp_path):
+    fetcher = fetcher_without_expansion
+    clouds = [FakeCloud('a', ['a2']), FakeCloud('b', ['b2'])]
+    fetcher._get_clouds = lambda: clouds
+    fetcher._cache_timeout = 60
+    fetcher._config_data['cache_lock_timeout'] = 5
+    fetcher._options['cache_connection'] = str(tmp_path)
+    synced_at = time.time() - 3600
+    fetcher._cache = FakeCache({
+        'inv_a_RegionOne': dict(source_data=[clouds[0]._server('a1')],
+                                synced_at=dict(a_RegionOne=synced_at)),
+        'inv_b_RegionOne': dict(source_data=[clouds[1]._server('b1')],
+                                synced_at=dict(b_RegionOne=synced_at)),
+    })
+    # Another process refreshes cloud a while this one waits
+    fetcher._load_refreshed_cache = lambda: {
+        'inv_a_RegionOne': dict(source_data=[clouds[0]._server('a3')],
+                                synced_at=dict(a_RegionOne=time.time())),
+        'inv_b_RegionOne': dict(source_data=[clouds[1]._server('b1')],
+                                synced_at=dict(b_RegionOne=synced_at)),
+    }
+
+    with open(str(tmp_path / '.inv.lock'), 'a') as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        release = threading.Timer(0.3, fcntl.flock, (other, fcntl.LOCK_UN))
+        release.start()
+        hosts = fetcher._fetch_partitions('openstack.yml', 'inv', True, False)
+        release.join()
+
+    assert [h['id'] for h in hosts] == ['a3', 'b2']
+    assert sorted(fetcher._cache.written) == ['inv_b_RegionOne']
+
+
+def test_refresh_lock_is_released(fetcher, tmp_path):
+    fetcher._config_data['cache_lock_timeout'] = 5
+    fetcher._options['cache_connection'] = str(tmp_path)
+    with fetcher._refresh_lock('inv') as waited:
+        assert not waited
+    with fetcher._refresh_lock('inv') as waited:
+        assert not waited
+    with fetcher._refresh_lock('inv', enabled=False) as waited:
+        assert not waited
+
+
+def test_timings_are_appended_to_timings_file(fetcher_without_expansion, tmp_path):
+    fetcher = fetcher_without_expansion
+    fetcher.inventory = InventoryData()
+    fetcher._timings = InventoryTimings(enabled=True)
+    clouds = [FakeCloud('a', ['a1', 'a2']), FakeCloud('b', ['b1'])]
+    for cloud in clouds:
+        cloud.session = FakeSession()
+    fetcher._fetch_hosts(clouds, expand=False, fail_on_errors=True,
+                         all_projects=False)
+    timings_file = tmp_path / 'timings.json'
+
+    fetcher._report_timings('openstack.yml', str(timings_file))
+    fetcher._report_timings('openstack.yml', str(timings_file))
+
+    runs = [json.loads(line) for line in timings_file.read_text().splitlines()]
+    assert len(runs) == 2
+    assert runs[0]['path'] == 'openstack.yml'
+    assert runs[0]['steps']['fetch'] > 0
+    assert sorted(runs[0]['regions']) == ['a_RegionOne', 'b_RegionOne']
+    region = runs[0]['regions']['a_RegionOne']
+    assert region['servers'] == 2
+    assert region['fetch'] >= region['normalize']
+    # Hooks are removed once the servers have been fetched
+    assert clouds[0].session.session.hooks['response'] == []
+
+
+def test_timings_count_responses():
+    timings = InventoryTimings(enabled=True)
+    cloud = FakeCloud('a', [])
+    cloud.session = FakeSession()
+    with timings.count_requests(cloud, 'a_RegionOne'):
+        for hook in cloud.session.session.hooks['response']:
+            hook(FakeResponse({}, content=b'{"servers": []}'))
+    assert timings.regions['a_RegionOne'] == dict(requests=1, bytes=15)
+
+
+def test_refresh_hosts_fails_on_config_errors(fetcher):
+    def get_clouds():
+        raise ValueError('OpenStack Inventory Config Error: only_clouds must'
+                         ' be a list')
+    fetcher._get_clouds = get_clouds
+    fetcher._cache = FakeCache()
+
+    with pytest.raises(ValueError):
+        fetcher._refresh_hosts('inv', None, {}, True, False)
+    assert fetcher._cache.written is None
+
+    # Errors of clouds are logged and an empty inventory is cached
+    fetcher._get_clouds = lambda: [
+        FakeCloud('a', [], error=RuntimeError('offline'))]
+    fetcher._config_data['fail_on_errors'] = True
+    assert fetcher._refresh_hosts('inv', None, {}, True, False) == []
+    assert fetcher._cache.written == dict(inv=[])
+
+
+def test_revalidate_starts_one_refresh(fetcher, monkeypatch):
+    commands = []
+    monkeypatch.setattr(
+        'ansible_collections.openstack.cloud.plugins.inventory.openstack.'
+        'subprocess.Popen', lambda command, **kwargs: commands.append(
+            (command, kwargs['env'][InventoryModule.REVALIDATE_ENV])))
+    fetcher._cache = {}
+    synced_at = time.time() - 3600
+
+    fetcher._revalidate('openstack.yml', 'inv', synced_at)
+    fetcher._revalidate('openstack.yml', 'inv', synced_at)
+
+    assert len(commands) == 1
+    assert commands[0][0][1:] == ['-i', 'openstack.yml', '--list']
+    assert commands[0][1] == '1'
+    assert fetcher._cache['inv_revalidating'] > synced_at
+
+
+def test_fetch_hosts_passes_server_filters(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    fetcher._config_data['server_filters'] = dict(
+        status='ACTIVE', tags=['web', 'prod'], projects=['p1', 'p2'])
+    cloud = FakeCloud('a', ['a1'])
+    fetcher._fetch_hosts([cloud], expand=False, fail_on_errors=True,
+                         all_projects=False)
+
+    query = dict(status='ACTIVE', tags='web,prod')
+    # Queries of projects run concurrently
+    assert sorted(cloud.queries, key=lambda q: q[1]['project_id']) == [
+        (True, dict(query, project_id='p1')),
+        (True, dict(query, project_id='p2'))]
+
+
+def test_list_servers_shards_by_project(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    fetcher._config_data['shard_by_project'] = True
+    cloud = FakeCloud('a', ['a1', 'a2'])
+    cloud.identity = FakeIdentity([dict(id='p1'), dict(id='p2')])
+
+    hosts = fetcher._list_servers(cloud, expand=False, all_projects=True)
+
+    assert sorted(cloud.queries, key=lambda q: q[1]['project_id']) == [
+        (True, dict(project_id='p1')), (True, dict(project_id='p2'))]
+    # FakeCloud returns every server for each project
+    assert [h['id'] for h in hosts] == ['a1', 'a2']
+
+
+def test_fetch_hosts_drops_changed_servers_not_matching_filters(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    fetcher._config_data['server_filters'] = dict(status='ACTIVE')
+    cloud = FakeCloud('a', ['a1', 'a2'])
+    cached_hosts, synced_at = fetcher._fetch_hosts(
+        [cloud], expand=False, fail_on_errors=True, all_projects=False)
+
+    cloud.changes = [('a1', 'SHUTOFF'), ('a3',)]
+    hosts, synced_at = fetcher._fetch_hosts(
+        [cloud], expand=False, fail_on_errors=True, all_projects=False,
+        cached_hosts=cached_hosts, synced_at=synced_at)
+
+    assert [h['id'] for h in hosts] == ['a2', 'a3']
+    # Changes are not filtered by status by Nova
+    assert sorted(cloud.filters) == ['changes-since']
+
+
+class FakeNova(requests.adapters.BaseAdapter):
+    # Answers requests of openstacksdk like Nova, so the plugin is tested
+    # with real connections and resources
+    def __init__(self, servers):
+        super(FakeNova, self).__init__()
+        self.servers = servers
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        if request.path_url.rstrip('/') == '/v2.1':
+            data = dict(version=dict(
+                id='v2.1', status='CURRENT', min_version='2.1',
+                version='2.79',
+                links=[dict(rel='self', href='http://nova/v2.1/')]))
+        else:
+            url = urlparse(request.url)
+            self.requests.append((url.path, dict(parse_qsl(url.query))))
+            data = dict(servers=self.servers)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(data).encode('utf-8')
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def make_connection(nova):
+    http = requests.Session()
+    http.mount('http://nova', nova)
+    return connection.Connection(
+        session=ksa_session.Session(auth=noauth.NoAuth(), session=http),
+        compute_endpoint_override='http://nova/v2.1',
+        region_name='RegionOne')
+
+
+def test_list_servers_queries_nova_with_openstacksdk(fetcher_without_expansion):
+    fetcher = fetcher_without_expansion
+    fetcher._config_data['server_filters'] = dict(
+        status='ACTIVE', tags_any=['web', 'db'], projects=['p1'])
+    nova = FakeNova([
+        dict(id='s1', name='s1', status='ACTIVE', tags=['web']),
+        dict(id='s2', name='s2', status='SHUTOFF', tags=['web'])])
+    cloud = make_connection(nova)
+
+    hosts = fetcher._list_servers(cloud, expand=False, all_projects=False)
+    changes = fetcher._list_servers(cloud, expand=False, all_projects=False,
+                                    since=time.time())
+
+    (listed_path, listed), (changed_path, changed) = nova.requests
+    assert listed_path == changed_path == '/v2.1/servers/detail'
+    assert listed == {'all_tenants': 'True', 'project_id': 'p1',
+                      'status': 'ACTIVE', 'tags-any': 'web,db'}
+    assert sorted(changed) == ['all_tenants', 'changes-since', 'project_id']
+    assert [h['id'] for h in hosts] == ['s1', 's2']
+    # The changed server which stopped matching is dropped from the cache
+    assert [(h['id'], h['status']) for h in changes] == [
+        ('s1', 'ACTIVE'), ('s2', 'DELETED')]
+
+
+def test_lean_and_full_hosts_get_interfaces_with_openstacksdk(fetcher):
+    nova = FakeNova([dict(
+        id='s1', name='s1', status='ACTIVE', tenant_id='p1', accessIPv4='',
+        accessIPv6='', flavor={}, image='', metadata={},
+        addresses=dict(private=[
+            {'addr': '10.0.0.5', 'version': 4, 'OS-EXT-IPS:type': 'fixed'},
+            {'addr': '172.24.4.5', 'version': 4,
+             'OS-EXT-IPS:type': 'floating'}]),
+        **{'OS-EXT-AZ:availability_zone': 'az1'})])
+    cloud = make_connection(nova)
+    interfaces = dict(public_v4='172.24.4.5', public_v6='',
+                      private_v4='10.0.0.5', interface_ip='172.24.4.5')
+
+    fetcher._config_data['fetch_mode'] = 'lean'
+    lean_host, = fetcher._list_servers(cloud, expand=False, all_projects=False)
+    assert dict((key, lean_host[key]) for key in interfaces) == interfaces
+    assert lean_host['az'] == 'az1'
+    assert lean_host['accessIPv4'] == ''
+
+    # Full hosts are openstacksdk resources, which only accept known fields
+    server, = cloud.compute.servers()
+    fetcher._add_server_interfaces(cloud, server)
+    assert dict((key, server[key]) for key in interfaces) == interfaces
+
+
+def test_server_filters_are_validated(fetcher):
+    fetcher._config_data['server_filters'] = dict(flavor='m1.small')
+    with pytest.raises(ValueError):
+        fetcher._get_server_filters()
+
+
+def test_server_hostvar_keeps_fields_and_shares_values(fetcher):
+    fetcher._hostvar_fields = [['id'], ['flavor', 'name'], ['image', 'name'],
+                               ['metadata']]
+    fetcher._interned = {}
+    servers = [dict(id='s%d' % i, status='ACTIVE',
+                    flavor=dict(id='f1', name='small'), image={},
+                    metadata=dict(group='web')) for i in range(2)]
+
+    hostvars = [fetcher._get_server_hostvar(s) for s in servers]
+
+    assert hostvars[0] == dict(id='s0', flavor=dict(name='small'),
+                               metadata=dict(group='web'))
+    # Missing fields are left out and identical flavors, images and
+    # security groups are shared
+    assert servers[0]['flavor'] is servers[1]['flavor']
+    assert hostvars[0]['metadata'] is not hostvars[1]['metadata']
+
+
+def test_populate_renames_hosts_with_duplicate_names(fetcher):
+    fetcher.inventory = InventoryData()
+    fetcher.templar = Templar(loader=None)
+    fetcher.get_option = dict(legacy_groups=True).get
+    fetcher.use_names = False
+
+    def server(id, name):
+        return dict(id=id, name=name, cloud='a', region='RegionOne',
+                    interface_ip='10.0.0.1', metadata={}, flavor={},
+                    image={})
+
+    # Servers are read once, as they come
+    fetcher._populate_from_source(iter([
+        server('1', 'web'), server('2', 'db'), server('3', 'web'),
+        server('3', 'web'), server('2', 'db')]))
+
+    assert sorted(fetcher.inventory.hosts) == ['1', '3', 'db']
+    assert [h.name for h in fetcher.inventory.groups['web'].hosts] == [
+        '1', '3']
+    assert [h.name for h in fetcher.inventory.groups['a'].hosts] == [
+        '1', 'db', '3']
+
+
+class FakeResponse(object):
+    status_code = 200
+
+    def __init__(self, data, content=None):
+        self.data = data
+        self.content = content
+
+    def json(self):
+        return self.data
+
+
+class FakeCompute(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, params=None, microversion=None):
+        self.requests.append((url, params))
+        return FakeResponse(self.pages[len(self.requests) - 1])
+
+
+def test_list_servers_lean_reads_pages(fetcher, monkeypatch):
+    monkeypatch.setattr(
+        'ansible_collections.openstack.cloud.plugins.inventory.openstack.'
+        'sdk_utils.maximum_supported_microversion', lambda adapter, v: v)
+    fetcher._config_data['fetch_mode'] = 'lean'
+    fetcher._add_server_interfaces = lambda cloud, server: server.update(
+        interface_ip='10.0.0.1')
+    cloud = FakeCloud('a', [])
+    cloud.compute = FakeCompute([
+        dict(servers=[dict(id='s1', tenant_id='p1')],
+             servers_links=[dict(rel='next', href='/servers/detail?m=s1')]),
+        dict(servers=[dict(id='s2', tenant_id='p1',
+                           **{'OS-EXT-AZ:availability_zone': 'az1'})])])
+
+    hosts = fetcher._list_servers(cloud, expand=True, all_projects=True)
+
+    assert cloud.compute.requests == [
+        ('/servers/detail', dict(all_tenants=True)),
+        ('/servers/detail?m=s1', None)]
+    assert hosts[1] == {'id': 's2', 'tenant_id': 'p1', 'cloud': 'a',
+                        'region': 'RegionOne', 'az': 'az1',
+                        'project_id': 'p1', 'interface_ip': '10.0.0.1',
+                        'OS-EXT-AZ:availability_zone': 'az1'}
+
+
+class FakeDetailsCloud(FakeCloud):
+    def __init__(self):
+        super(FakeDetailsCloud, self).__init__('a', [])
+        self.flavor_lookups = []
+
+    def has_service(self, service_type):
+        return True
+
+    def list_security_groups(self):
+        return [security_group.SecurityGroup(id='sg1', name='default'),
+                security_group.SecurityGroup(id='sg2', name='web')]
+
+    def list_flavors(self, get_extra=False):
+        return [dict(id='f1', name='small')]
+
+    def get_flavor_name(self, flavor_id):
+        self.flavor_lookups.append(flavor_id)
+        return 'private'
+
+    def list_images(self):
+        return [dict(id='i1', name='cirros')]
+
+    def list_volumes(self):
+        return [dict(id='v1', attachments=[dict(server_id='s1',
+                                                device='/dev/vdb')])]
+
+
+def test_add_server_details_joins_listed_resources(fetcher):
+    cloud = FakeDetailsCloud()
+    servers = [dict(id='s1', flavor=dict(id='f1'), image=dict(id='i1')),
+               dict(id='s2', flavor=dict(id='f2'), image=''),
+               dict(id='s3', flavor=dict(id='f2'), image='i1')]
+    ports = dict(s1=[dict(security_group_ids=['sg2', 'sg1']),
+                     dict(security_group_ids=['sg2'])])
+    fetcher._add_server_details(cloud, servers, ports)
+
+    assert [s['flavor'].get('name') for s in servers] == [
+        'small', 'private', 'private']
+    # Flavors which are not listed are looked up once
+    assert cloud.flavor_lookups == ['f2']
+    assert [s['image'] for s in servers] == [
+        dict(id='i1', name='cirros'), dict(id=''),
+        dict(id='i1', name='cirros')]
+    assert [g['id'] for g in servers[0]['security_groups']] == ['sg2', 'sg1']
+    assert servers[1]['security_groups'] == []
+    assert [v['device'] for v in servers[0]['volumes']] == ['/dev/vdb']
+    assert servers[2]['volumes'] == []
+
+
+def test_add_floating_addresses_from_ports(fetcher):
+    server = dict(id='s1', addresses=dict(private=[
+        {'addr': '10.0.0.5', 'version': 4, 'OS-EXT-IPS:type': 'fixed'}]))
+    ports = dict(s1=[dict(id='p1', mac_address='fa:16:3e:00:00:01')])
+    floating_ips = dict(p1=[dict(fixed_ip_address='10.0.0.5',
+                                 floating_ip_address='172.24.4.5')])
+    fetcher._add_floating_addresses(server, ports, floating_ips)
+
+    assert server['addresses']['private'][1] == {
+        'addr': '172.24.4.5', 'version': 4, 'OS-EXT-IPS:type': 'floating',
+        'OS-EXT-IPS-MAC:mac_addr': 'fa:16:3e:00:00:01'}
+
+
+def test_compact_cache_entry_round_trip(fetcher):
+    hosts = [dict(id='s%d' % i, name='server', status='ACTIVE',
+                  flavor=dict(id='f1', name='small'), metadata={},
+                  volumes=[], power_state=i % 2, locked=False,
+                  tags=None) for i in range(3)]
+    fetcher._config_data = dict(cache_format='compact')
+    entry = fetcher._make_cache_entry(hosts, dict(fake_RegionOne=1.0), True)
+
+    assert entry['format'] == CompactHosts.FORMAT
+    cached, synced_at = fetcher._read_cache_entry(entry)
+    assert synced_at == dict(fake_RegionOne=1.0)
+    assert len(cached) == 3
+    assert list(cached) == hosts
+    assert cached[1] == hosts[1]
+    # Identical values are stored once and shared between hosts
+    assert cached[0]['flavor'] is cached[2]['flavor']
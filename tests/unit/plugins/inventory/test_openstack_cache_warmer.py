@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+import importlib.util
+import json
+import os
+
+import pytest
+
+from ansible.errors import AnsibleError
+from ansible_collections.openstack.cloud.plugins.inventory.openstack import InventoryModule
+
+WARMER_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', '..',
+                           'scripts', 'inventory', 'openstack_cache_warmer.py')
+
+
+class FakeCloudConfig(object):
+    def get_region_name(self, service_type):
+        return 'RegionOne'
+
+
+class FakeCloud(object):
+    def __init__(self, name, servers, error=None):
+        self.name = name
+        self.config = FakeCloudConfig()
+        self.servers = servers
+        self.error = error
+
+    def list_servers(self, detailed=False, all_projects=False, bare=False):
+        if self.error:
+            raise self.error
+        return [dict(id=s, name=s, status='ACTIVE', cloud=self.name,
+                     region='RegionOne', interface_ip='10.0.0.1',
+                     flavor={}, image={}) for s in self.servers]
+
+
+@pytest.fixture
+def warmer(monkeypatch):
+    spec = importlib.util.spec_from_file_location('openstack_cache_warmer',
+                                                  WARMER_PATH)
+    warmer = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(warmer)
+    # warm_cache() sets it for the process
+    monkeypatch.setenv(InventoryModule.REVALIDATE_ENV, '')
+    return warmer
+
+
+def load_plugin(warmer, clouds):
+    plugin = warmer.inventory_loader.get(warmer.PLUGIN)
+    plugin._get_clouds = lambda: clouds
+    plugin._expand_servers = lambda cloud, servers, expand: servers
+    return plugin
+
+
+def write_config(tmp_path, **config):
+    path = tmp_path / 'openstack.yml'
+    path.write_text(json.dumps(dict(config, plugin='openstack.cloud.openstack',
+                                    cache_plugin='jsonfile',
+                                    cache_connection=str(tmp_path / 'cache'))))
+    return str(path)
+
+
+def test_warm_cache_writes_hosts(warmer, monkeypatch, tmp_path):
+    plugin = load_plugin(warmer, [FakeCloud('a', ['a1', 'a2'])])
+    monkeypatch.setattr(warmer, 'load_plugin', lambda: plugin)
+    path = write_config(tmp_path, cache=True)
+
+    assert warmer.warm_cache(path) == 2
+
+    cache_files = [name for name in os.listdir(str(tmp_path / 'cache'))
+                   if not name.startswith('.')]
+    assert len(cache_files) == 1
+    assert cache_files[0].startswith('ansible_inventory_')
+    with open(str(tmp_path / 'cache' / cache_files[0])) as f:
+        assert [host['id'] for host in json.load(f)] == ['a1', 'a2']
+
+
+def test_warm_cache_rejects_configs_without_cache(warmer, monkeypatch,
+                                                  tmp_path):
+    cloud = FakeCloud('a', ['a1'], error=AssertionError('fetched'))
+    plugin = load_plugin(warmer, [cloud])
+    monkeypatch.setattr(warmer, 'load_plugin', lambda: plugin)
+    path = write_config(tmp_path, cache=False)
+
+    with pytest.raises(AnsibleError, match='cache is not enabled'):
+        warmer.warm_cache(path)
+    assert not os.path.exists(str(tmp_path / 'cache'))
@@ -0,0 +1,594 @@
+# -*- coding: utf-8 -*-
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from keystoneauth1 import access
+from keystoneauth1.identity import v3
+
+from ansible_collections.openstack.cloud.plugins.module_utils.openstack import (
+    ApiMetrics,
+    DiscoveryCache,
+    LookupCache,
+    OpenStackModule,
+    RequestThrottle,
+    TokenBucket,
+    TokenCache,
+    cache_file_path,
+    openstack_full_argument_spec,
+)
+
+
+def test_full_argument_spec_filters_custom_parameters():
+    properties = dict(type='dict', min_ver='0.45.1')
+    name = dict(required=True)
+    spec = openstack_full_argument_spec(properties=properties, name=name)
+    assert spec['properties'] == dict(type='dict')
+    assert spec['name'] is name
+    # Argument specs of modules must not be modified
+    assert properties == dict(type='dict', min_ver='0.45.1')
+    assert 'cloud' in spec
+
+
+class FakeConfig(object):
+    config = {
+        'auth_type': 'password',
+        'auth': {
+            'auth_url': 'https://identity.example.com/v3',
+            'username': 'demo',
+            'password': 'secret',
+            'project_name': 'demo',
+        },
+    }
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.auth = v3.Password(**FakeConfig.config['auth'])
+
+
+class FakeConnection(object):
+    """Connection whose authorize() issues tokens valid for `lifetime`."""
+
+    def __init__(self, lifetime=3600):
+        self.config = FakeConfig()
+        self.session = FakeSession()
+        self.lifetime = lifetime
+        self.authorizations = 0
+
+    def authorize(self):
+        self.authorizations += 1
+        expires = (datetime.datetime.utcnow()
+                   + datetime.timedelta(seconds=self.lifetime))
+        body = {'token': {
+            'methods': ['password'],
+            'expires_at': expires.strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+            'user': {'id': 'u1', 'name': 'demo'},
+            'project': {'id': 'p1', 'name': 'demo'},
+            'catalog': [],
+        }}
+        self.session.auth.auth_ref = access.create(
+            body=body, auth_token='token-%d' % self.authorizations)
+        return self.session.auth.auth_ref.auth_token
+
+
+@pytest.fixture
+def params(tmp_path):
+    return dict(cache_path=str(tmp_path), wait=True, timeout=180)
+
+
+def test_token_cache_reuses_token(params):
+    first = FakeConnection()
+    cache = TokenCache.from_connection(first, params)
+    cache.load()
+    assert first.authorizations == 1
+    assert oct(os.stat(cache.path).st_mode & 0o777) == oct(0o600)
+
+    second = FakeConnection()
+    TokenCache.from_connection(second, params).load()
+    assert second.authorizations == 0
+    assert second.session.auth.auth_ref.auth_token == 'token-1'
+
+
+def test_cache_file_path_does_not_reveal_credentials(params, tmp_path):
+    key = FakeConfig.config
+    path = cache_file_path(params, 'token', key)
+    assert path == cache_file_path(params, 'token', key)
+    assert oct(os.stat(str(tmp_path / '.secret')).st_mode & 0o777) == oct(0o600)
+
+    # Names are not the plain hash of the key and differ between users
+    plain = hashlib.sha256(
+        json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+    assert plain not in path
+    (tmp_path / 'other').mkdir()
+    other = dict(params, cache_path=str(tmp_path / 'other'))
+    assert (os.path.basename(cache_file_path(other, 'token', key))
+            != os.path.basename(path))
+
+
+def test_token_cache_refreshes_tokens_expiring_during_wait(params):
+    # Valid for longer than the safety margin but not for the whole timeout
+    first = FakeConnection(lifetime=400)
+    TokenCache.from_connection(first, params).load()
+
+    second = FakeConnection()
+    TokenCache.from_connection(second, params).load()
+    assert second.authorizations == 1
+
+    params['wait'] = False
+    third = FakeConnection()
+    TokenCache.from_connection(third, params).load()
+    assert third.authorizations == 0
+
+
+def test_token_cache_saves_renewed_token(params):
+    first = FakeConnection()
+    cache = TokenCache.from_connection(first, params)
+    cache.load()
+    first.authorize()
+    cache.save()
+
+    second = FakeConnection()
+    TokenCache.from_connection(second, params).load()
+    assert second.session.auth.auth_ref.auth_token == 'token-2'
+
+
+def test_token_cache_ignores_corrupted_file(params):
+    cache = TokenCache.from_connection(FakeConnection(), params)
+    with open(cache.path, 'w') as f:
+        f.write('{"garbage": ')
+    cache.load()
+    assert cache.conn.authorizations == 1
+
+
+class FakeDiscoveryConnection(object):
+    """Connection which counts discovery requests."""
+
+    class FakeConfig(object):
+        config = dict(auth=dict(auth_url='https://identity.example.com/v3'))
+
+        def get_region_name(self, service_type=None):
+            return 'RegionOne'
+
+        def get_interface(self, service_type=None):
+            return 'public'
+
+    class FakeNetwork(object):
+        def __init__(self, conn):
+            self.conn = conn
+
+        def extensions(self):
+            self.conn.requests += 1
+            return [FakeExtension('dns-integration'), FakeExtension('qos')]
+
+    class FakeSession(object):
+        def __init__(self, conn):
+            self.conn = conn
+            self._discovery_cache = {}
+
+        def get_all_version_data(self, interface, region_name, service_type):
+            self.conn.requests += 1
+            return {region_name: {interface: {service_type: [
+                dict(version='2.0', status='SUPPORTED'),
+                dict(version='2.12', status='CURRENT', max_microversion=None),
+            ]}}}
+
+    def __init__(self):
+        self.requests = 0
+        self.config = self.FakeConfig()
+        self.network = self.FakeNetwork(self)
+        self.session = self.FakeSession(self)
+
+    def has_service(self, service_type):
+        self.requests += 1
+        return service_type == 'dns'
+
+
+class FakeExtension(object):
+    def __init__(self, alias):
+        self.alias = alias
+
+
+def test_discovery_cache_memoizes_lookups():
+    conn = FakeDiscoveryConnection()
+    discovery = DiscoveryCache.from_connection(conn, {})
+    for i in range(3):
+        assert discovery.has_service('dns')
+        assert not discovery.has_service('load-balancer')
+        assert discovery.has_network_extension('dns-integration')
+        assert not discovery.has_network_extension('trunk')
+        assert discovery.get_max_microversion('load-balancer') == '2.12'
+    assert conn.requests == 4
+    # No ttl, nothing is stored on disk
+    assert discovery.path is None
+
+
+def test_discovery_cache_is_shared_between_runs(params):
+    params['discovery_cache_ttl'] = 60
+    conn = FakeDiscoveryConnection()
+    discovery = DiscoveryCache.from_connection(conn, params)
+    discovery.load()
+    discovery.has_network_extension('qos')
+    discovery.get_versions('compute')
+    conn.session._discovery_cache['https://compute.example.com/'] = \
+        FakeDocument([dict(id='v2.1', status='CURRENT')])
+    discovery.save()
+
+    conn = FakeDiscoveryConnection()
+    discovery = DiscoveryCache.from_connection(conn, params)
+    discovery.load()
+    assert discovery.has_network_extension('qos')
+    assert discovery.get_versions('compute')
+    assert conn.requests == 0
+    document = conn.session._discovery_cache['https://compute.example.com/']
+    assert document.raw_version_data() == [dict(id='v2.1', status='CURRENT')]
+
+    # Expired results are discovered again
+    discovery.data['timestamp'] -= 120
+    discovery.changed = True
+    discovery.save()
+    conn = FakeDiscoveryConnection()
+    discovery = DiscoveryCache.from_connection(conn, params)
+    discovery.load()
+    discovery.has_network_extension('qos')
+    assert conn.requests == 1
+
+
+class FakeDocument(object):
+    def __init__(self, data):
+        self._data = data
+
+
+class FakeSDK(object):
+    class exceptions:
+        class OpenStackCloudException(Exception):
+            def __init__(self, message, extra_data=None):
+                super().__init__(message)
+                self.extra_data = extra_data
+
+        class ResourceNotFound(OpenStackCloudException):
+            pass
+
+
+class ModuleFailed(Exception):
+    pass
+
+
+def make_module(max_concurrency=1, timeout=180):
+    def fail_json(**kwargs):
+        raise ModuleFailed(kwargs)
+
+    module = OpenStackModule.__new__(OpenStackModule)
+    module.params = dict(max_concurrency=max_concurrency, timeout=timeout)
+    module.sdk = FakeSDK()
+    module.waits = []
+    module.debug = lambda msg: None
+    module.fail_json = fail_json
+    return module
+
+
+def test_map_concurrently_bounds_threads_and_keeps_order():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        # Later items finish first
+        time.sleep(0.01 * (10 - item))
+        with lock:
+            running.remove(item)
+        return item * 2
+
+    results = make_module(3).map_concurrently(call, range(10))
+    assert results == [i * 2 for i in range(10)]
+    assert max(peak) == 3
+
+
+def test_map_concurrently_aggregates_errors():
+    def call(item):
+        if item % 2:
+            raise ValueError('odd %d' % item)
+        return item
+
+    module = make_module(4)
+    with pytest.raises(FakeSDK.exceptions.OpenStackCloudException) as e:
+        module.map_concurrently(call, range(5))
+    assert str(e.value) == '2 of 5 calls failed: odd 1; odd 3'
+    assert [d['item'] for d in e.value.extra_data] == ['1', '3']
+
+    with pytest.raises(ValueError):
+        module.map_concurrently(call, [0, 1, 2])
+
+    results = module.map_concurrently(call, range(3), return_exceptions=True)
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], ValueError)
+
+
+class FakeResource(object):
+    def __init__(self, provisioning_status):
+        self.provisioning_status = provisioning_status
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def fetcher(*states):
+    states = list(states)
+
+    def fetch():
+        state = states.pop(0) if len(states) > 1 else states[0]
+        if state is None:
+            raise FakeSDK.exceptions.ResourceNotFound('gone')
+        return FakeResource(state)
+    return fetch
+
+
+def test_wait_for_status_backs_off(sleeps):
+    module = make_module()
+    resource = module.wait_for_status(
+        fetcher(*(['PENDING_CREATE'] * 7 + ['ACTIVE'])), ['ACTIVE'],
+        ['ERROR'], status='provisioning_status', name='lb')
+    assert resource.provisioning_status == 'ACTIVE'
+    assert len(sleeps) == 7
+    # Jittered between half and full delay, doubling up to max_interval
+    for delay, sleep in zip([1, 2, 4, 8, 15, 15, 15], sleeps):
+        assert delay / 2.0 <= sleep <= delay
+    wait = module.waits[0]
+    assert wait['name'] == 'lb' and wait['state'] == 'ACTIVE'
+    assert list(wait['states']) == ['PENDING_CREATE']
+    assert wait['sleep'] == pytest.approx(sum(sleeps))
+
+
+def test_wait_for_status_failures(sleeps):
+    module = make_module()
+    with pytest.raises(ModuleFailed) as e:
+        module.wait_for_status(fetcher('PENDING_CREATE', 'ERROR'),
+                               ['ACTIVE'], ['ERROR'],
+                               status='provisioning_status', name='lb')
+    assert e.value.args[0]['msg'] == 'lb transitioned to failure state ERROR'
+
+    with pytest.raises(ModuleFailed) as e:
+        module.wait_for_status(fetcher('PENDING_DELETE', None), ['ACTIVE'],
+                               status='provisioning_status', name='lb')
+    assert e.value.args[0]['msg'] == 'lb transitioned to failure state DELETED'
+
+    assert module.wait_for_status(fetcher('PENDING_DELETE', None),
+                                  ['DELETED'],
+                                  status='provisioning_status') is None
+
+
+def test_wait_for_status_deadline(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+
+    def sleep(delay):
+        clock[0] += delay
+    monkeypatch.setattr(time, 'sleep', sleep)
+
+    module = make_module(timeout=20)
+    with pytest.raises(ModuleFailed) as e:
+        module.wait_for_status(fetcher('PENDING_UPDATE'), ['ACTIVE'],
+                               status='provisioning_status', name='lb')
+    assert e.value.args[0]['msg'] == 'Timeout waiting for lb to transition to ACTIVE'
+    # The last sleep is shortened to the deadline
+    assert clock[0] == 20
+
+
+class FakeResponse(object):
+    def __init__(self, body, content):
+        self.request = FakePreparedRequest(body)
+        self.headers = {}
+        self.content = content
+
+
+class FakePreparedRequest(object):
+    def __init__(self, body):
+        self.body = body
+
+
+class FakeHttpError(Exception):
+    def __init__(self, response):
+        super().__init__('Not Found')
+        self.response = response
+
+
+class FakeRequestSession(object):
+    def request(self, url, method, **kwargs):
+        if url.endswith('missing'):
+            raise FakeHttpError(FakeResponse(None, b'{}'))
+        return FakeResponse(b'{"a": 1}' if method == 'POST' else None,
+                            b'{"servers": []}')
+
+
+def test_api_metrics_groups_requests_by_url_template():
+    session = FakeRequestSession()
+    metrics = ApiMetrics()
+    metrics.install(session)
+    compute = dict(endpoint_filter=dict(service_type='compute'))
+    session.request('/servers/1f0c8a2e-6bfa-4a47-9c45-2a3c5fa4a1b4', 'GET',
+                    **compute)
+    session.request('/servers/7b1e5c3a9d2f4e6b8a0c1d2e3f4a5b6c', 'GET',
+                    **compute)
+    session.request('/servers', 'POST', **compute)
+    session.request('https://identity.example.com/v3/auth/tokens', 'post')
+    with pytest.raises(FakeHttpError):
+        session.request('/os-aggregates/42/missing', 'get', **compute)
+
+    summary = metrics.summary([dict(sleep=1.5), dict(sleep=2)])
+    assert summary['requests'] == 5
+    assert summary['bytes_sent'] == 8
+    assert summary['bytes_received'] == 4 * 15 + 2
+    assert summary['wait_sleep'] == 3.5
+    assert set(summary['latency']) == set(['p50', 'p95', 'max'])
+    calls = dict(((c['service'], c['method'], c['url']), c['count'])
+                 for c in summary['calls'])
+    assert calls == {
+        ('compute', 'GET', '/servers/{id}'): 2,
+        ('compute', 'POST', '/servers'): 1,
+        ('identity.example.com', 'POST', '/v3/auth/tokens'): 1,
+        ('compute', 'GET', '/os-aggregates/{id}/missing'): 1,
+    }
+
+
+class FakeStatusResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeThrottledSession(object):
+    def __init__(self, *status_codes):
+        self.responses = [FakeStatusResponse(*s) if isinstance(s, tuple)
+                          else FakeStatusResponse(s) for s in status_codes]
+        self.calls = 0
+        self.bodies = []
+
+    def request(self, url, method, **kwargs):
+        self.calls += 1
+        data = kwargs.get('data')
+        if data is not None:
+            self.bodies.append(b''.join(data) if not hasattr(data, 'read')
+                               else data.read())
+        response = self.responses.pop(0)
+        if response.status_code >= 400 and kwargs.get('raise_exc', True):
+            raise FakeHttpError(response)
+        return response
+
+
+def test_request_throttle_retries(sleeps):
+    session = FakeThrottledSession((429, {'Retry-After': '7'}), 503, 200)
+    throttle = RequestThrottle(retries=3)
+    throttle.install(session)
+    assert session.request('/servers', 'GET').status_code == 200
+    assert sleeps[0] == 7
+    assert 1 <= sleeps[1] <= 2
+    assert throttle.sleep == pytest.approx(sum(sleeps))
+
+    # POST requests are only retried if they were rejected with 429
+    session = FakeThrottledSession(429, 503, 200)
+    RequestThrottle(retries=3).install(session)
+    with pytest.raises(FakeHttpError):
+        session.request('/servers', 'POST')
+    assert session.calls == 2
+
+    # Responses are retried as well if raise_exc is disabled
+    session = FakeThrottledSession(503, 503, 503)
+    RequestThrottle(retries=2).install(session)
+    assert session.request('/servers', 'GET',
+                           raise_exc=False).status_code == 503
+    assert session.calls == 3
+
+
+def test_request_throttle_rewinds_streamed_bodies(sleeps):
+    session = FakeThrottledSession(503, 200)
+    RequestThrottle(retries=3).install(session)
+    data = io.BytesIO(b'header image')
+    data.seek(7)
+    assert session.request('/images/1/file', 'PUT',
+                           data=data).status_code == 200
+    assert session.bodies == [b'image', b'image']
+
+    # Bodies which cannot be rewound are sent once
+    session = FakeThrottledSession(503, 200)
+    RequestThrottle(retries=3).install(session)
+    with pytest.raises(FakeHttpError):
+        session.request('/images/1/file', 'PUT',
+                        data=(chunk for chunk in [b'image']))
+    assert session.bodies == [b'image']
+
+
+def test_token_bucket_limits_rate(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+
+    def sleep(delay):
+        clock[0] += delay
+    monkeypatch.setattr(time, 'sleep', sleep)
+
+    path = str(tmp_path / 'bucket.json')
+    # Two processes share the budget through the file
+    first, second = TokenBucket(path, 2.0), TokenBucket(path, 2.0)
+    assert first.acquire() == 0
+    assert second.acquire() == 0
+    assert first.acquire() == pytest.approx(0.5)
+    assert second.acquire() == pytest.approx(0.5)
+    assert clock[0] == pytest.approx(1001.0)
+
+
+class FakeVolumeCloud(object):
+    def __init__(self):
+        self.session = FakeRequestSession()
+        self.volumes = {'db': dict(name='db', size=1)}
+        self.calls = 0
+
+    def get_volume(self, name_or_id, filters=None):
+        self.calls += 1
+        self.session.request('/v3/7b1e5c3a9d2f4e6b8a0c1d2e3f4a5b6c/volumes',
+                             'GET', **self.block_storage)
+        return self.volumes.get(name_or_id)
+
+    def extend_volume(self, name_or_id, size):
+        self.session.request(
+            '/v3/7b1e5c3a9d2f4e6b8a0c1d2e3f4a5b6c/volumes/'
+            '1f0c8a2e-6bfa-4a47-9c45-2a3c5fa4a1b4/action', 'POST',
+            **self.block_storage)
+        self.volumes[name_or_id] = dict(self.volumes[name_or_id], size=size)
+
+    block_storage = dict(endpoint_filter=dict(service_type='block-storage'))
+
+
+def test_lookup_cache_memoizes_until_resource_type_changes():
+    cloud = FakeVolumeCloud()
+    lookups = LookupCache()
+    lookups.install(cloud.session)
+
+    volume = lookups.call(cloud.get_volume, 'db')
+    assert lookups.call(cloud.get_volume, 'db') is volume
+    assert lookups.call(cloud.get_volume, 'missing') is None
+    assert lookups.call(cloud.get_volume, 'missing') is None
+    assert lookups.call(cloud.get_volume, 'db', filters={'a': [1]}) == volume
+    assert cloud.calls == 3
+    assert lookups.hits == 2
+
+    # Writes to other resource types keep the results
+    cloud.session.request('/v3/7b1e5c3a9d2f4e6b8a0c1d2e3f4a5b6c/snapshots',
+                          'POST', **cloud.block_storage)
+    cloud.session.request('/servers', 'POST',
+                          endpoint_filter=dict(service_type='compute'))
+    assert lookups.call(cloud.get_volume, 'db') is volume
+    assert cloud.calls == 3
+
+    cloud.extend_volume('db', 2)
+    assert lookups.call(cloud.get_volume, 'db')['size'] == 2
+    assert cloud.calls == 4
+
+
+def test_lookup_cache_skips_results_of_concurrent_writes():
+    cloud = FakeVolumeCloud()
+    lookups = LookupCache()
+    lookups.install(cloud.session)
+
+    def get_volume_while_extending(name_or_id):
+        volume = cloud.get_volume(name_or_id)
+        cloud.extend_volume(name_or_id, 3)
+        return volume
+
+    assert lookups.call(get_volume_while_extending, 'db')['size'] == 1
+    assert lookups.call(get_volume_while_extending, 'db')['size'] == 3
+    assert cloud.calls == 2